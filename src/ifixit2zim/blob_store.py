@@ -0,0 +1,93 @@
+import functools
+import hashlib
+import os
+import pathlib
+import shutil
+import threading
+from collections.abc import Callable
+
+from ifixit2zim.shared import logger
+
+
+def check_removable_store(path: pathlib.Path, markers: list[str]):
+    """raise unless path is missing, empty or a store holding one of its markers
+
+    Guards removal of a store directory passed by user against any other data"""
+    if not path.is_dir() or not any(path.iterdir()):
+        return
+    if not any((path / marker).exists() for marker in markers):
+        raise ValueError(
+            f"Refusing to remove {path}: directory is not empty and is not a store "
+            f"(none of {', '.join(markers)} found)"
+        )
+
+
+def link_or_copy(src: pathlib.Path, dst: pathlib.Path):
+    """hardlink src to dst, copying it when on another filesystem"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class BlobStore:
+    """Local content-addressed store of ZIM entries content
+
+    Blobs are named after the sha256 hex digest of their content and written
+    atomically, so that a blob present in the store is always complete."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+
+    def get_path(self, digest: str) -> pathlib.Path:
+        return self.path / digest[:2] / digest
+
+    def store(self, content: bytes | str) -> str:
+        """store content if not already present, returning its digest"""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return self.store_as(
+            hashlib.sha256(content).hexdigest(),
+            lambda fpath: fpath.write_bytes(content),
+        )
+
+    def store_as(self, digest: str, save: Callable[[pathlib.Path], None]) -> str:
+        """store blob of known digest if not already present, written by save"""
+        fpath = self.get_path(digest)
+        if not fpath.exists():
+            fpath.parent.mkdir(parents=True, exist_ok=True)
+            tmp_fpath = fpath.with_suffix(f".{threading.get_ident()}.tmp")
+            save(tmp_fpath)
+            tmp_fpath.rename(fpath)
+        return digest
+
+    def store_entry(self, kwargs: dict, digest: str | None = None) -> str:
+        """store content of a creator.add_item_for call (content or fpath)
+
+        Content is only hashed when its digest is not known already. Files are
+        hardlinked into the store, their content being left unchanged once
+        handed to the creator"""
+        if kwargs.get("fpath"):
+            fpath = pathlib.Path(kwargs["fpath"])
+            if digest is None:
+                # files are not read in memory at once, they might be large
+                with open(fpath, "rb") as fh:
+                    digest = hashlib.file_digest(fh, "sha256").hexdigest()
+            return self.store_as(digest, functools.partial(link_or_copy, fpath))
+        if digest is None:
+            return self.store(kwargs["content"])
+        content = kwargs["content"]
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return self.store_as(digest, lambda fpath: fpath.write_bytes(content))
+
+    def prune(self, digests: set[str]):
+        """remove all blobs but the ones in digests"""
+        if not self.path.exists():
+            return
+        nb_removed = 0
+        for fpath in self.path.glob("*/*"):
+            if fpath.name not in digests:
+                fpath.unlink()
+                nb_removed += 1
+        logger.debug(f"Removed {nb_removed} unused blobs from {self.path}")
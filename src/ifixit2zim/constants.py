@@ -15,6 +15,30 @@ UNKNOWN_TITLE = "unknown_title"
 SCRAPER = f"{NAME} {__version__}"
 
 IMAGES_ENCODER_VERSION = 1
+
+# WebP settings of images encoder profiles, from fastest to smallest output.
+# max-compression converts images to WebP before optimizing them, as encoder
+# version 1 did, so that images already cached with it stay valid
+ENCODER_PROFILE_FAST = "fast"
+ENCODER_PROFILE_BALANCED = "balanced"
+ENCODER_PROFILE_MAX_COMPRESSION = "max-compression"
+ENCODER_PROFILES = {
+    ENCODER_PROFILE_FAST: {"quality": 60, "method": 2},
+    ENCODER_PROFILE_BALANCED: {"quality": 60, "method": 4},
+    ENCODER_PROFILE_MAX_COMPRESSION: {"quality": 60, "method": 6, "reencode": True},
+}
+DEFAULT_ENCODER_PROFILE = ENCODER_PROFILE_MAX_COMPRESSION
+
+# share of time budget kept to await in-flight items and images and finish the ZIM,
+# images not processed yet by then being left out
+TIME_BUDGET_FINISH_RATIO = 0.1
+
+# run phases: scraping into a content store and assembling it into a ZIM, or both
+PHASE_ALL = "all"
+PHASE_SCRAPE = "scrape"
+PHASE_ASSEMBLE = "assemble"
+PHASES = [PHASE_ALL, PHASE_SCRAPE, PHASE_ASSEMBLE]
+
 URLS = {
     "en": "https://www.ifixit.com",
     "fr": "https://fr.ifixit.com",
@@ -30,6 +54,19 @@ URLS = {
     "it": "https://it.ifixit.com",
 }
 
+# size variants of iFixit CDN images, smallest first: an image is fetched once as
+# the largest variant referenced, smaller ones being redirected to it
+IMAGE_VARIANTS = [
+    "mini",
+    "thumbnail",
+    "140x105",
+    "200x150",
+    "standard",
+    "medium",
+    "large",
+    "huge",
+]
+
 DEFAULT_GUIDE_IMAGE_URL = (
     "https://assets.cdn.ifixit.com/static/images/"
     "default_images/GuideNoImage_300x225.jpg"
@@ -814,6 +851,23 @@ UNAVAILABLE_OFFLINE = [
 
 API_PREFIX = "/api/2.0"
 
+# default share of the pipeline given to each kind of item when several have work
+SCHEDULER_WEIGHTS = {
+    "home": 1,
+    "category": 2,
+    "guide": 4,
+    "info": 1,
+    "user": 1,
+}
+
+# share of dispatch given to expected items (from listings or selection) and to
+# items discovered through links, within each kind of item, once any is set with
+# --priority-weight ; expected items are all dispatched first otherwise
+PRIORITY_WEIGHTS = {
+    "expected": 1,
+    "discovered": 1,
+}
+
 UNAVAILABLE_OFFLINE_INFOS = ["toolkits"]
 
 
@@ -860,6 +914,31 @@ class Configuration:
     # performances
     s3_url_with_credentials: str | None
     request_timeout: float
+    item_timeout: float
+    item_retries: int
+    time_budget: float | None
+    fetch_workers: int
+    render_workers: int
+    render_processes: int
+    image_processes: int
+    encoder_profile: str
+    worker_processes: int
+    pipeline_queue_size: int
+    scheduler_weight: list[str]
+    scheduler_weights: dict[str, int]
+    priority_weight: list[str]
+    priority_weights: dict[str, int] | None
+    item_costs_filename: str | None
+    journal_dir: str | None
+    resume: bool
+    manifest_dir: str | None
+    image_cache_dir: str | None
+    image_cache_size: int
+    s3_upload_workers: int
+    s3_upload_spool_size: int
+    incremental: bool
+    phase: str
+    content_store_dir: str | None
 
     # error handling
     max_missing_items_percent: int
@@ -869,6 +948,9 @@ class Configuration:
     build_dir_is_tmp_dir: bool
     keep_build_dir: bool
     scrape_only_first_items: bool
+    sample_fraction: float | None
+    sample_seed: int
+    sample_max_depth: int
     debug: bool
     delay: float
     api_delay: float
@@ -881,6 +963,66 @@ class Configuration:
             self.__setattr__(key, value)
         self.main_url = Configuration.get_url(self.lang_code)
         self.language = get_language_details(self.lang_code)
+
+        self.item_costs_path = None
+        if self.item_costs_filename:
+            self.item_costs_path = pathlib.Path(self.item_costs_filename).expanduser()
+
+        self.journal_path = None
+        if self.journal_dir:
+            self.journal_path = pathlib.Path(self.journal_dir).expanduser().resolve()
+        if self.resume and not self.journal_path:
+            raise ValueError("Resuming requires a journal directory")
+
+        self.manifest_path = None
+        if self.manifest_dir:
+            self.manifest_path = pathlib.Path(self.manifest_dir).expanduser().resolve()
+        if self.incremental and not self.manifest_path:
+            raise ValueError("Incremental mode requires a manifest directory")
+        self.image_cache_path = None
+        if self.image_cache_dir:
+            self.image_cache_path = (
+                pathlib.Path(self.image_cache_dir).expanduser().resolve()
+            )
+
+        self.content_store_path = None
+        if self.content_store_dir:
+            self.content_store_path = (
+                pathlib.Path(self.content_store_dir).expanduser().resolve()
+            )
+        if self.phase != PHASE_ALL and not self.content_store_path:
+            raise ValueError(f"{self.phase.title()} phase requires a content store")
+        # worker processes start their own image processes, if any
+        if self.worker_processes and (
+            self.render_processes or self.journal_path or self.manifest_path
+        ):
+            raise ValueError(
+                "Worker processes can't be combined with render processes, journal "
+                "or manifest"
+            )
+
+        if self.sample_fraction is not None and not 0 < self.sample_fraction <= 1:
+            raise ValueError("Sample fraction must be in ]0, 1]")
+        if self.sample_fraction and self.scrape_only_first_items:
+            raise ValueError("Sampling can't be combined with only first items")
+
+        # support semi-colon separated tags as well
+        if self.tag:
+            for tag in self.tag.copy():
+                if ";" in tag:
+                    self.tag += [p.strip() for p in tag.split(";")]
+                    self.tag.remove(tag)
+
+        self.scheduler_weights = Configuration.parse_weights(
+            self.scheduler_weight, SCHEDULER_WEIGHTS
+        )
+        self.priority_weights = (
+            Configuration.parse_weights(self.priority_weight, PRIORITY_WEIGHTS)
+            if self.priority_weight
+            else None
+        )
+
+        # directories are only created once options are known to be valid
         self.output_path = pathlib.Path(self._output_name).expanduser().resolve()
         self.output_path.mkdir(parents=True, exist_ok=True)
 
@@ -898,12 +1040,18 @@ class Configuration:
             self.stats_path = pathlib.Path(self.stats_filename).expanduser()
             self.stats_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # support semi-colon separated tags as well
-        if self.tag:
-            for tag in self.tag.copy():
-                if ";" in tag:
-                    self.tag += [p.strip() for p in tag.split(";")]
-                    self.tag.remove(tag)
+    @staticmethod
+    def parse_weights(values: list[str], defaults: dict[str, int]) -> dict[str, int]:
+        """defaults weights updated with `name=weight` values"""
+        weights = dict(defaults)
+        for value in values:
+            name, _, weight = value.partition("=")
+            if name.strip() not in defaults or not weight.strip().isdigit():
+                raise ValueError(f"Invalid weight: {value}")
+            if int(weight) < 1:
+                raise ValueError(f"Weight must be positive: {value}")
+            weights[name.strip()] = int(weight)
+        return weights
 
     @staticmethod
     def get_url(lang_code: str) -> urllib.parse.ParseResult:
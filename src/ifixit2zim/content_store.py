@@ -0,0 +1,124 @@
+import json
+import pathlib
+import shutil
+
+from zimscraperlib.zim.creator import Creator
+
+from ifixit2zim.blob_store import BlobStore, check_removable_store
+from ifixit2zim.exceptions import FinalScrapingFailureError
+from ifixit2zim.shared import logger
+from ifixit2zim.work_queue import SqliteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    title TEXT,
+    mimetype TEXT,
+    is_front INTEGER,
+    blob TEXT,
+    target_path TEXT
+);
+"""
+
+
+class ContentStore(SqliteStore):
+    """ZIM entries written by worker processes, to be added to ZIM by assembler
+
+    Stands for the Creator in worker processes (same add_item_for and add_redirect
+    API): entries content goes to a blobs store and entries are listed in order
+    in a sqlite database shared by all processes.
+
+    Also output of the scrape phase, assembled into a ZIM by a later run: the
+    store is complete once online metadata has been saved along entries."""
+
+    schema = SCHEMA
+
+    def __init__(self, path: pathlib.Path):
+        super().__init__(path / "entries.sqlite")
+        self.path = path
+        self.metadata_path = path / "metadata.json"
+        self.blobs = BlobStore(path / "blobs")
+        self.last_fed_id = 0
+        # digest of images already added to ZIM => their path
+        self.images_paths = {}
+        self.nb_fed = 0
+        # entries which could not be added to ZIM, only logged so that others are
+        self.nb_failed = 0
+
+    def clear(self):
+        """remove entries of a previous run"""
+        check_removable_store(self.path, [self.metadata_path.name, self.fpath.name])
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def save_metadata(self, metadata: dict):
+        self.metadata_path.write_text(json.dumps(metadata))
+
+    def load_metadata(self) -> dict | None:
+        """online metadata saved by scrape phase, None if store is incomplete"""
+        if not self.metadata_path.exists():
+            return None
+        return json.loads(self.metadata_path.read_text())
+
+    def add_item_for(
+        self, path, title=None, mimetype=None, is_front=None, callback=None, **kwargs
+    ):
+        digest = self.blobs.store_entry(kwargs)
+        # content is not needed once stored, creator calls back once done too
+        if kwargs.get("delete_fpath") and kwargs.get("fpath"):
+            pathlib.Path(kwargs["fpath"]).unlink(missing_ok=True)
+        if callback:
+            callback()
+        self.conn.execute(
+            "INSERT INTO entries (path, title, mimetype, is_front, blob) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (path, title, mimetype, is_front, digest),
+        )
+
+    def add_redirect(self, path, target_path, **kwargs):  # noqa: ARG002
+        self.conn.execute(
+            "INSERT INTO entries (path, target_path) VALUES (?, ?)",
+            (path, target_path),
+        )
+
+    def feed(self, creator: Creator):
+        """add to ZIM all entries written since last call
+
+        Images written by several workers with the same content are only added
+        once, others being redirects to it"""
+        rows = self.conn.execute(
+            "SELECT id, path, title, mimetype, is_front, blob, target_path "
+            "FROM entries WHERE id > ? ORDER BY id",
+            (self.last_fed_id,),
+        ).fetchall()
+        for entry_id, path, title, mimetype, is_front, blob, target_path in rows:
+            self.last_fed_id = entry_id
+            self.nb_fed += 1
+            try:
+                if target_path is not None:
+                    creator.add_redirect(path=path, target_path=target_path)
+                    continue
+                if mimetype and mimetype.startswith("image/"):
+                    if blob in self.images_paths:
+                        creator.add_redirect(
+                            path=path, target_path=self.images_paths[blob]
+                        )
+                        continue
+                    self.images_paths[blob] = path
+                creator.add_item_for(
+                    path=path,
+                    title=title,
+                    mimetype=mimetype,
+                    fpath=self.blobs.get_path(blob),
+                    is_front=None if is_front is None else bool(is_front),
+                )
+            except Exception as exc:
+                self.nb_failed += 1
+                logger.error(f"Failed to write {path} to ZIM", exc_info=exc)
+
+    def raise_if_failed(self):
+        """raise if any entry fed so far could not be added to ZIM"""
+        if self.nb_failed:
+            raise FinalScrapingFailureError(
+                f"{self.nb_failed} entries failed to be added to ZIM"
+            )
@@ -5,9 +5,13 @@ from typing import Any
 from jinja2 import Environment
 from zimscraperlib.zim.creator import Creator
 
+from ifixit2zim.item_costs import ItemCosts
+from ifixit2zim.journal import Journal
+from ifixit2zim.pipeline import Pipeline
 from ifixit2zim.processor import Processor
 from ifixit2zim.scraper import Configuration
 from ifixit2zim.utils import Utils
+from ifixit2zim.work_queue import WorkQueue
 
 
 @dataclass
@@ -19,3 +23,7 @@ class Context:
     metadata: dict[str, Any]
     env: Environment
     processor: Processor
+    pipeline: Pipeline
+    item_costs: ItemCosts
+    journal: Journal | None
+    work_queue: WorkQueue | None
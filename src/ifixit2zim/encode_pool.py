@@ -0,0 +1,109 @@
+import io
+import multiprocessing
+import multiprocessing.pool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from PIL import Image
+from zimscraperlib.image.optimization import optimize_webp
+
+from ifixit2zim.constants import DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.shared import logger
+
+
+def encode_webp(
+    src: io.BytesIO | ImageBuffer, profile: str = DEFAULT_ENCODER_PROFILE
+) -> io.BytesIO:
+    """optimized WebP version of a bitmap image, encoded with profile settings"""
+    settings = dict(ENCODER_PROFILES[profile])
+    reencode = settings.pop("reencode", False)
+    webp = io.BytesIO()
+    with Image.open(src) as img:
+        if not reencode:
+            img.save(webp, format="WEBP", lossless=False, **settings)
+            webp.seek(0)
+            return webp
+        img.save(webp, format="WEBP")
+
+    return optimize_webp(
+        src=webp,
+        lossless=False,
+        **settings,
+    )  # pyright: ignore[reportReturnType]
+
+
+def _encode_in_worker(name: str, size: int, profile: str) -> int | bytes:
+    """encode image in shared memory, writing result back in place if it fits
+
+    Returns size of the result when written back, result itself otherwise"""
+    shm = SharedMemory(name=name)
+    # segment is owned (and unlinked) by parent, not by this process
+    resource_tracker.unregister(shm._name, "shared_memory")
+    try:
+        with shm.buf[:size] as view:
+            src = io.BytesIO(view)
+        webp = encode_webp(src, profile).getvalue()
+        if len(webp) > shm.size:
+            return webp
+        shm.buf[: len(webp)] = webp
+        return len(webp)
+    finally:
+        shm.close()
+
+
+class EncodePool:
+    """Optional pool of processes encoding images to WebP
+
+    Decoding and WebP encoding are CPU-bound and hold the GIL long enough to
+    starve the images download threads and the scraper itself. Downloads stay
+    in threads, which hand source bytes to the pool through shared memory,
+    where workers write encoded images back, sparing their pickling (but for
+    the rare encoded images larger than their source).
+
+    Workers are forked after rendering and worker processes, which must be
+    forked before any thread is started while this pool starts threads."""
+
+    def __init__(self, nb_processes: int):
+        self.nb_processes = nb_processes
+        self.pool: multiprocessing.pool.Pool | None = None
+
+    def start(self):
+        logger.info(f"Starting {self.nb_processes} image encoding processes")
+        self.pool = multiprocessing.get_context("fork").Pool(
+            processes=self.nb_processes
+        )
+
+    def encode(self, src: ImageBuffer, profile: str) -> io.BytesIO:
+        """optimized WebP version of a bitmap image, encoded in a worker"""
+        if self.pool is None:
+            raise Exception("Encode pool is not started")
+        size = src.size
+        shm = SharedMemory(create=True, size=max(size, 1))
+        try:
+            # read straight into shared memory, source might be spooled to disk
+            src.seek(0)
+            offset = 0
+            while offset < size:
+                with shm.buf[offset:size] as view:
+                    read = src.readinto(view)
+                if not read:
+                    raise OSError(f"Image source truncated at {offset}/{size}")
+                offset += read
+            result = self.pool.apply(_encode_in_worker, (shm.name, size, profile))
+            if isinstance(result, bytes):
+                return io.BytesIO(result)
+            with shm.buf[:result] as view:
+                return io.BytesIO(view)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self, *, wait=True):
+        if self.pool is None:
+            return
+        if wait:
+            self.pool.close()
+        else:
+            self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,111 @@
+import argparse
+import io
+import pathlib
+import time
+
+from ifixit2zim.constants import DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES
+from ifixit2zim.encode_pool import encode_webp
+from ifixit2zim.shared import logger
+
+# suffixes of the source images read from a sample corpus directory
+CORPUS_SUFFIXES = [".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"]
+
+
+class ProfileResult:
+    """Encode time and output size of an encoder profile on a corpus"""
+
+    def __init__(self, profile: str):
+        self.profile = profile
+        self.nb_images = 0
+        self.nb_failed = 0
+        self.seconds = 0.0
+        self.size = 0
+
+    def __str__(self):
+        return (
+            f"{self.profile}: {self.nb_images} images, {self.seconds:.2f}s "
+            f"({self.seconds / max(self.nb_images, 1) * 1000:.1f} ms/image), "
+            f"{self.size / 2**20:.2f} MiB"
+        )
+
+
+def benchmark(
+    sources: list[bytes], profiles: list[str] | None = None, repeat: int = 1
+) -> dict[str, ProfileResult]:
+    """encode every source image with each profile, best time of repeat runs"""
+    results = {}
+    for profile in profiles or list(ENCODER_PROFILES):
+        result = results[profile] = ProfileResult(profile)
+        for src in sources:
+            try:
+                durations = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    webp = encode_webp(io.BytesIO(src), profile)
+                    durations.append(time.perf_counter() - started)
+            except Exception as exc:
+                logger.debug(f"Failed to encode image with {profile}: {exc}")
+                result.nb_failed += 1
+                continue
+            result.nb_images += 1
+            result.seconds += min(durations)
+            result.size += len(webp.getbuffer())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="ifixit2zim.encoder_benchmark",
+        description="Compare encode time and size of images encoder profiles "
+        "on a sample corpus of source images",
+    )
+    parser.add_argument(
+        "corpus",
+        help="Directory of sample source images (JPEG, PNG, GIF, WebP, BMP), "
+        "searched recursively",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile to benchmark, may be repeated (default: all profiles)",
+        choices=list(ENCODER_PROFILES),
+        action="append",
+        dest="profiles",
+    )
+    parser.add_argument(
+        "--repeat",
+        help="Number of encodings of each image, keeping the fastest (default: 1)",
+        type=int,
+        default=1,
+        dest="repeat",
+    )
+    args = parser.parse_args()
+
+    sources = [
+        fpath.read_bytes()
+        for fpath in sorted(args.corpus.rglob("*"))
+        if fpath.suffix.lower() in CORPUS_SUFFIXES
+    ]
+    if not sources:
+        raise SystemExit(f"No source images found in {args.corpus}")
+    logger.info(
+        f"Encoding {len(sources)} images ({sum(map(len, sources)) / 2**20:.2f} MiB)"
+    )
+
+    results = benchmark(sources, profiles=args.profiles, repeat=args.repeat)
+    reference = results.get(DEFAULT_ENCODER_PROFILE)
+    for result in results.values():
+        line = str(result)
+        if reference and reference.size and result.seconds:
+            line += (
+                f", {reference.seconds / result.seconds:.1f}x faster and "
+                f"{(result.size / reference.size - 1) * 100:+.1f}% size "
+                f"vs {DEFAULT_ENCODER_PROFILE}"
+            )
+        if result.nb_failed:
+            line += f", {result.nb_failed} failed"
+        logger.info(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,15 @@ import argparse
 import os
 import sys
 
-from ifixit2zim.constants import NAME, SCRAPER, URLS
+from ifixit2zim.constants import (
+    DEFAULT_ENCODER_PROFILE,
+    ENCODER_PROFILES,
+    NAME,
+    PHASE_ALL,
+    PHASES,
+    SCRAPER,
+    URLS,
+)
 from ifixit2zim.shared import logger, set_debug
 
 
@@ -151,6 +159,214 @@ def main():
         default=10,
     )
 
+    parser.add_argument(
+        "--item-timeout",
+        help="Maximum time in seconds spent fetching or rendering an item. Items "
+        "exceeding it are considered in error. 0 to disable (default: 0)",
+        type=float,
+        default=0,
+        dest="item_timeout",
+    )
+
+    parser.add_argument(
+        "--item-retries",
+        help="Number of times an item failing with a transient error (server "
+        "error, timeout) is retried later in the run, with exponential spacing, "
+        "before being considered in error (default: 3)",
+        type=int,
+        default=3,
+        dest="item_retries",
+    )
+
+    parser.add_argument(
+        "--time-budget",
+        help="Maximum duration of the run in seconds. New items are not scraped "
+        "anymore once 90%% of it is spent: items and images in progress are "
+        "awaited, images not processed yet left out, remaining items redirected "
+        "to a not scraped page and the ZIM finished",
+        type=float,
+        dest="time_budget",
+    )
+
+    parser.add_argument(
+        "--fetch-workers",
+        help="Number of threads fetching items content online (default: 4)",
+        type=int,
+        default=4,
+        dest="fetch_workers",
+    )
+
+    parser.add_argument(
+        "--render-workers",
+        help="Number of threads rendering fetched items (default: 2)",
+        type=int,
+        default=2,
+        dest="render_workers",
+    )
+
+    parser.add_argument(
+        "--render-processes",
+        help="Number of processes rendering guides and categories, to use more than "
+        "one CPU core. Rendering happens in render workers threads otherwise. "
+        "Use at least as many render workers (default: 0)",
+        type=int,
+        default=0,
+        dest="render_processes",
+    )
+
+    parser.add_argument(
+        "--image-processes",
+        help="Number of processes encoding images to WebP, ideally the number of "
+        "CPU cores, images being downloaded by threads. Encoding happens in "
+        "images threads otherwise. Started by each worker process when using "
+        "--worker-processes (default: 0)",
+        type=int,
+        default=0,
+        dest="image_processes",
+    )
+
+    parser.add_argument(
+        "--encoder-profile",
+        help="WebP encoding profile of images, trading size for speed: fast encodes "
+        "much faster for somewhat larger images, e.g. for test and preview builds. "
+        "Cached images are only reused with the same profile. See encoder_benchmark "
+        f"to compare them (default: {DEFAULT_ENCODER_PROFILE})",
+        choices=list(ENCODER_PROFILES),
+        default=DEFAULT_ENCODER_PROFILE,
+        dest="encoder_profile",
+    )
+
+    parser.add_argument(
+        "--worker-processes",
+        help="Number of processes scraping items (each with its own workers threads) "
+        "from a shared work queue, while main process assembles their content into "
+        "the ZIM. Scraping happens in main process otherwise (default: 0)",
+        type=int,
+        default=0,
+        dest="worker_processes",
+    )
+
+    parser.add_argument(
+        "--pipeline-queue-size",
+        help="Maximum number of items waiting between two processing stages. "
+        "Bounds memory usage (default: 20)",
+        type=int,
+        default=20,
+        dest="pipeline_queue_size",
+    )
+
+    parser.add_argument(
+        "--scheduler-weight",
+        help="Share of the pipeline given to a kind of item when others have work "
+        "too, as kind=weight (e.g. guide=4). Kinds are home, category, guide, info "
+        "and user. Can be specified multiple times",
+        default=[],
+        action="append",
+        dest="scheduler_weight",
+    )
+
+    parser.add_argument(
+        "--priority-weight",
+        help="Share of dispatch given to a class of items of a given kind, as "
+        "class=weight (e.g. expected=4). Classes are expected (from listings or "
+        "selection) and discovered (through links), unset classes weighting 1. Can "
+        "be specified multiple times (default: all expected items first)",
+        default=[],
+        action="append",
+        dest="priority_weight",
+    )
+
+    parser.add_argument(
+        "--item-costs",
+        help="Path to a JSON file of items processing costs, recorded at the end of "
+        "the run and used on next runs to dispatch heaviest items first when "
+        "parallel workers are used",
+        dest="item_costs_filename",
+    )
+
+    parser.add_argument(
+        "--journal-dir",
+        help="Path to a folder where progress and written content are journaled, "
+        "to be able to resume an interrupted run. Cleared on start unless resuming",
+        dest="journal_dir",
+    )
+
+    parser.add_argument(
+        "--resume",
+        help="Resume the interrupted run journaled in --journal-dir, re-adding "
+        "already written content instead of fetching it again",
+        action="store_true",
+        default=False,
+        dest="resume",
+    )
+
+    parser.add_argument(
+        "--manifest-dir",
+        help="Path to a folder where the manifest of the build (items revisions, "
+        "content hashes and rendered content) is saved at the end of the run",
+        dest="manifest_dir",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        help="Reuse rendered content of items which did not change since the build "
+        "recorded in --manifest-dir instead of fetching and rendering them again",
+        action="store_true",
+        default=False,
+        dest="incremental",
+    )
+
+    parser.add_argument(
+        "--s3-upload-workers",
+        help="Number of threads uploading optimized images to S3 cache in "
+        "background (default: 8)",
+        type=int,
+        default=8,
+        dest="s3_upload_workers",
+    )
+
+    parser.add_argument(
+        "--s3-upload-spool-size",
+        help="Maximum number of optimized images awaiting upload to S3 cache, "
+        "images processing waiting beyond it (default: 200)",
+        type=int,
+        default=200,
+        dest="s3_upload_spool_size",
+    )
+
+    parser.add_argument(
+        "--image-cache-dir",
+        help="Path to a folder where optimized images are cached across runs, "
+        "checked before S3 cache and origin",
+        dest="image_cache_dir",
+    )
+
+    parser.add_argument(
+        "--image-cache-size",
+        help="Size budget of the images cache in MiB, least recently used images "
+        "being evicted beyond it (default: 10240)",
+        type=int,
+        default=10240,
+        dest="image_cache_size",
+    )
+
+    parser.add_argument(
+        "--phase",
+        help="Run only scraping, writing entries to --content-store, or only "
+        "assembling a ZIM from an already scraped --content-store (e.g. to build "
+        "it again with other metadata), instead of both (default: all)",
+        choices=PHASES,
+        default=PHASE_ALL,
+        dest="phase",
+    )
+
+    parser.add_argument(
+        "--content-store",
+        help="Path to a folder where scrape phase stores rendered entries, "
+        "redirects and images, read by assemble phase",
+        dest="content_store_dir",
+    )
+
     parser.add_argument(
         "--skip-checks",
         help="[dev] Don't perform Integrity Checks on start",
@@ -264,6 +480,33 @@ def main():
         default=False,
     )
 
+    parser.add_argument(
+        "--sample-fraction",
+        help="Scrape only a representative random fraction (e.g. 0.01) of the "
+        "expected items of every type, to measure throughput and size of a full "
+        "run. Other items are redirected to not scrapped page",
+        type=float,
+        dest="sample_fraction",
+    )
+
+    parser.add_argument(
+        "--sample-seed",
+        help="Seed of the selection of sampled items, the same seed selecting the "
+        "same items (default: 0)",
+        type=int,
+        default=0,
+        dest="sample_seed",
+    )
+
+    parser.add_argument(
+        "--sample-max-depth",
+        help="When sampling, maximum number of links followed from sampled items "
+        "to scrape items they link to (default: 1)",
+        type=int,
+        default=1,
+        dest="sample_max_depth",
+    )
+
     parser.add_argument(
         "--no-cleanup",
         help="Do not cleanup HTML content.",
@@ -78,17 +78,36 @@ class Executor(queue.Queue):
         self.drain()
         self.release_halt()
         self._workers = set()
+        self._abandoned = set()
+        self._nb_started = 0
         self._shutdown = False
         self.exceptions[:] = []
 
-        for n in range(self.nb_workers):
-            t = threading.Thread(target=self.worker, name=f"{self.prefix}{n}")
-            t.daemon = True
-            t.start()
-            self._workers.add(t)
+        for _ in range(self.nb_workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        t = threading.Thread(
+            target=self.worker, name=f"{self.prefix}{self._nb_started}"
+        )
+        t.daemon = True
+        self._nb_started += 1
+        t.start()
+        self._workers.add(t)
+
+    def replace_worker(self, worker: threading.Thread):
+        """start a new worker in place of one stuck on a task
+
+        The stuck worker is not awaited on join anymore and exits once its task
+        eventually completes"""
+        self._abandoned.add(worker)
+        self._workers.discard(worker)
+        self._start_worker()
 
     def worker(self):
         while self.alive or self.no_more:
+            if threading.current_thread() in self._abandoned:
+                return
             try:
                 func, kwargs = self.get(block=True, timeout=2.0)
             except queue.Empty:
@@ -130,7 +149,10 @@ class Executor(queue.Queue):
         """Await completion of workers, requesting them to stop taking new task"""
         logger.debug(f"joining all threads for {self.prefix}")
         self.no_more = True
-        for t in self._workers:
+        for t in list(self._workers):
+            # a worker might request shutdown upon exception, it can't join itself
+            if t is threading.current_thread():
+                continue
             e = threading.Event()
             while t.is_alive():
                 t.join(1)
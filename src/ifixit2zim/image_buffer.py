@@ -0,0 +1,148 @@
+import hashlib
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO
+
+# size from which image buffers are spooled to a temporary file
+IMAGE_BUFFER_SPOOL_SIZE = 2**20
+
+
+class ImageBuffer:
+    """Content of an image, hashed while written and spooled to disk once large
+
+    Content is hashed through memoryviews as it is written, sparing a copy of
+    the whole image to compute its digest. Images larger than spool_size are
+    moved to a temporary file, handed as is to the ZIM creator, so that large
+    images in flight do not inflate memory.
+
+    Buffers are reference counted: their temporary file is removed once the
+    owner and all consumers (creator, uploads) released them."""
+
+    def __init__(
+        self,
+        spool_size: int = IMAGE_BUFFER_SPOOL_SIZE,
+        directory: pathlib.Path | None = None,
+    ):
+        self.spool_size = spool_size
+        self.directory = directory
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.fpath: pathlib.Path | None = None
+        self._file: BinaryIO = io.BytesIO()
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def wrap(
+        cls,
+        content: bytes | io.BytesIO,
+        spool_size: int = IMAGE_BUFFER_SPOOL_SIZE,
+        directory: pathlib.Path | None = None,
+    ) -> "ImageBuffer":
+        """buffer of existing content, adopted without copy unless spooled"""
+        buffer = cls(spool_size=spool_size, directory=directory)
+        if isinstance(content, io.BytesIO):
+            buffer._file = content
+        else:
+            # initial bytes are shared, not copied
+            buffer._file = io.BytesIO(content)
+        # getvalue() shares its bytes with the stream (while getbuffer() copies
+        # them when shared)
+        value = buffer._file.getvalue()
+        buffer.hasher.update(value)
+        buffer.size = len(value)
+        buffer._file.seek(0, os.SEEK_END)
+        if buffer.size > spool_size:
+            buffer._spool()
+        buffer.seek(0)
+        return buffer
+
+    @property
+    def digest(self) -> bytes:
+        return self.hasher.digest()
+
+    def write(self, data, /) -> int:
+        with memoryview(data) as view:
+            self.hasher.update(view)
+            self.size += len(view)
+            written = self._file.write(view)
+        if self.fpath is None and self.size > self.spool_size:
+            self._spool()
+        return written
+
+    def _spool(self):
+        """move content to a temporary file"""
+        fd, fpath = tempfile.mkstemp(prefix="image_", dir=self.directory)
+        spooled = open(fd, "w+b")
+        spooled.write(self._file.getvalue())
+        spooled.seek(self._file.tell())
+        self._file.close()
+        self._file = spooled
+        self.fpath = pathlib.Path(fpath)
+
+    def read(self, size: int = -1, /) -> bytes:
+        return self._file.read(size)
+
+    def readinto(self, buffer, /) -> int:
+        return self._file.readinto(buffer)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET, /) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def getvalue(self) -> bytes:
+        """whole content, only copied if buffer is spooled"""
+        if self.fpath is None:
+            return self._file.getvalue()
+        self._file.flush()
+        return self.fpath.read_bytes()
+
+    def open(self) -> BinaryIO:
+        """independent reader of the content, for use from another thread"""
+        if self.fpath is None:
+            return io.BytesIO(self._file.getvalue())
+        self._file.flush()
+        return open(self.fpath, "rb")
+
+    def save(self, fpath: pathlib.Path):
+        """write content to fpath"""
+        if self.fpath is None:
+            fpath.write_bytes(self._file.getvalue())
+            return
+        self._file.flush()
+        shutil.copyfile(self.fpath, fpath)
+
+    def get_item_kwargs(self) -> dict:
+        """creator.add_item_for kwargs providing the content
+
+        Spooled content is provided as a file, kept until creator is done with it"""
+        if self.fpath is None:
+            return {"content": self._file.getvalue()}
+        self._file.flush()
+        self.retain()
+        return {"fpath": self.fpath, "callback": self.release}
+
+    def retain(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            if self._refs:
+                return
+        self._file.close()
+        if self.fpath:
+            self.fpath.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -0,0 +1,145 @@
+import hashlib
+import pathlib
+import threading
+import time
+
+from ifixit2zim.blob_store import BlobStore
+from ifixit2zim.constants import DEFAULT_ENCODER_PROFILE, IMAGES_ENCODER_VERSION
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.shared import logger
+from ifixit2zim.work_queue import SqliteStore
+
+# share of the budget to which the cache is brought back once exceeded, so that
+# eviction does not occur on every new image
+IMAGE_CACHE_EVICTION_RATIO = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    key TEXT PRIMARY KEY,
+    ident TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_last_used ON images (last_used);
+CREATE INDEX IF NOT EXISTS images_digest ON images (digest);
+"""
+
+
+class ImageCache(SqliteStore):
+    """Local on-disk cache of optimized images, kept across runs
+
+    Images are keyed by source URL, encoder version and encoder profile, along
+    with the version ident of the source they were made from so that they can be
+    revalidated. Their content is stored in a content-addressed blobs store.
+    Least recently used images are evicted once the cache exceeds its budget."""
+
+    schema = SCHEMA
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        max_size: int,
+        encoder_profile: str = DEFAULT_ENCODER_PROFILE,
+    ):
+        super().__init__(path / "images.sqlite")
+        self.encoder_profile = encoder_profile
+        self.blobs = BlobStore(path / "blobs")
+        self.max_size = max_size
+        self.total_size = 0
+        self.nb_hits = 0
+        self.nb_misses = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        self.create()
+        self.total_size = self._get_total_size()
+        logger.info(
+            f"Using images cache at {self.fpath.parent} "
+            f"({self.total_size // 2**20} of {self.max_size // 2**20} MiB used)"
+        )
+
+    def _get_total_size(self) -> int:
+        return self.conn.execute("SELECT SUM(size) FROM images").fetchone()[0] or 0
+
+    def get_key(self, url: str) -> str:
+        return hashlib.sha256(
+            f"{url}|{IMAGES_ENCODER_VERSION}|{self.encoder_profile}".encode()
+        ).hexdigest()
+
+    def get(self, url: str) -> tuple[str, bytes] | None:
+        """version ident and optimized image of source URL, None if not cached"""
+        key = self.get_key(url)
+        row = self.conn.execute(
+            "SELECT ident, digest FROM images WHERE key = ?", (key,)
+        ).fetchone()
+        fpath = self.blobs.get_path(row[1]) if row else None
+        if fpath is None or not fpath.exists():
+            self.nb_misses += 1
+            return None
+        self.conn.execute(
+            "UPDATE images SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        self.nb_hits += 1
+        return row[0], fpath.read_bytes()
+
+    def put(self, url: str, ident: str, content: ImageBuffer):
+        """store optimized image of source URL, replacing its outdated version"""
+        key = self.get_key(url)
+        digest = self.blobs.store_as(content.digest.hex(), content.save)
+        previous = self.conn.execute(
+            "SELECT digest, size FROM images WHERE key = ?", (key,)
+        ).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+            (key, ident, digest, content.size, time.time()),
+        )
+        if (
+            previous
+            and previous[0] != digest
+            and not self.conn.execute(
+                "SELECT 1 FROM images WHERE digest = ? LIMIT 1", (previous[0],)
+            ).fetchone()
+        ):
+            self.blobs.get_path(previous[0]).unlink(missing_ok=True)
+        with self._lock:
+            # estimate, computed again on eviction
+            self.total_size += content.size - (previous[1] if previous else 0)
+            if self.total_size <= self.max_size:
+                return
+            self.evict()
+
+    def evict(self):
+        """remove least recently used images until back under budget"""
+        conn = self.conn
+        target = self.max_size * IMAGE_CACHE_EVICTION_RATIO
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # other processes might share the cache
+            total_size = self._get_total_size()
+            rows = conn.execute(
+                "SELECT key, digest, size FROM images ORDER BY last_used"
+            )
+            evicted = []
+            for key, digest, size in rows:
+                if total_size <= target:
+                    break
+                evicted.append((key, digest))
+                total_size -= size
+            for key, _ in evicted:
+                conn.execute("DELETE FROM images WHERE key = ?", (key,))
+            unused = [
+                digest
+                for _, digest in evicted
+                if not conn.execute(
+                    "SELECT 1 FROM images WHERE digest = ? LIMIT 1", (digest,)
+                ).fetchone()
+            ]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        for digest in unused:
+            self.blobs.get_path(digest).unlink(missing_ok=True)
+        self.total_size = total_size
+        logger.debug(f"Evicted {len(evicted)} images from images cache")
@@ -1,24 +1,40 @@
 #!/usr/bin/env python
 # vim: ai ts=4 sts=4 et sw=4 nu
 
-import hashlib
+import contextlib
 import io
 import pathlib
 import re
 import threading
+import time
 import urllib.parse
+from http import HTTPStatus
 
-from kiwixstorage import KiwixStorage, NotFoundError
-from PIL import Image
-from zimscraperlib.download import stream_file
-from zimscraperlib.image.optimization import optimize_webp
+import botocore.exceptions
+from kiwixstorage import NotFoundError
+from zimscraperlib.download import get_session
 from zimscraperlib.zim.creator import Creator
 
-from ifixit2zim.constants import IMAGES_ENCODER_VERSION
+from ifixit2zim.constants import DEFAULT_ENCODER_PROFILE, IMAGES_ENCODER_VERSION
+from ifixit2zim.encode_pool import EncodePool, encode_webp
 from ifixit2zim.executor import Executor
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.image_cache import ImageCache
+from ifixit2zim.journal import Journal, JournalState
+from ifixit2zim.pipeline import paused_item_deadline, record_item_operation
+from ifixit2zim.s3_clients import S3Clients
+from ifixit2zim.s3_manifest import S3Manifest
+from ifixit2zim.s3_uploader import S3Uploader
 from ifixit2zim.scraper import Configuration
 from ifixit2zim.shared import logger
-from ifixit2zim.utils import Utils
+from ifixit2zim.utils import (
+    Utils,
+    get_conditional_headers,
+    get_image_variant,
+    get_image_variant_url,
+    get_version_ident,
+)
+from ifixit2zim.work_queue import WorkQueue
 
 
 class Imager:
@@ -29,44 +45,155 @@ class Imager:
         creator: Creator,
         utils: Utils,
         configuration: Configuration,
+        journal: Journal | None = None,
+        work_queue: WorkQueue | None = None,
+        encode_pool: EncodePool | None = None,
+        image_cache: ImageCache | None = None,
+        s3_manifest: S3Manifest | None = None,
+        deadline: float | None = None,
     ):
         self.aborted = False
+        # images not processed yet are replaced by placeholder past deadline,
+        # leaving time to finish ZIM with only images in progress to await
+        self.deadline = deadline
+        self.nb_out_of_time = 0
         # list of source URLs that we've processed and added to ZIM
         self.handled = set()
+        self.handled_lock = threading.Lock()
         self.dedup_items = {}
+        # base URL of iFixit CDN images => paths of variants waiting to be
+        # processed by size rank, and (rank, path) of the variant processed
+        self.image_variants = {}
+        # digest of downloaded source images => path of their first occurence
+        self.source_dedup_items = {}
+        self.nb_source_duplicates = 0
+        # cached images revalidated with origin, not downloaded again
+        self.nb_unchanged = 0
         self.img_executor = img_executor
         self.lock = lock
         self.creator = creator
         self.utils = utils
         self.configuration = configuration
+        self.journal = journal
+        self.work_queue = work_queue
+        self.encode_pool = encode_pool
+        self.image_cache = image_cache
+        self.s3_manifest = s3_manifest
+        # HTTP sessions reused by all images downloaded in a thread
+        self._local = threading.local()
+        # clients reused by all images processed in a thread
+        self.s3_clients = (
+            S3Clients(self.configuration.s3_url) if self.configuration.s3_url else None
+        )
+        self.s3_uploader = (
+            S3Uploader(
+                s3_clients=self.s3_clients,
+                s3_manifest=self.s3_manifest,
+                nb_workers=self.configuration.s3_upload_workers,
+                spool_size=self.configuration.s3_upload_spool_size,
+            )
+            if self.s3_clients
+            else None
+        )
 
+    def start(self):
         self.img_executor.start()
+        if self.s3_uploader:
+            self.s3_uploader.start()
+
+    def shutdown(self, *, wait=True):
+        """stop processing images, then uploading them unless not waiting"""
+        self.img_executor.shutdown(wait=wait)
+        if self.s3_uploader:
+            self.s3_uploader.shutdown(wait=wait)
 
     def abort(self):
         """request imager to cancel processing of futures"""
         self.aborted = True
 
-    def get_image_data(self, url: str) -> io.BytesIO:
-        """Bytes stream of an optimized version of source image
-
-        Bitmap images are converted to WebP and optimized
-        SVG images are kept as is"""
-        src, webp = io.BytesIO(), io.BytesIO()
-        stream_file(url=url, byte_stream=src)
-
+    def get_session(self):
+        """HTTP session of current thread"""
+        if getattr(self._local, "session", None) is None:
+            self._local.session = get_session()
+        return self._local.session
+
+    def download_image(
+        self, url: str, ident: str | None = None
+    ) -> tuple[ImageBuffer | None, str]:
+        """source image, hashed while being downloaded, and its version ident
+
+        With the ident of a cached version, image is only downloaded if it changed
+        since: None is returned along that same ident otherwise."""
+        headers = get_conditional_headers(ident) if ident else {}
+        with self.get_session().get(
+            url,
+            headers=headers,
+            stream=True,
+            timeout=self.configuration.request_timeout,
+        ) as resp:
+            resp.raise_for_status()
+            if resp.status_code == HTTPStatus.NOT_MODIFIED:
+                return None, ident
+            src = self.get_buffer()
+            try:
+                for data in resp.iter_content(2**16):
+                    src.write(data)
+            except BaseException:
+                src.release()
+                raise
+        src.seek(0)
+        return src, get_version_ident(resp.headers)
+
+    def download_from_s3(self, path: str) -> tuple[str, ImageBuffer]:
+        """version ident of source and optimized image from S3 cache
+
+        Raises NotFoundError if not in cache for current encoder version"""
+        s3_storage = self.s3_clients.get()
+        with self.s3_clients.timed("download"):
+            try:
+                remote = s3_storage.get_object(path).get()
+            except botocore.exceptions.ClientError as exc:
+                if exc.response["Error"]["Code"] == "NoSuchKey":
+                    raise NotFoundError(str(exc)) from exc
+                raise
+            meta = remote.get("Metadata", {})
+            if (
+                meta.get("encoder_version") != str(IMAGES_ENCODER_VERSION)
+                # images cached before profiles were encoded with the default one
+                or meta.get("encoder_profile", DEFAULT_ENCODER_PROFILE)
+                != self.configuration.encoder_profile
+                or not meta.get("ident")
+            ):
+                raise NotFoundError(f"{path} doesn't match current encoder")
+            content = self.get_buffer()
+            try:
+                for chunk in remote["Body"].iter_chunks():
+                    content.write(chunk)
+            except BaseException:
+                content.release()
+                raise
+            return meta["ident"], content
+
+    def get_buffer(self, content: bytes | io.BytesIO | None = None) -> ImageBuffer:
+        """new image buffer, spooled to build dir, of content if any"""
+        if content is None:
+            return ImageBuffer(directory=self.configuration.build_path)
+        return ImageBuffer.wrap(content, directory=self.configuration.build_path)
+
+    def optimize_image(self, url: str, src: ImageBuffer) -> ImageBuffer:
+        """optimized version of a downloaded image, released by caller
+
+        Bitmap images are converted to WebP and optimized, in encoding processes
+        if any, SVG images are kept as is"""
         if pathlib.Path(url).suffix == ".svg" or "/math/render/svg/" in url:
+            src.retain()
             return src
 
-        with Image.open(src) as img:
-            img.save(webp, format="WEBP")
-
-        del src
-        return optimize_webp(
-            src=webp,
-            lossless=False,
-            quality=60,
-            method=6,
-        )  # pyright: ignore[reportReturnType]
+        profile = self.configuration.encoder_profile
+        if self.encode_pool:
+            return self.get_buffer(self.encode_pool.encode(src, profile))
+        src.seek(0)
+        return self.get_buffer(encode_webp(src, profile))
 
     def get_path_for(self, url: urllib.parse.ParseResult) -> str:
         url_with_only_path = urllib.parse.ParseResult(
@@ -80,135 +207,263 @@ class Imager:
         unquoted_url = urllib.parse.unquote(url_with_only_path.geturl())
         return "images/{}".format(re.sub(r"^(https?)://", r"\1/", unquoted_url))
 
-    def defer(self, url: str) -> str | None:
-        """request full processing of url, returning in-zim path immediately"""
+    def get_parsed_url_and_path(
+        self, url: str
+    ) -> tuple[urllib.parse.ParseResult, str] | tuple[None, None]:
+        """parsed source URL and in-zim path of an image URL, if supported"""
 
         # find actual URL should it be from a provider
         try:
             parsed_url = urllib.parse.urlparse(self.utils.to_url(url))
         except Exception:
             logger.warning(f"Can't parse image URL `{url}`. Skipping")
-            return
+            return None, None
 
         if parsed_url.scheme not in ("http", "https"):
             logger.warning(
                 f"Not supporting image URL `{parsed_url.geturl()}`. Skipping"
             )
+            return None, None
+
+        return parsed_url, self.get_path_for(parsed_url)
+
+    def defer(self, url: str) -> str | None:
+        """request full processing of url, returning in-zim path immediately"""
+        record_item_operation("image", url)
+
+        parsed_url, path = self.get_parsed_url_and_path(url)
+        if parsed_url is None or path is None:
             return
 
-        path = self.get_path_for(parsed_url)
+        with self.handled_lock:
+            if path in self.handled:
+                return path
 
-        if path in self.handled:
+            # record that we are processing this one
+            self.handled.add(path)
+
+        # another worker process might be processing it already
+        if self.work_queue and not self.work_queue.claim_image(path):
             return path
 
-        # record that we are processing this one
-        self.handled.add(path)
+        if self.journal:
+            self.journal.record_image(url)
 
-        self.img_executor.submit(
-            self.process_image,
-            url=parsed_url,
-            path=path,
-            mimetype="image/svg+xml" if path.endswith(".svg") else "image/webp",
-            dont_release=True,
-        )
+        if not self.add_image_variant(parsed_url, path):
+            return path
+
+        with paused_item_deadline():
+            self.img_executor.submit(
+                self.process_image,
+                url=parsed_url,
+                path=path,
+                mimetype="image/svg+xml" if path.endswith(".svg") else "image/webp",
+                dont_release=True,
+            )
 
         return path
 
-    def check_for_duplicate(self, path, content):
-        digest = hashlib.sha256(content).digest()
+    def add_image_variant(self, url: urllib.parse.ParseResult, path: str) -> bool:
+        """register a size variant of an image, whether it is to be processed
+
+        Variants are processed together, as the largest one referenced by then,
+        smaller ones being redirected to it. Variants referenced afterwards are
+        redirected right away, unless larger."""
+        base, rank = get_image_variant(url.geturl())
+        if base is None:
+            return True
+        with self.handled_lock:
+            variants = self.image_variants.setdefault(
+                base, {"pending": {}, "processed": None}
+            )
+            processed = variants["processed"]
+            if processed is None or processed[0] < rank:
+                # only first variant waiting for processing is submitted
+                is_first = not variants["pending"]
+                variants["pending"][rank] = path
+                return is_first
+        self._write("add_redirect", path=path, target_path=processed[1])
+        return False
+
+    def pop_image_variants(
+        self, url: urllib.parse.ParseResult, path: str
+    ) -> tuple[urllib.parse.ParseResult, str, list[str]]:
+        """url and path of largest variant of an image referenced so far, with
+        paths of smaller ones to redirect to it"""
+        base, _ = get_image_variant(url.geturl())
+        if base is None:
+            return url, path, []
+        with self.handled_lock:
+            variants = self.image_variants[base]
+            pending, variants["pending"] = variants["pending"], {}
+            rank = max(pending)
+            path = pending.pop(rank)
+            variants["processed"] = (rank, path)
+        url = urllib.parse.urlparse(get_image_variant_url(base, rank))
+        return url, path, list(pending.values())
+
+    def convert_image(
+        self, url: str, path: str, src: ImageBuffer
+    ) -> ImageBuffer | None:
+        """optimized image from downloaded source, None if source is a duplicate
+
+        Source images identical to an image already downloaded are redirected to
+        it before any conversion, their optimized version being the same"""
+        digest = src.digest
+        with self.handled_lock:
+            duplicate_path = self.source_dedup_items.setdefault(digest, path)
+            if duplicate_path != path:
+                self.nb_source_duplicates += 1
+        if duplicate_path != path:
+            self._write("add_redirect", path=path, target_path=duplicate_path)
+            return None
+        return self.optimize_image(url, src)
+
+    def check_for_duplicate(self, path, content: ImageBuffer):
+        digest = content.digest
         if digest in self.dedup_items:
             return self.dedup_items[digest]
         self.dedup_items[digest] = path
+        if self.journal:
+            self.journal.record_dedup(digest, path)
         return None
 
     def add_image_to_zim(self, path, content, mimetype):
         duplicate_path = self.check_for_duplicate(path, content)
-        with self.lock:
-            if duplicate_path:
-                self.creator.add_redirect(
-                    path=path,
-                    target_path=duplicate_path,
-                )
-            else:
-                self.creator.add_item_for(
-                    path=path,
-                    content=content,
-                    mimetype=mimetype,
-                )
+        if duplicate_path:
+            self._write("add_redirect", path=path, target_path=duplicate_path)
+        else:
+            self._write(
+                "add_item_for",
+                digest=content.digest.hex(),
+                path=path,
+                mimetype=mimetype,
+                **content.get_item_kwargs(),
+            )
 
     def add_missing_image_to_zim(self, path):
+        self._write("add_redirect", path=path, target_path="assets/NoImage_300x225.jpg")
+
+    def _write(self, method, digest: str | None = None, **kwargs):
+        if self.journal and method == "add_item_for":
+            # before creator, which removes spooled content once done with it
+            self.journal.blobs.store_entry(kwargs, digest=digest)
         with self.lock:
-            self.creator.add_redirect(
-                path=path,
-                target_path="assets/NoImage_300x225.jpg",
-            )
+            getattr(self.creator, method)(**kwargs)
+        if self.journal:
+            self.journal.record_entry(method, kwargs, digest=digest)
+
+    def restore(self, state: JournalState):
+        """restore registry of images from journal, requesting unwritten ones"""
+        for digest, path in state.dedup.items():
+            if path in state.written_paths:
+                self.dedup_items[digest] = path
+        nb_deferred = 0
+        for url in state.images:
+            _, path = self.get_parsed_url_and_path(url)
+            if path in state.written_paths:
+                self.handled.add(path)
+            elif path not in self.handled:
+                self.defer(url)
+                nb_deferred += 1
+        logger.info(
+            f"Restored {len(self.handled)} images, {nb_deferred} still to process"
+        )
+
+    def cache_image(self, url: str, ident: str, content: ImageBuffer):
+        """store optimized image in local cache, failures being only logged"""
+        try:
+            self.image_cache.put(url, ident, content)
+        except Exception as exc:
+            logger.error(f"Failed to store {url} in images cache", exc_info=exc)
 
     def process_image(
         self, url: urllib.parse.ParseResult, path: str, mimetype: str
     ) -> str | None:
-        """download image from url or S3 and add to Zim at path. Upload if req."""
+        """download image from url, local cache or S3 and add to Zim at path.
+
+        Upload to S3 and store in local cache if req."""
 
         if self.aborted:
             return
 
-        # just download, optimize and add to ZIM if not using S3
-        if not self.configuration.s3_url:
-            try:
-                fileobj = self.get_image_data(url.geturl())
-            except Exception as exc:
-                logger.error(
-                    f"Failed to download/convert/optim source  at {url.geturl()}",
-                    exc_info=exc,
-                )
-                self.add_missing_image_to_zim(
-                    path=path,
-                )
-                return path
-
-            self.add_image_to_zim(
-                path=path,
-                content=fileobj.getvalue(),
-                mimetype=mimetype,
-            )
+        url, path, smaller_paths = self.pop_image_variants(url, path)
 
-            return path
+        if self.deadline and time.monotonic() > self.deadline:
+            with self.handled_lock:
+                self.nb_out_of_time += 1
+            # pages linking to it are already written
+            for missing_path in [path, *smaller_paths]:
+                self.add_missing_image_to_zim(missing_path)
+            return
 
-        # we are using S3 cache
-        ident = self.utils.get_version_ident_for(url.geturl())
-        if ident is None:
-            logger.error(f"Unable to query {url.geturl()}. Skipping")
-            self.add_missing_image_to_zim(
-                path=path,
-            )
-            return path
+        # buffers of the image are released once it is processed
+        with contextlib.ExitStack() as buffers:
+            self._process_image(url, path, mimetype, buffers)
+        for smaller_path in smaller_paths:
+            self._write("add_redirect", path=smaller_path, target_path=path)
+        return path
 
-        # key = self.get_s3_key_for(url.geturl())
-        s3_storage = KiwixStorage(self.configuration.s3_url)
-        meta = {"ident": ident, "encoder_version": str(IMAGES_ENCODER_VERSION)}
+    def _process_image(
+        self,
+        url: urllib.parse.ParseResult,
+        path: str,
+        mimetype: str,
+        buffers: contextlib.ExitStack,
+    ) -> str:
+        # optimized image and version ident of its source, from local cache or S3
+        cached_ident, cached_content = None, None
+        in_image_cache = False
+        if self.image_cache:
+            # local cache first, it spares S3 round-trips
+            cached = self.image_cache.get(url.geturl())
+            if cached is not None:
+                cached_ident, content = cached
+                cached_content = buffers.enter_context(self.get_buffer(content))
+                in_image_cache = True
 
         download_failed = False  # useful to trigger reupload or not
+        meta = {
+            "encoder_version": str(IMAGES_ENCODER_VERSION),
+            "encoder_profile": self.configuration.encoder_profile,
+        }
+        if self.s3_clients and cached_content is None:
+            if self.s3_manifest and not self.s3_manifest.may_match(path, meta):
+                # known not to be in bucket without asking S3
+                logger.debug(f"'{path}' not in S3 cache manifest")
+            else:
+                try:
+                    cached_ident, cached_content = self.download_from_s3(path)
+                    buffers.enter_context(cached_content)
+                    logger.debug(f"'{path}' found in S3")
+                except NotFoundError:
+                    # don't have it, not a donwload error. we'll upload after processing
+                    pass
+                except Exception as exc:
+                    logger.error(
+                        f"Failed to download '{path}' from cache", exc_info=exc
+                    )
+                    download_failed = True
+
+        # revalidate cached version with origin, downloading it only if it changed
         try:
-            fileobj = io.BytesIO()
-            s3_storage.download_matching_fileobj(path, fileobj, meta=meta)
-            logger.debug(f"'{path}' found in S3")
-        except NotFoundError:
-            # don't have it, not a donwload error. we'll upload after processing
-            pass
-        except Exception as exc:
-            logger.error(f"Failed to download '{path}' from cache", exc_info=exc)
-            download_failed = True
-        else:
-            self.add_image_to_zim(
-                path=path,
-                content=fileobj.getvalue(),
-                mimetype=mimetype,
-            )
-            return path
+            src, ident = self.download_image(url.geturl(), cached_ident)
+            if src is not None:
+                buffers.enter_context(src)
+            if cached_content is not None and (src is None or ident == cached_ident):
+                logger.debug(f"'{path}' unchanged since cached")
+                self.nb_unchanged += 1
+                self.add_image_to_zim(
+                    path=path, content=cached_content, mimetype=mimetype
+                )
+                if self.image_cache and not in_image_cache:
+                    self.cache_image(url.geturl(), ident, cached_content)
+                return path
 
-        # we're using S3 but don't have it or failed to download
-        logger.debug(f"'{path}' not found in S3, downloading from origin")
-        try:
-            fileobj = self.get_image_data(url.geturl())
+            logger.debug(f"'{path}' not found in cache, converting from origin")
+            fileobj = self.convert_image(url.geturl(), path, src)
+            if fileobj is not None:
+                buffers.enter_context(fileobj)
         except Exception as exc:
             logger.error(
                 f"Failed to download/convert/optim source  at {url.geturl()}",
@@ -218,19 +473,22 @@ class Imager:
                 path=path,
             )
             return path
+        if fileobj is None:
+            return path
 
         self.add_image_to_zim(
             path=path,
-            content=fileobj.getvalue(),
+            content=fileobj,
             mimetype=mimetype,
         )
 
+        if self.image_cache:
+            self.cache_image(url.geturl(), ident, fileobj)
+
         # only upload it if we didn't have it in cache
-        if not download_failed:
-            logger.debug(f"Uploading {url.geturl()} to S3::{path} with {meta}")
-            try:
-                s3_storage.upload_fileobj(fileobj=fileobj, key=path, meta=meta)
-            except Exception as exc:
-                logger.error(f"{path} failed to upload to cache", exc_info=exc)
+        if self.s3_uploader and not download_failed:
+            self.s3_uploader.upload(
+                key=path, content=fileobj, meta={"ident": ident, **meta}
+            )
 
         return path
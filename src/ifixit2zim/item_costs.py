@@ -0,0 +1,50 @@
+import json
+import pathlib
+import threading
+
+from ifixit2zim.shared import logger
+
+
+class ItemCosts:
+    """Estimated processing cost of items, persisted from one run to the next
+
+    Costs are relative units computed by scrapers from fetched content (e.g. number
+    of steps, images and comments of a guide). They are only used to dispatch the
+    heaviest items first, so that the run does not end with a single slow item.
+    Items without a recorded cost are estimated by scrapers from listings data."""
+
+    def __init__(self, fpath: pathlib.Path | None = None):
+        self.fpath = fpath
+        self._costs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, item_key: str) -> str:
+        return f"{kind}/{item_key}"
+
+    def load(self):
+        if not self.fpath or not self.fpath.exists():
+            return
+        try:
+            self._costs = json.loads(self.fpath.read_text())
+        except Exception as exc:
+            logger.warning(f"Ignoring unreadable items costs {self.fpath}: {exc}")
+            self._costs = {}
+            return
+        logger.info(f"Loaded {len(self._costs)} items costs from {self.fpath}")
+
+    def save(self):
+        if not self.fpath:
+            return
+        with self._lock:
+            content = json.dumps(self._costs)
+        self.fpath.parent.mkdir(parents=True, exist_ok=True)
+        self.fpath.write_text(content)
+        logger.info(f"Saved {len(self._costs)} items costs to {self.fpath}")
+
+    def get(self, kind: str, item_key: str, default: float = 0) -> float:
+        return self._costs.get(self._key(kind, item_key), default)
+
+    def record(self, kind: str, item_key: str, cost: float):
+        with self._lock:
+            self._costs[self._key(kind, item_key)] = cost
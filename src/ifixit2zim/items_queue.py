@@ -0,0 +1,90 @@
+import heapq
+import itertools
+import threading
+from queue import Empty
+
+EXPECTED = "expected"
+DISCOVERED = "discovered"
+
+
+class ItemsQueue:
+    """Priority-aware queue of items to scrape, safe to use from several threads
+
+    Items belong to a priority class (expected ones, from listings or explicit
+    selection, and discovered ones, found through links while rendering).
+    Expected items are all served before discovered ones, unless `weights` are
+    set: classes then share dispatch according to their weights, each time an item
+    is taken from a class its pass advances by 1/weight and the non-empty class with
+    the lowest pass goes next.
+
+    Within a class, items with the lowest discovery depth come first. Then, when
+    `longest_first` is set (parallel workers), items with the highest estimated
+    cost come first so that heavy items do not end up alone at the end of the run.
+    Remaining ties are in insertion order.
+
+    Mimics the subset of queue.Queue API used by the scraper"""
+
+    def __init__(
+        self,
+        weights: dict[str, int] | None = None,
+        *,
+        longest_first: bool = False,
+    ):
+        self.weights = weights
+        self.longest_first = longest_first
+        # in order of priority, when classes are not weighted
+        self._heaps = {klass: [] for klass in weights or (EXPECTED, DISCOVERED)}
+        self._passes = {klass: 0.0 for klass in self._heaps}
+        # pass of the last dispatched item, for classes active again when alone
+        self._virtual_pass = 0.0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def put(self, item, *, klass: str = EXPECTED, depth: int = 0, cost: float = 0):
+        with self._lock:
+            # pass of a class becoming active again is resynchronized on the others
+            # so that it does not monopolize dispatch to catch up, but never set
+            # back so that it does not get more than its share either
+            if self.weights and not self._heaps[klass]:
+                active = [
+                    self._passes[other]
+                    for other, heap in self._heaps.items()
+                    if heap and other != klass
+                ]
+                self._passes[klass] = max(
+                    self._passes[klass], min(active) if active else self._virtual_pass
+                )
+            heapq.heappush(
+                self._heaps[klass],
+                (
+                    depth,
+                    -cost if self.longest_first else 0,
+                    next(self._counter),
+                    item,
+                ),
+            )
+
+    def get(self, block: bool = False):  # noqa: FBT001, FBT002, ARG002
+        """next item to scrape ; never blocks, raises queue.Empty when empty"""
+        with self._lock:
+            candidates = [klass for klass, heap in self._heaps.items() if heap]
+            if not candidates:
+                raise Empty()
+            if not self.weights:
+                klass = candidates[0]
+            else:
+                klass = min(candidates, key=lambda klass: self._passes[klass])
+                self._virtual_pass = self._passes[klass]
+                self._passes[klass] += 1 / self.weights[klass]
+            *_, item = heapq.heappop(self._heaps[klass])
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        with self._lock:
+            return sum(len(heap) for heap in self._heaps.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
@@ -0,0 +1,158 @@
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+from ifixit2zim.blob_store import BlobStore, check_removable_store
+from ifixit2zim.shared import logger
+
+# journal is flushed on every record but only synced to disk periodically
+FSYNC_INTERVAL = 10
+
+
+class JournalState:
+    """Content of a journal, as read back on resume"""
+
+    def __init__(self):
+        # ZIM entries and redirects, in order of addition
+        self.entries = []
+        # (kind, key) => discovered item record
+        self.discovered = {}
+        # (kind, key) => final status of item (ok, missing, error)
+        self.done = {}
+        # source URLs of images whose processing was requested
+        self.images = []
+        # hex digest of image content => path of image in ZIM
+        self.dedup = {}
+        self.written_paths = set()
+
+
+class Journal:
+    """Append-only journal of a run, with a local store of written content
+
+    Records completed and discovered items, deferred images and deduplicated
+    images, as well as every entry and redirect added to the ZIM. Entries content
+    is kept in a content-addressed blobs store next to the journal, so that an
+    interrupted run can be resumed by re-adding already written content to a new
+    ZIM instead of fetching and rendering it again."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.fpath = path / "journal.jsonl"
+        self.blobs = BlobStore(path / "blobs")
+        self._file = None
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+
+    def open(self, *, resume: bool):
+        """open journal for writing, starting from scratch if not resuming"""
+        if not resume and self.path.exists():
+            check_removable_store(self.path, [self.fpath.name])
+            logger.info(f"Removing previous journal at {self.path}")
+            shutil.rmtree(self.path)
+        self.blobs.path.mkdir(parents=True, exist_ok=True)
+        # interrupted run might have left a partial record, start on a new line
+        needs_newline = False
+        if self.fpath.exists() and self.fpath.stat().st_size:
+            with open(self.fpath, "rb") as fh:
+                fh.seek(-1, os.SEEK_END)
+                needs_newline = fh.read(1) != b"\n"
+        self._file = open(self.fpath, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def _append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if not self._file:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+            if time.monotonic() - self._last_sync > FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_sync = time.monotonic()
+
+    def get_blob_path(self, digest: str) -> pathlib.Path:
+        return self.blobs.get_path(digest)
+
+    def record_entry(self, method: str, kwargs: dict, digest: str | None = None):
+        """record an entry (add_item_for) or redirect (add_redirect) added to ZIM
+
+        digest is the sha256 hex digest of entry content, when already known"""
+        if method == "add_redirect":
+            self._append(
+                {
+                    "op": "redirect",
+                    "path": kwargs["path"],
+                    "target_path": kwargs["target_path"],
+                }
+            )
+            return
+        digest = self.blobs.store_entry(kwargs, digest=digest)
+        self._append(
+            {
+                "op": "item",
+                "path": kwargs["path"],
+                "title": kwargs.get("title"),
+                "mimetype": kwargs.get("mimetype"),
+                "is_front": kwargs.get("is_front"),
+                "blob": digest,
+            }
+        )
+
+    def record_discovered(self, kind, item_key, item_data, *, is_expected, depth):
+        self._append(
+            {
+                "op": "discovered",
+                "kind": kind,
+                "key": item_key,
+                "data": item_data,
+                "expected": is_expected,
+                "depth": depth,
+            }
+        )
+
+    def record_done(self, kind, item_key, status):
+        self._append({"op": "done", "kind": kind, "key": item_key, "status": status})
+
+    def record_image(self, url: str):
+        self._append({"op": "image", "url": url})
+
+    def record_dedup(self, digest: bytes, path: str):
+        self._append({"op": "dedup", "digest": digest.hex(), "path": path})
+
+    def read(self) -> JournalState:
+        state = JournalState()
+        if not self.fpath.exists():
+            return state
+        with open(self.fpath, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line might have been partially written on interruption
+                    logger.warning("Ignoring truncated journal record")
+                    continue
+                op = record["op"]
+                if op in ("item", "redirect"):
+                    state.entries.append(record)
+                    state.written_paths.add(record["path"])
+                elif op == "discovered":
+                    state.discovered[(record["kind"], record["key"])] = record
+                elif op == "done":
+                    state.done[(record["kind"], record["key"])] = record["status"]
+                elif op == "image":
+                    state.images.append(record["url"])
+                elif op == "dedup":
+                    state.dedup[bytes.fromhex(record["digest"])] = record["path"]
+        return state
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import pathlib
+import threading
+
+from ifixit2zim.blob_store import BlobStore
+from ifixit2zim.shared import logger
+
+
+class Manifest:
+    """Items of a build with their revision, content hash and rendered output
+
+    For every item successfully rendered, the manifest keeps the revision found in
+    listings (if any), a hash of the fetched content and the side effects of its
+    rendering: discovered items, images, ZIM entries (content kept in a blobs
+    store) and redirects.
+
+    In incremental mode, the manifest of previous build is loaded and items which
+    did not change are not rendered again: their recorded side effects are
+    replayed instead. Items whose listing revision did not change are not even
+    fetched.
+
+    Rendered output also depends on the scraper version, language and items
+    selection ; previous manifest is ignored if any of them changed."""
+
+    def __init__(self, path: pathlib.Path, fingerprint: dict):
+        self.path = path
+        self.fpath = path / "manifest.json"
+        self.blobs = BlobStore(path / "blobs")
+        self.fingerprint = fingerprint
+        self.previous = {}
+        self.current = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, item_key: str) -> str:
+        return f"{kind}/{item_key}"
+
+    @staticmethod
+    def get_content_hash(item_content) -> str:
+        return hashlib.sha256(
+            json.dumps(item_content, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def load(self):
+        """load manifest of previous build, to reuse its unchanged items"""
+        if not self.fpath.exists():
+            logger.info(f"No previous manifest at {self.fpath}, full rebuild")
+            return
+        try:
+            manifest = json.loads(self.fpath.read_text())
+        except Exception as exc:
+            logger.warning(f"Ignoring unreadable manifest {self.fpath}: {exc}")
+            return
+        if manifest.get("fingerprint") != self.fingerprint:
+            logger.warning(
+                "Ignoring previous manifest, built with another version or options"
+            )
+            return
+        self.previous = manifest["items"]
+        logger.info(f"Loaded {len(self.previous)} items from previous manifest")
+
+    def save(self):
+        """save manifest of this build, removing blobs not used anymore"""
+        with self._lock:
+            content = json.dumps(
+                {"fingerprint": self.fingerprint, "items": self.current}
+            )
+            digests = {
+                args[0]["blob"]
+                for record in self.current.values()
+                for operation, *args in record["operations"]
+                if operation == "add_item_for"
+            }
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_fpath = self.fpath.with_suffix(".tmp")
+        tmp_fpath.write_text(content)
+        tmp_fpath.rename(self.fpath)
+        self.blobs.prune(digests)
+        logger.info(f"Saved {len(self.current)} items to manifest {self.fpath}")
+
+    def get_reusable(
+        self,
+        kind: str,
+        item_key: str,
+        *,
+        revision: str | None = None,
+        content_hash: str | None = None,
+    ) -> dict | None:
+        """previous record of item if its revision or content hash did not change"""
+        record = self.previous.get(self._key(kind, item_key))
+        if not record:
+            return None
+        if revision is not None and record["revision"] == revision:
+            return record
+        if content_hash is not None and record["hash"] == content_hash:
+            return record
+        return None
+
+    def record(
+        self,
+        kind: str,
+        item_key: str,
+        *,
+        revision: str | None,
+        content_hash: str | None,
+        operations: list,
+    ):
+        """record an item rendered in this build, with its rendering side effects"""
+        recorded = []
+        for operation, *args in operations:
+            if operation == "add_item_for":
+                kwargs = dict(args[0])
+                kwargs["blob"] = self.blobs.store_entry(kwargs)
+                kwargs.pop("content", None)
+                kwargs.pop("fpath", None)
+                kwargs.pop("delete_fpath", None)
+                recorded.append((operation, kwargs))
+            else:
+                recorded.append((operation, *args))
+        with self._lock:
+            self.current[self._key(kind, item_key)] = {
+                "revision": revision,
+                "hash": content_hash,
+                "operations": recorded,
+            }
+
+    def keep(self, kind: str, item_key: str, record: dict):
+        """carry a reused record of previous build over to this build"""
+        with self._lock:
+            self.current[self._key(kind, item_key)] = record
@@ -0,0 +1,542 @@
+import collections
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+
+from zimscraperlib.zim.creator import Creator
+
+from ifixit2zim.constants import Configuration
+from ifixit2zim.executor import Executor
+from ifixit2zim.journal import Journal
+from ifixit2zim.manifest import Manifest
+from ifixit2zim.render_pool import RenderPool
+from ifixit2zim.shared import logger
+from ifixit2zim.watchdog import Watchdog, WatchedItem
+from ifixit2zim.work_queue import WorkQueue
+
+# item being processed by current worker thread
+_current_item = threading.local()
+
+
+def get_current_item_depth() -> int | None:
+    """discovery depth of the item being rendered in this thread, if any"""
+    return getattr(_current_item, "depth", None)
+
+
+def is_current_item_abandoned() -> bool:
+    """whether item processed in this thread timed out, its results being dropped"""
+    watched = getattr(_current_item, "watched", None)
+    return watched is not None and watched.timed_out
+
+
+@contextmanager
+def paused_item_deadline():
+    """stop deadline clock of item processed in this thread, while it is blocked
+    on a full queue, waiting on other items rather than being stuck"""
+    watched = getattr(_current_item, "watched", None)
+    if watched is None or watched.paused_at is not None:
+        yield
+        return
+    watched.pause()
+    try:
+        yield
+    finally:
+        watched.resume()
+
+
+def record_item_operation(*operation):
+    """record a side effect of the rendering in progress in this thread, if needed
+
+    Operations are ("discover", kind, item_key, item_data, is_expected,
+    warn_unexpected), ("image", url), ("add_item_for", kwargs) and
+    ("add_redirect", kwargs)"""
+    operations = getattr(_current_item, "operations", None)
+    if operations is not None:
+        operations.append(operation)
+
+
+class StageMetrics:
+    """Counters of a pipeline stage, safe to update from any worker"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_task(self, duration: float):
+        with self._lock:
+            self.processed += 1
+            self.busy_seconds += duration
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def record_blocked(self, duration: float):
+        with self._lock:
+            self.blocked_seconds += duration
+
+    def __str__(self):
+        average = self.busy_seconds / self.processed if self.processed else 0
+        return (
+            f"{self.name}: {self.processed} tasks, {self.failed} failed, "
+            f"{self.busy_seconds:.1f}s busy (avg {average:.3f}s), "
+            f"{self.blocked_seconds:.1f}s blocked on full queue"
+        )
+
+
+class Stage:
+    """One step of the pipeline: a bounded queue and its dedicated workers"""
+
+    def __init__(self, name: str, queue_size: int, nb_workers: int):
+        self.name = name
+        self.executor = Executor(
+            queue_size=queue_size,
+            nb_workers=nb_workers,
+            prefix=f"{name.upper()}-T-",
+        )
+        self.metrics = StageMetrics(name)
+
+    def start(self):
+        self.executor.start()
+
+    def submit(self, task: Callable, **kwargs):
+        """Queue task for this stage, blocking while the stage queue is full"""
+        before = time.monotonic()
+        with paused_item_deadline():
+            self.executor.submit(self._run, func=task, func_kwargs=kwargs, raises=True)
+        self.metrics.record_blocked(time.monotonic() - before)
+
+    def _run(self, func: Callable, func_kwargs: dict):
+        before = time.monotonic()
+        try:
+            func(**func_kwargs)
+        except Exception:
+            self.metrics.record_failure()
+            raise
+        finally:
+            self.metrics.record_task(time.monotonic() - before)
+
+
+class Pipeline:
+    """Staged fetch → render → write processing of scraper items
+
+    - fetch: retrieves item content online (network bound)
+    - render: checks and renders item content with Jinja (CPU bound)
+    - write: adds rendered entries and redirects to the ZIM (under global lock)
+
+    Each stage has its own workers and a bounded queue, so network, CPU and ZIM
+    write overlap while a slow stage applies backpressure to the previous one,
+    keeping the number of payloads held in memory bounded."""
+
+    def __init__(
+        self,
+        lock: threading.Lock,
+        creator: Creator,
+        configuration: Configuration,
+        render_pool: RenderPool | None = None,
+        journal: Journal | None = None,
+        manifest: Manifest | None = None,
+        work_queue: WorkQueue | None = None,
+    ):
+        self.lock = lock
+        self.creator = creator
+        self.configuration = configuration
+        self.render_pool = render_pool
+        self.journal = journal
+        self.manifest = manifest
+        self.work_queue = work_queue
+        # all scrapers by kind, to replay discoveries of reused items
+        self.scrapers = {}
+        # paths already written to the ZIM from journal of an interrupted run
+        self.restored_paths = set()
+        # paths written so far, for error redirects of timed out items (only kept
+        # when items have a deadline)
+        self.written_paths = set()
+
+        self.fetch = Stage(
+            "fetch",
+            queue_size=configuration.pipeline_queue_size,
+            nb_workers=configuration.fetch_workers,
+        )
+        self.render = Stage(
+            "render",
+            queue_size=configuration.pipeline_queue_size,
+            nb_workers=configuration.render_workers,
+        )
+        # libzim creator is not meant to be fed concurrently, one writer is enough
+        self.write = Stage(
+            "write",
+            queue_size=configuration.pipeline_queue_size * 4,
+            nb_workers=1,
+        )
+        self.stages = [self.fetch, self.render, self.write]
+
+        self.watchdog = (
+            Watchdog(configuration.item_timeout, on_timeout=self._item_timed_out)
+            if configuration.item_timeout
+            else None
+        )
+
+        self._in_flight = 0
+        self._in_flight_by_kind = collections.Counter()
+        self._in_flight_cond = threading.Condition()
+        # first failure of the scraping itself, stages failures are consequences
+        self._failure = None
+        # first write failure of items still in flight, by (kind, item_key)
+        self._write_failures = {}
+        # items reused from manifest, from several fetch workers
+        self.nb_reused = 0
+        self._nb_reused_lock = threading.Lock()
+
+    def start(self, scrapers):
+        self.scrapers = {scraper.get_items_name(): scraper for scraper in scrapers}
+        for stage in self.stages:
+            stage.start()
+        if self.watchdog:
+            self.watchdog.start()
+
+    @property
+    def in_flight(self) -> int:
+        """number of items submitted and not yet rendered"""
+        return self._in_flight
+
+    def in_flight_of(self, kind: str) -> int:
+        """number of items of a kind submitted and not yet rendered"""
+        return self._in_flight_by_kind[kind]
+
+    @property
+    def exception(self) -> Exception | None:
+        """fatal exception raised in any stage, if any"""
+        if self._failure:
+            return self._failure
+        for stage in self.stages:
+            if stage.executor.exception:
+                return stage.executor.exception
+        return None
+
+    def raise_if_failed(self):
+        if exc := self.exception:
+            raise exc
+
+    def wait_for_progress(self, timeout: float = 1.0):
+        """block until an in-flight item completes or timeout expires"""
+        with self._in_flight_cond:
+            if self._in_flight:
+                self._in_flight_cond.wait(timeout=timeout)
+
+    def submit_item(self, scraper, item_key, item_data, depth=0):
+        """push an item through the pipeline, blocking if fetch stage is full"""
+        with self._in_flight_cond:
+            self._in_flight += 1
+            self._in_flight_by_kind[scraper.get_items_name()] += 1
+        try:
+            self.fetch.submit(
+                self._fetch_item,
+                scraper=scraper,
+                item_key=item_key,
+                item_data=item_data,
+                depth=depth,
+            )
+        except Exception:
+            self._item_done(scraper, item_key, status=None)
+            self.raise_if_failed()
+            raise
+
+    def _item_done(self, scraper, item_key, status, *, in_write_stage=False):
+        if self.journal and status:
+            if in_write_stage:
+                self.journal.record_done(
+                    kind=scraper.get_items_name(), item_key=item_key, status=status
+                )
+            else:
+                # through write stage so that it is recorded after item entries
+                self.write.submit(
+                    self.journal.record_done,
+                    kind=scraper.get_items_name(),
+                    item_key=item_key,
+                    status=status,
+                )
+        if self.work_queue and status:
+            self.work_queue.complete(scraper.get_items_name(), item_key, status)
+        with self._in_flight_cond:
+            self._in_flight -= 1
+            self._in_flight_by_kind[scraper.get_items_name()] -= 1
+            self._in_flight_cond.notify_all()
+        # a worker process only knows the items it discovered itself, thresholds
+        # are checked by the main process once the work queue is drained
+        if status and not self.work_queue:
+            try:
+                scraper.check_items_thresholds()
+            except Exception as exc:
+                self._failure = self._failure or exc
+                raise
+
+    def _fetch_item(self, scraper, item_key, item_data, depth):
+        revision = None
+        if self.manifest:
+            revision = scraper.get_item_revision(item_key, item_data)
+            record = self.manifest.get_reusable(
+                scraper.get_items_name(), item_key, revision=revision
+            )
+            if record:
+                self._reuse_item(scraper, item_key, item_data, record, depth)
+                return
+        watched = self._watch(scraper, item_key, item_data, self.fetch)
+        try:
+            item_content = scraper.fetch_one_item(item_key, item_data)
+        except Exception as exc:
+            if not self._unwatch(watched):
+                return
+            if scraper.retry_later(item_key, item_data, depth, exc):
+                self._item_done(scraper, item_key, status=None)
+                return
+            scraper.add_item_error(item_key, item_data, exc)
+            self._item_done(scraper, item_key, status="error")
+            return
+        if not self._unwatch(watched):
+            return
+        if item_content is None:
+            self._item_done(scraper, item_key, status="missing")
+            return
+        content_hash = None
+        if self.manifest:
+            # computed before rendering, which might alter content
+            content_hash = scraper.get_item_content_hash(
+                item_key, item_data, item_content
+            )
+            record = self.manifest.get_reusable(
+                scraper.get_items_name(), item_key, content_hash=content_hash
+            )
+            if record:
+                self._reuse_item(scraper, item_key, item_data, record, depth)
+                return
+        self.render.submit(
+            self._render_item,
+            scraper=scraper,
+            item_key=item_key,
+            item_data=item_data,
+            item_content=item_content,
+            depth=depth,
+            revision=revision,
+            content_hash=content_hash,
+        )
+
+    def _item_written(self, scraper, item_key, item_data, status):
+        """complete an item once its entries went through write stage
+
+        Item is an error if any of its entries failed to be written"""
+        exc = self._write_failures.pop((scraper.get_items_name(), item_key), None)
+        if exc and status == "ok":
+            status = "error"
+            # error redirect is written right away, this is the write stage
+            _current_item.writing = True
+            try:
+                scraper.add_item_error(item_key, item_data, exc)
+            finally:
+                _current_item.writing = False
+        self._item_done(scraper, item_key, status=status, in_write_stage=True)
+
+    def _finish_item(self, scraper, item_key, item_data, status):
+        """complete item after its queued entries are written (single writer)"""
+        self.write.submit(
+            self._item_written,
+            scraper=scraper,
+            item_key=item_key,
+            item_data=item_data,
+            status=status,
+        )
+
+    def _render_item(
+        self, scraper, item_key, item_data, item_content, depth, revision, content_hash
+    ):
+        _current_item.depth = depth
+        _current_item.key = (scraper.get_items_name(), item_key)
+        if self.manifest:
+            _current_item.operations = []
+        watched = self._watch(scraper, item_key, item_data, self.render)
+        status = "ok"
+        try:
+            if self.render_pool and self.render_pool.handles(scraper):
+                self.render_pool.render_one_item(
+                    scraper, item_key, item_data, item_content
+                )
+            else:
+                scraper.render_one_item(item_key, item_data, item_content)
+            if self.manifest and not is_current_item_abandoned():
+                self.manifest.record(
+                    scraper.get_items_name(),
+                    item_key,
+                    revision=revision,
+                    content_hash=content_hash,
+                    operations=_current_item.operations,
+                )
+        except Exception as exc:
+            status = "error"
+            scraper.add_item_error(item_key, item_data, exc)
+        finally:
+            _current_item.depth = None
+            _current_item.key = None
+            _current_item.operations = None
+            if self._unwatch(watched):
+                self._finish_item(scraper, item_key, item_data, status)
+
+    def _watch(self, scraper, item_key, item_data, stage) -> WatchedItem | None:
+        if not self.watchdog:
+            return None
+        _current_item.watched = self.watchdog.watch(scraper, item_key, item_data, stage)
+        return _current_item.watched
+
+    def _unwatch(self, watched: WatchedItem | None) -> bool:
+        """stop watching item, returning whether it completed within deadline"""
+        if watched is None:
+            return True
+        _current_item.watched = None
+        return self.watchdog.unwatch(watched)
+
+    def _item_timed_out(self, watched: WatchedItem, stack: str):
+        """mark an item past deadline as error, replacing its stuck worker"""
+        scraper = watched.scraper
+        logger.error(
+            f"{scraper.get_items_name()} {watched.item_key} timed out after "
+            f"{self.watchdog.timeout}s in {watched.stage.name} stage, "
+            f"{watched.thread.name} stack:\n{stack}"
+        )
+        watched.stage.executor.replace_worker(watched.thread)
+        # item page might have been written before its worker got stuck
+        _current_item.unless_written = True
+        try:
+            scraper.add_item_error(
+                watched.item_key,
+                watched.item_data,
+                TimeoutError(f"Processing exceeded {self.watchdog.timeout}s"),
+            )
+        finally:
+            _current_item.unless_written = False
+        try:
+            self._item_done(scraper, watched.item_key, status="error")
+        except Exception:  # noqa: S110
+            pass  # too many errors, kept as pipeline failure
+
+    def _reuse_item(self, scraper, item_key, item_data, record, depth):
+        """replay side effects of the rendering of an unchanged item"""
+        logger.debug(f"Reusing {scraper.get_items_name()} {item_key} from manifest")
+        _current_item.depth = depth
+        _current_item.key = (scraper.get_items_name(), item_key)
+        status = "ok"
+        try:
+            for operation, *args in record["operations"]:
+                if operation == "discover":
+                    kind, key, data, is_expected, warn_unexpected = args
+                    self.scrapers[kind].add_item_to_scrape(
+                        key, data, is_expected, warn_unexpected=warn_unexpected
+                    )
+                elif operation == "image":
+                    scraper.processor.imager.defer(*args)
+                elif operation == "add_item_for":
+                    kwargs = dict(args[0])
+                    kwargs["fpath"] = str(
+                        self.manifest.blobs.get_path(kwargs.pop("blob"))
+                    )
+                    self.add_item_for(**kwargs)
+                elif operation == "add_redirect":
+                    self.add_redirect(**args[0])
+            self.manifest.keep(scraper.get_items_name(), item_key, record)
+            with self._nb_reused_lock:
+                self.nb_reused += 1
+        except Exception as exc:
+            status = "error"
+            scraper.add_item_error(item_key, item_data, exc)
+        finally:
+            _current_item.depth = None
+            _current_item.key = None
+            self._finish_item(scraper, item_key, item_data, status)
+
+    def add_item_for(self, **kwargs):
+        """queue an entry for addition to the ZIM (creator.add_item_for kwargs)"""
+        if is_current_item_abandoned():
+            logger.debug(f"Not writing {kwargs['path']}, item timed out")
+            return
+        record_item_operation("add_item_for", kwargs)
+        self._submit_write("add_item_for", kwargs)
+
+    def add_redirect(self, **kwargs):
+        """queue a redirect for addition to the ZIM (creator.add_redirect kwargs)"""
+        if is_current_item_abandoned():
+            logger.debug(f"Not writing {kwargs['path']}, item timed out")
+            return
+        record_item_operation("add_redirect", kwargs)
+        self._submit_write("add_redirect", kwargs)
+
+    def _submit_write(self, method: str, kwargs: dict):
+        item = getattr(_current_item, "key", None)
+        unless_written = getattr(_current_item, "unless_written", False)
+        if getattr(_current_item, "writing", False):
+            # queuing from the single writer would deadlock on a full queue
+            self._write(
+                method=method, kwargs=kwargs, item=item, unless_written=unless_written
+            )
+            return
+        self.write.submit(
+            self._write,
+            method=method,
+            kwargs=kwargs,
+            item=item,
+            unless_written=unless_written,
+        )
+
+    def _write(
+        self,
+        method: str,
+        kwargs: dict,
+        item: tuple[str, str] | None,
+        *,
+        unless_written: bool = False,
+    ):
+        if kwargs["path"] in self.restored_paths:
+            logger.debug(f"Not writing {kwargs['path']}, restored from journal")
+            return
+        if unless_written and kwargs["path"] in self.written_paths:
+            logger.debug(f"Not writing {kwargs['path']}, already written")
+            return
+        try:
+            with self.lock:
+                getattr(self.creator, method)(**kwargs)
+        except Exception as exc:
+            # not fatal to the whole run, as it was when writing from scrapers
+            logger.error(f"Failed to write {kwargs.get('path')} to ZIM", exc_info=exc)
+            self.write.metrics.record_failure()
+            if item:
+                # reported to the item once all its entries went through
+                self._write_failures.setdefault(item, exc)
+            return
+        if self.watchdog:
+            self.written_paths.add(kwargs["path"])
+        if self.journal:
+            self.journal.record_entry(method, kwargs)
+
+    def shutdown(self, *, wait=True):
+        """stop all stages, in pipeline order so that queued writes are flushed"""
+        if self.watchdog:
+            self.watchdog.stop()
+        for stage in self.stages:
+            stage.executor.shutdown(wait=wait)
+            if stage is self.render and self.render_pool:
+                self.render_pool.shutdown(wait=wait)
+
+    @property
+    def nb_timed_out(self) -> int:
+        return self.watchdog.nb_timed_out if self.watchdog else 0
+
+    def get_stats(self) -> list[str]:
+        stats = [str(stage.metrics) for stage in self.stages]
+        if self.watchdog:
+            stats.append(
+                f"watchdog: {self.watchdog.nb_timed_out} items timed out "
+                f"(deadline {self.watchdog.timeout}s)"
+            )
+        return stats
@@ -1,10 +1,8 @@
 import datetime
 import re
-import threading
 import urllib.parse
 
 import requests
-from zimscraperlib.zim.creator import Creator
 
 from ifixit2zim.constants import (
     DEFAULT_DEVICE_IMAGE_URL,
@@ -16,6 +14,7 @@ from ifixit2zim.constants import (
 )
 from ifixit2zim.exceptions import ImageUrlNotFoundError
 from ifixit2zim.imager import Imager
+from ifixit2zim.pipeline import Pipeline
 from ifixit2zim.scraper import Configuration
 from ifixit2zim.shared import logger, setlocale
 
@@ -23,17 +22,15 @@ from ifixit2zim.shared import logger, setlocale
 class Processor:
     def __init__(
         self,
-        lock: threading.Lock,
         configuration: Configuration,
-        creator: Creator,
+        pipeline: Pipeline,
         imager: Imager,
     ) -> None:
         self.null_categories = set()
         self.ifixit_external_content = set()
         self.final_hrefs = {}
-        self.lock = lock
         self.configuration = configuration
-        self.creator = creator
+        self.pipeline = pipeline
         self.imager = imager
 
     @property
@@ -44,6 +41,14 @@ class Processor:
     def get_guide_link_from_props(self, get_guide_link_from_props):
         self._get_guide_link_from_props = get_guide_link_from_props
 
+    @property
+    def register_guides(self):
+        return self._register_guides
+
+    @register_guides.setter
+    def register_guides(self, register_guides):
+        self._register_guides = register_guides
+
     @property
     def get_category_link_from_props(self):
         return self._get_category_link_from_props
@@ -273,6 +278,13 @@ class Processor:
         logger.debug(f"Result is {final_href}")
         return final_href
 
+    def get_known_href(self, href, canonical_href):
+        """normalized href if already known, else canonical one, without network
+
+        Used for redirects of items not scraped, built once out of time ; the
+        canonical href is built from item data the way iFixit builds its urls"""
+        return self.final_hrefs.get(href, canonical_href)
+
     def _process_href_regex(self, href, rel_prefix):
         if href.startswith("/"):
             href = self.configuration.main_url.geturl() + href
@@ -360,24 +372,25 @@ class Processor:
     def convert_title_to_filename(self, title):
         return re.sub(r"\s", "_", title)
 
+    def convert_title_to_slug(self, title):
+        return re.sub(r"\s+", "+", title.strip())
+
     def add_html_item(self, path, title, content, *, is_front=True):
-        with self.lock:
-            logger.debug(f"Adding item in ZIM at path '{path}'")
-            self.creator.add_item_for(
-                path=path,
-                title=title,
-                content=content,
-                mimetype="text/html",
-                is_front=is_front,
-            )
+        logger.debug(f"Adding item in ZIM at path '{path}'")
+        self.pipeline.add_item_for(
+            path=path,
+            title=title,
+            content=content,
+            mimetype="text/html",
+            is_front=is_front,
+        )
 
     def add_redirect(self, path, target_path):
-        with self.lock:
-            logger.debug(f"Adding redirect in ZIM from '{path}' to '{target_path}'")
-            self.creator.add_redirect(
-                path=path,
-                target_path=target_path,
-            )
+        logger.debug(f"Adding redirect in ZIM from '{path}' to '{target_path}'")
+        self.pipeline.add_redirect(
+            path=path,
+            target_path=target_path,
+        )
 
     def get_item_comments_count(self, item):
         if "comments" not in item:
@@ -0,0 +1,204 @@
+import gc
+import multiprocessing
+import multiprocessing.pool
+import pathlib
+from functools import partial
+
+from ifixit2zim.shared import logger
+from ifixit2zim.work_queue import SqliteStore
+
+# kind of items whose rendering is heavy enough to be worth a round-trip to a worker
+RENDER_POOL_KINDS = ("guide", "category")
+
+# scrapers methods updating their state while rendering, replayed in the parent
+REPLAYED_METHODS = {
+    "guide": ["_register_guide_locale"],
+    "user": ["_set_user_title"],
+}
+
+# scrapers (and through them Jinja environment and filters) inherited by workers
+_scrapers = {}
+# side effects of the rendering in progress in this worker process
+_operations = []
+# normalized hrefs shared by all workers
+_final_hrefs = None
+
+
+class FinalHrefsStore(SqliteStore):
+    """Hrefs normalized by any render worker, sparing the others a request"""
+
+    schema = """
+CREATE TABLE IF NOT EXISTS hrefs (href TEXT PRIMARY KEY, final_href TEXT NOT NULL);
+"""
+
+    def get(self, href: str) -> str | None:
+        row = self.conn.execute(
+            "SELECT final_href FROM hrefs WHERE href = ?", (href,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, href: str, final_href: str):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO hrefs VALUES (?, ?)", (href, final_href)
+        )
+
+
+def _record(*operation):
+    _operations.append(operation)
+
+
+def _record_discovery(kind, item_key, item_data, is_expected, *, warn_unexpected=True):
+    _record("discover", kind, item_key, item_data, is_expected, warn_unexpected)
+
+
+def _record_write(method, **kwargs):
+    _record(method, kwargs)
+
+
+def _record_image(imager, url):
+    _record("image", url)
+    _, path = imager.get_parsed_url_and_path(url)
+    return path
+
+
+def _record_call(kind, name, method, *args):
+    method(*args)
+    _record("call", kind, name, args)
+
+
+def _normalize_href(processor, normalize_href, href):
+    if href not in processor.final_hrefs:
+        final_href = _final_hrefs.get(href)
+        if final_href is None:
+            final_href = normalize_href(href)
+            _final_hrefs.put(href, final_href)
+            _record("final_href", href, final_href)
+        processor.final_hrefs[href] = final_href
+    return processor.final_hrefs[href]
+
+
+def _init_worker():
+    """Divert all side effects of rendering so that they are shipped to the parent
+
+    Discovered items, images and ZIM entries are recorded instead of being
+    queued in this process, since queues, image registry and creator live in
+    the parent. Updates of scrapers state (titles and locales of items, hrefs
+    normalization) are applied here and recorded to be replayed in the parent ;
+    normalized hrefs are also shared with other workers."""
+    for kind, scraper in _scrapers.items():
+        scraper.add_item_to_scrape = partial(_record_discovery, kind)
+        for name in REPLAYED_METHODS.get(kind, []):
+            setattr(
+                scraper, name, partial(_record_call, kind, name, getattr(scraper, name))
+            )
+    scraper = next(iter(_scrapers.values()))
+    processor = scraper.processor
+    processor.normalize_href = partial(
+        _normalize_href, processor, processor.normalize_href
+    )
+    imager = scraper.processor.imager
+    imager.defer = partial(_record_image, imager)
+    scraper.pipeline.add_item_for = partial(_record_write, "add_item_for")
+    scraper.pipeline.add_redirect = partial(_record_write, "add_redirect")
+
+
+def _render_in_worker(kind, item_key, item_data, item_content):
+    _operations.clear()
+    scraper = _scrapers[kind]
+    scraper.processor.ifixit_external_content.clear()
+    scraper.render_one_item(item_key, item_data, item_content)
+    return (
+        list(_operations),
+        set(scraper.processor.ifixit_external_content),
+    )
+
+
+class RenderPool:
+    """Optional pool of processes rendering guides and categories
+
+    Rendering with Jinja is pure-Python CPU work, bound by the GIL when done in
+    threads. Workers are forked once scrapers are fully set up, so that they
+    inherit the Jinja environment, templates and filters ; objects are frozen
+    (gc.freeze) before forking to keep memory shared copy-on-write.
+
+    Payloads are shipped to workers, which send back the list of side effects of
+    the rendering (discovered items, images, ZIM entries and redirects, scrapers
+    state updates) which are then replayed in the parent, where queues and image
+    registry live.
+
+    State replayed in the parent:
+    - discovered items (`add_item_to_scrape` of any scraper, with `item_seen`
+      state such as `ScraperUser.user_id_to_titles`)
+    - images (`imager.defer`), ZIM entries and redirects (pipeline writes)
+    - guides locales and titles (`ScraperGuide.guides_locales`, expected items
+      data), through `_register_guide_locale`
+    - users titles (expected items data), through `_set_user_title`
+    - normalized hrefs (`processor.final_hrefs`)
+    - iFixit external content urls (`processor.ifixit_external_content`)
+
+    Other state is not updated while rendering: `processor.null_categories` is
+    filled when fetching categories, which is done in the parent."""
+
+    def __init__(self, nb_processes: int, final_hrefs_path: pathlib.Path):
+        self.nb_processes = nb_processes
+        self.final_hrefs = FinalHrefsStore(final_hrefs_path)
+        self.pool: multiprocessing.pool.Pool | None = None
+        self.scrapers = {}
+
+    def handles(self, scraper) -> bool:
+        return self.pool is not None and scraper.get_items_name() in RENDER_POOL_KINDS
+
+    def start(self, scrapers):
+        """fork the workers, must be called before any thread is started"""
+        global _scrapers, _final_hrefs  # noqa: PLW0603
+        self.scrapers = {scraper.get_items_name(): scraper for scraper in scrapers}
+        _scrapers = self.scrapers
+        self.final_hrefs.create()
+        _final_hrefs = self.final_hrefs
+
+        logger.info(f"Starting {self.nb_processes} rendering processes")
+        gc.collect()
+        gc.freeze()
+        try:
+            self.pool = multiprocessing.get_context("fork").Pool(
+                processes=self.nb_processes, initializer=_init_worker
+            )
+        finally:
+            gc.unfreeze()
+
+    def render_one_item(self, scraper, item_key, item_data, item_content):
+        """render item in a worker and replay its side effects in this process"""
+        if self.pool is None:
+            raise Exception("Render pool is not started")
+        operations, external_content = self.pool.apply(
+            _render_in_worker,
+            (scraper.get_items_name(), item_key, item_data, item_content),
+        )
+        scraper.processor.ifixit_external_content.update(external_content)
+        for operation, *args in operations:
+            if operation == "discover":
+                kind, key, data, is_expected, warn_unexpected = args
+                self.scrapers[kind].add_item_to_scrape(
+                    key, data, is_expected, warn_unexpected=warn_unexpected
+                )
+            elif operation == "image":
+                scraper.processor.imager.defer(*args)
+            elif operation == "add_item_for":
+                scraper.pipeline.add_item_for(**args[0])
+            elif operation == "add_redirect":
+                scraper.pipeline.add_redirect(**args[0])
+            elif operation == "call":
+                kind, name, call_args = args
+                getattr(self.scrapers[kind], name)(*call_args)
+            elif operation == "final_href":
+                href, final_href = args
+                scraper.processor.final_hrefs.setdefault(href, final_href)
+
+    def shutdown(self, *, wait=True):
+        if self.pool is None:
+            return
+        if wait:
+            self.pool.close()
+        else:
+            self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,73 @@
+import contextlib
+import threading
+import time
+
+from kiwixstorage import KiwixStorage, NotFoundError
+
+
+class S3RequestMetrics:
+    """Latency of one kind of S3 request, safe to update from any thread"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration: float, *, failed: bool):
+        with self._lock:
+            self.requests += 1
+            self.failed += failed
+            self.total_seconds += duration
+            self.max_seconds = max(self.max_seconds, duration)
+
+    def __str__(self):
+        average = self.total_seconds / self.requests if self.requests else 0
+        return (
+            f"{self.name}: {self.requests} requests, {self.failed} failed, "
+            f"avg {average:.3f}s, max {self.max_seconds:.3f}s"
+        )
+
+
+class S3Clients:
+    """S3 cache clients, created once per thread and reused for all images
+
+    KiwixStorage relies on boto3 resources, which are not thread-safe: each
+    thread gets its own, keeping its pool of connections for the whole run."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.metrics = {name: S3RequestMetrics(name) for name in ("download", "upload")}
+        self._local = threading.local()
+        # boto3 default session is not thread-safe either
+        self._lock = threading.Lock()
+
+    def get(self) -> KiwixStorage:
+        """S3 storage of current thread"""
+        if getattr(self._local, "storage", None) is None:
+            with self._lock:
+                self._local.storage = KiwixStorage(self.url)
+                # create boto3 resource and client while holding the lock
+                self._local.storage.client  # noqa: B018
+        return self._local.storage
+
+    @contextlib.contextmanager
+    def timed(self, name: str):
+        """record latency of the request made within the block"""
+        started = time.monotonic()
+        failed = False
+        try:
+            yield
+        except NotFoundError:
+            # a cache miss is a successful request
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.metrics[name].record(time.monotonic() - started, failed=failed)
+
+    def get_stats(self) -> list[str]:
+        return [str(metrics) for metrics in self.metrics.values()]
@@ -0,0 +1,99 @@
+import json
+import pathlib
+import threading
+
+from kiwixstorage import KiwixStorage
+
+from ifixit2zim.shared import logger
+from ifixit2zim.work_queue import SqliteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    size INTEGER,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS flags (name TEXT PRIMARY KEY);
+"""
+
+
+class S3Manifest(SqliteStore):
+    """Local list of the objects of the S3 cache bucket
+
+    The bucket prefix is listed once, in background, so that images not in the
+    cache are known without a request to S3 for each of them. Listings do not
+    include objects metadata: it is only known for objects uploaded by this run,
+    others still being downloaded with a metadata check.
+
+    Until listing is complete, every object might be in the bucket."""
+
+    schema = SCHEMA
+
+    def __init__(self, fpath: pathlib.Path, prefix: str):
+        super().__init__(fpath)
+        self.prefix = prefix
+        self._thread = None
+
+    def create(self):
+        super().create()
+        # build dir might be kept from a previous run, bucket has changed since
+        self.conn.executescript("DELETE FROM objects; DELETE FROM flags;")
+
+    def start(self, s3_storage: KiwixStorage):
+        """list bucket prefix in a background thread"""
+        self._thread = threading.Thread(
+            target=self._list, args=(s3_storage,), name="S3-MANIFEST-T"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _list(self, s3_storage: KiwixStorage):
+        logger.info(f"Listing S3 cache objects under {self.prefix}")
+        nb_objects = 0
+        try:
+            paginator = s3_storage.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(
+                Bucket=s3_storage.bucket_name, Prefix=self.prefix
+            ):
+                objects = page.get("Contents", [])
+                # objects uploaded meanwhile are already known with their metadata
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO objects (key, size) VALUES (?, ?)",
+                        [(obj["Key"], obj["Size"]) for obj in objects],
+                    )
+                nb_objects += len(objects)
+            self.conn.execute("INSERT OR IGNORE INTO flags VALUES ('listed')")
+        except Exception as exc:
+            logger.error(
+                "Failed to list S3 cache, probing it for every image", exc_info=exc
+            )
+            return
+        logger.info(f"{nb_objects} objects found in S3 cache")
+
+    def is_listed(self) -> bool:
+        return bool(
+            self.conn.execute("SELECT 1 FROM flags WHERE name = 'listed'").fetchone()
+        )
+
+    def may_match(self, key: str, meta: dict) -> bool:
+        """whether an object with these metadata might be in the bucket at key
+
+        Metadata not in meta are not compared"""
+        row = self.conn.execute(
+            "SELECT meta FROM objects WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return not self.is_listed()
+        if row[0] is None:
+            return True
+        recorded = json.loads(row[0])
+        return all(recorded.get(name) == value for name, value in meta.items())
+
+    def record(self, key: str, size: int, meta: dict):
+        """record an object uploaded to the bucket"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+            (key, size, json.dumps(meta)),
+        )
@@ -0,0 +1,58 @@
+from ifixit2zim.executor import Executor
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.s3_clients import S3Clients
+from ifixit2zim.s3_manifest import S3Manifest
+from ifixit2zim.shared import logger
+
+
+class S3Uploader:
+    """Uploads of optimized images to S3 cache, in background threads
+
+    Images threads hand images over and move on to the next one, so that their
+    throughput does not depend on S3 write latency. The spool of images waiting
+    for upload is bounded: images threads block once it is full."""
+
+    def __init__(
+        self,
+        s3_clients: S3Clients,
+        s3_manifest: S3Manifest | None,
+        nb_workers: int,
+        spool_size: int,
+    ):
+        self.s3_clients = s3_clients
+        self.s3_manifest = s3_manifest
+        self.executor = Executor(
+            queue_size=spool_size, nb_workers=nb_workers, prefix="S3-UP-T-"
+        )
+
+    def start(self):
+        self.executor.start()
+
+    def upload(self, key: str, content: ImageBuffer, meta: dict):
+        """request upload of an image, returning once it is spooled"""
+        # kept until uploaded
+        content.retain()
+        self.executor.submit(self._upload, key=key, content=content, meta=meta)
+
+    def _upload(self, key: str, content: ImageBuffer, meta: dict):
+        logger.debug(f"Uploading {key} to S3 with {meta}")
+        try:
+            with self.s3_clients.timed("upload"), content.open() as fileobj:
+                self.s3_clients.get().upload_fileobj(
+                    fileobj=fileobj, key=key, meta=meta
+                )
+        except Exception as exc:
+            logger.error(f"{key} failed to upload to cache", exc_info=exc)
+            return
+        finally:
+            content.release()
+        if self.s3_manifest:
+            self.s3_manifest.record(key, content.size, meta)
+
+    @property
+    def nb_failed(self) -> int:
+        return self.s3_clients.metrics["upload"].failed
+
+    def shutdown(self, *, wait=True):
+        """stop uploader, awaiting spooled uploads unless not waiting"""
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,29 @@
+import hashlib
+
+
+class Sampler:
+    """Seeded selection of a representative fraction of items to scrape
+
+    Expected items of every kind are sampled independently of other kinds, each
+    one being kept with probability `fraction` based on a hash of the seed and of
+    the item kind and key: the same items are selected whatever the listing order
+    or the process dispatching them, and a different seed gives another sample.
+
+    Items discovered through links of sampled items are kept up to `max_depth`
+    levels below them, so that a sample has the same mix of heavy and light items
+    as a full run without following the whole links graph."""
+
+    def __init__(self, fraction: float, seed: int, max_depth: int):
+        self.fraction = fraction
+        self.seed = seed
+        self.max_depth = max_depth
+
+    def get_draw(self, kind: str, item_key: str) -> float:
+        """pseudo-random number in [0, 1) drawn for an item"""
+        digest = hashlib.sha256(f"{self.seed}/{kind}/{item_key}".encode()).digest()
+        return int.from_bytes(digest[:8], "big") / 2**64
+
+    def is_sampled(self, kind: str, item_key: str, depth: int) -> bool:
+        if depth > 0:
+            return depth <= self.max_depth
+        return self.get_draw(kind, item_key) < self.fraction
@@ -0,0 +1,359 @@
+import threading
+import time
+from queue import Empty
+
+from schedule import run_pending
+
+from ifixit2zim.constants import Configuration
+from ifixit2zim.executor import Executor
+from ifixit2zim.pipeline import Pipeline
+from ifixit2zim.sampling import Sampler
+from ifixit2zim.scraper_generic import FIRST_ITEMS_COUNT, ScraperGeneric
+from ifixit2zim.shared import logger
+from ifixit2zim.work_queue import SKIPPED, WorkQueue
+
+# delay before checking again a drained work queue, other processes might fill it
+WORK_QUEUE_POLL_INTERVAL = 0.5
+# delay before checking again drained queues while listings are still running
+LISTINGS_POLL_INTERVAL = 0.1
+
+
+def get_sampler(configuration: Configuration) -> Sampler | None:
+    if not configuration.sample_fraction:
+        return None
+    return Sampler(
+        fraction=configuration.sample_fraction,
+        seed=configuration.sample_seed,
+        max_depth=configuration.sample_max_depth,
+    )
+
+
+def is_sampled(sampler: Sampler | None, scraper: ScraperGeneric, item: dict) -> bool:
+    """whether item is to be scraped, all of them being when not sampling"""
+    if sampler is None or scraper.required_for_zim:
+        return True
+    return sampler.is_sampled(scraper.get_items_name(), item["key"], item["depth"])
+
+
+class Listings:
+    """Listing of expected items of all scrapers, in background threads
+
+    Items are queued as soon as a listing page is retrieved, so that scraping
+    starts right away instead of waiting for all listings (e.g. the whole /guides
+    pagination) to complete."""
+
+    def __init__(self, scrapers: list[ScraperGeneric]):
+        self.scrapers = scrapers
+        self.executor = Executor(
+            queue_size=len(scrapers),
+            nb_workers=len(scrapers),
+            prefix="LISTING-T-",
+        )
+        self._pending = {scraper.get_items_name() for scraper in scrapers}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.executor.start()
+        for scraper in self.scrapers:
+            self.executor.submit(self._list, scraper=scraper, raises=True)
+
+    def _list(self, scraper: ScraperGeneric):
+        try:
+            scraper.build_expected_items()
+        finally:
+            with self._lock:
+                self._pending.discard(scraper.get_items_name())
+
+    @property
+    def done(self) -> bool:
+        """whether all listings are complete"""
+        return not self._pending
+
+    def is_done(self, kind: str) -> bool:
+        """whether listing of a kind of items is complete"""
+        return kind not in self._pending
+
+    def raise_if_failed(self):
+        if exc := self.executor.exception:
+            raise exc
+
+    def cancel(self):
+        """request listings still running to stop, items listed so far are kept"""
+        for scraper in self.scrapers:
+            scraper.listing_cancelled.set()
+
+    def shutdown(self, *, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class Scheduler:
+    """Dispatch items of all scrapers into the pipeline, with fair-share weights
+
+    Every scraper has a virtual "pass" which advances by 1/weight each time one of
+    its items is dispatched ; the scraper with work and the lowest pass goes next.
+    A scraper whose queue was empty is resynchronized on the others when it gets
+    new items so that it does not take over the pipeline to catch up.
+
+    Scraping is over once listings are complete, all queues are drained, no
+    failed item awaits a retry and nothing is in flight anymore (items being
+    processed might still discover new ones)."""
+
+    def __init__(
+        self,
+        scrapers: list[ScraperGeneric],
+        pipeline: Pipeline,
+        configuration: Configuration,
+        listings: Listings,
+        deadline: float | None = None,
+    ):
+        self.scrapers = scrapers
+        self.scrapers_by_kind = {
+            scraper.get_items_name(): scraper for scraper in scrapers
+        }
+        self.pipeline = pipeline
+        self.listings = listings
+        self.deadline = deadline
+        self.out_of_time = False
+        self.configuration = configuration
+        self.weights = {
+            scraper.get_items_name(): configuration.scheduler_weights.get(
+                scraper.get_items_name(), 1
+            )
+            for scraper in scrapers
+        }
+        self.passes = {scraper.get_items_name(): 0.0 for scraper in scrapers}
+        self.dispatched = {scraper.get_items_name(): 0 for scraper in scrapers}
+        self.idle = {scraper.get_items_name() for scraper in scrapers}
+        self.sampler = get_sampler(configuration)
+        self.skipped = {scraper.get_items_name(): 0 for scraper in scrapers}
+
+    def _can_dispatch(self, scraper: ScraperGeneric) -> bool:
+        if self.out_of_time and not scraper.required_for_zim:
+            return False
+        if (
+            self.configuration.scrape_only_first_items
+            and self.dispatched[scraper.get_items_name()] >= FIRST_ITEMS_COUNT
+        ):
+            return False
+        return not scraper.items_queue.empty()
+
+    def _next_scraper(self) -> ScraperGeneric | None:
+        """scraper from which to dispatch next item, None if all are drained"""
+        candidates = [
+            scraper for scraper in self.scrapers if self._can_dispatch(scraper)
+        ]
+        if not candidates:
+            return None
+        busy_passes = [
+            self.passes[scraper.get_items_name()]
+            for scraper in candidates
+            if scraper.get_items_name() not in self.idle
+        ]
+        for scraper in candidates:
+            name = scraper.get_items_name()
+            if name in self.idle:
+                self.idle.discard(name)
+                if busy_passes:
+                    self.passes[name] = max(self.passes[name], min(busy_passes))
+        for scraper in self.scrapers:
+            if scraper not in candidates:
+                self.idle.add(scraper.get_items_name())
+        return min(
+            candidates, key=lambda scraper: self.passes[scraper.get_items_name()]
+        )
+
+    def run(self):
+        logger.info(
+            "Scraping items with weights "
+            + ", ".join(f"{name}={weight}" for name, weight in self.weights.items())
+        )
+        while True:
+            run_pending()
+            self.pipeline.raise_if_failed()
+            self.listings.raise_if_failed()
+            self._check_deadline()
+            for scraper in self.scrapers:
+                scraper.requeue_due_retries()
+                # held items are released one by one as soon as they get ready,
+                # all at once when kinds they wait for are done
+                if (
+                    scraper.held_items
+                    and not self.out_of_time
+                    and self._are_done(scraper.held_until_done)
+                ):
+                    logger.info(
+                        f"Queuing {len(scraper.held_items)} "
+                        f"{scraper.get_items_name()} items held until "
+                        f"{', '.join(scraper.held_until_done)} items were done"
+                    )
+                    scraper.release_held_items(ready_only=False)
+                else:
+                    scraper.release_held_items()
+
+            scraper = self._next_scraper()
+            if scraper is None:
+                # items being processed might still discover new items
+                if self.pipeline.in_flight:
+                    self.pipeline.wait_for_progress()
+                elif self.out_of_time:
+                    break
+                elif not self.listings.done:
+                    time.sleep(LISTINGS_POLL_INTERVAL)
+                elif not self._wait_for_retries():
+                    break
+                continue
+
+            try:
+                item = scraper.items_queue.get(block=False)
+            except Empty:
+                continue
+            name = scraper.get_items_name()
+            if not is_sampled(self.sampler, scraper, item):
+                scraper.skip_item(item)
+                self.skipped[name] += 1
+                continue
+            if not scraper.is_item_ready(
+                item["key"], item["data"]
+            ) and not self._are_done(scraper.held_until_done):
+                scraper.hold_item(item)
+                continue
+            self.passes[name] += 1 / self.weights[name]
+            self.dispatched[name] += 1
+            logger.info(
+                f"  Scraping {name} {item['key']}"
+                f" ({scraper.items_queue.qsize()} items remaining)"
+            )
+            self.pipeline.submit_item(
+                scraper, item["key"], item["data"], depth=item["depth"]
+            )
+
+        for scraper in self.scrapers:
+            logger.info(
+                f"{self.dispatched[scraper.get_items_name()]} "
+                f"{scraper.get_items_name()} items scraped"
+            )
+            if self.sampler:
+                logger.info(
+                    f"{self.skipped[scraper.get_items_name()]} "
+                    f"{scraper.get_items_name()} items left out of sample"
+                )
+
+    def _are_done(self, kinds: tuple[str, ...]) -> bool:
+        """whether all items of these kinds are scraped, listings included"""
+        for kind in kinds:
+            scraper = self.scrapers_by_kind.get(kind)
+            if scraper is None:
+                continue
+            if (
+                not self.listings.is_done(kind)
+                or not scraper.items_queue.empty()
+                or self.pipeline.in_flight_of(kind)
+                or scraper.get_next_retry_time() is not None
+            ):
+                return False
+        return True
+
+    def _wait_for_retries(self) -> bool:
+        """wait for next retry of a failed item, False if there is none"""
+        retry_times = [
+            retry_time
+            for scraper in self.scrapers
+            if (retry_time := scraper.get_next_retry_time()) is not None
+        ]
+        if not retry_times:
+            return False
+        time.sleep(min(max(min(retry_times) - time.monotonic(), 0), 1))
+        return True
+
+    def _check_deadline(self):
+        if self.out_of_time or not self.deadline or time.monotonic() < self.deadline:
+            return
+        self.out_of_time = True
+        logger.warning("Time budget almost spent, not scraping new items anymore")
+
+
+class WorkQueueScheduler:
+    """Dispatch items claimed from the shared work queue into the pipeline
+
+    Used in worker processes, where scraping is over once the work queue is
+    drained, i.e. listings are done and no item is pending nor being processed by
+    any process anymore."""
+
+    def __init__(
+        self,
+        scrapers: list[ScraperGeneric],
+        pipeline: Pipeline,
+        work_queue: WorkQueue,
+        shard: int,
+        configuration: Configuration,
+        deadline: float | None = None,
+    ):
+        self.scrapers = {scraper.get_items_name(): scraper for scraper in scrapers}
+        self.deadline = deadline
+        self.pipeline = pipeline
+        self.work_queue = work_queue
+        self.shard = shard
+        self.configuration = configuration
+        self.dispatched = {name: 0 for name in self.scrapers}
+        self.sampler = get_sampler(configuration)
+
+    def run(self):
+        while True:
+            self.pipeline.raise_if_failed()
+
+            if self.deadline and time.monotonic() > self.deadline:
+                # items left in the work queue are handled by main process
+                if not self.pipeline.in_flight:
+                    logger.warning("Time budget almost spent, stopping worker")
+                    break
+                self.pipeline.wait_for_progress()
+                continue
+
+            # failed and held items stay claimed by this worker until dispatched
+            for name, scraper in self.scrapers.items():
+                for item in scraper.pop_due_retries():
+                    self.pipeline.submit_item(
+                        scraper, item["key"], item["data"], depth=item["depth"]
+                    )
+                # released as soon as they get ready, or kinds they wait for are done
+                for item in scraper.pop_held_items(
+                    ready_only=not scraper.held_items
+                    or not self.work_queue.are_done(scraper.held_until_done)
+                ):
+                    self.dispatched[name] += 1
+                    self.pipeline.submit_item(
+                        scraper, item["key"], item["data"], depth=item["depth"]
+                    )
+
+            item = self.work_queue.claim(self.shard)
+            if item is None:
+                if self.pipeline.in_flight:
+                    self.pipeline.wait_for_progress()
+                elif self.work_queue.is_drained():
+                    break
+                else:
+                    time.sleep(WORK_QUEUE_POLL_INTERVAL)
+                continue
+
+            name = item["kind"]
+            if (
+                self.configuration.scrape_only_first_items
+                and self.dispatched[name] >= FIRST_ITEMS_COUNT
+            ) or not is_sampled(self.sampler, self.scrapers[name], item):
+                # redirected to not scrapped page by main process
+                self.work_queue.complete(name, item["key"], SKIPPED)
+                continue
+            scraper = self.scrapers[name]
+            if not scraper.is_item_ready(
+                item["key"], item["data"]
+            ) and not self.work_queue.are_done(scraper.held_until_done):
+                scraper.hold_item(item)
+                continue
+            self.dispatched[name] += 1
+            logger.info(f"  Scraping {name} {item['key']} (shard {self.shard})")
+            self.pipeline.submit_item(
+                self.scrapers[name], item["key"], item["data"], depth=item["depth"]
+            )
+
+        for name, count in self.dispatched.items():
+            logger.info(f"{count} {name} items scraped in shard {self.shard}")
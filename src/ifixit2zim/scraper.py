@@ -1,27 +1,47 @@
 import datetime
 import io
 import json
+import multiprocessing
+import multiprocessing.connection
 import pathlib
 import shutil
 import threading
+import time
 
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from schedule import every
+from schedule import every, run_pending
 from zimscraperlib.image.transformation import resize_image
 from zimscraperlib.inputs import compute_descriptions
 from zimscraperlib.zim.creator import Creator
 
 from ifixit2zim.constants import (
     DEFAULT_HOMEPAGE,
+    PHASE_ASSEMBLE,
+    PHASE_SCRAPE,
     ROOT_DIR,
+    SCRAPER,
+    TIME_BUDGET_FINISH_RATIO,
     TITLE,
     Configuration,
 )
+from ifixit2zim.content_store import ContentStore
 from ifixit2zim.context import Context
-from ifixit2zim.exceptions import CategoryHomePageContentError
+from ifixit2zim.encode_pool import EncodePool
+from ifixit2zim.exceptions import (
+    CategoryHomePageContentError,
+    FinalScrapingFailureError,
+)
 from ifixit2zim.executor import Executor
+from ifixit2zim.image_cache import ImageCache
 from ifixit2zim.imager import Imager
+from ifixit2zim.item_costs import ItemCosts
+from ifixit2zim.journal import Journal, JournalState
+from ifixit2zim.manifest import Manifest
+from ifixit2zim.pipeline import Pipeline
 from ifixit2zim.processor import Processor
+from ifixit2zim.render_pool import RenderPool
+from ifixit2zim.s3_manifest import S3Manifest
+from ifixit2zim.scheduler import Listings, Scheduler, WorkQueueScheduler
 from ifixit2zim.scraper_category import ScraperCategory
 from ifixit2zim.scraper_guide import ScraperGuide
 from ifixit2zim.scraper_homepage import ScraperHomepage
@@ -29,6 +49,7 @@ from ifixit2zim.scraper_info import ScraperInfo
 from ifixit2zim.scraper_user import ScraperUser
 from ifixit2zim.shared import logger
 from ifixit2zim.utils import Utils
+from ifixit2zim.work_queue import CLAIMED, PENDING, SKIPPED, WorkQueue
 
 LOCALE_LOCK = threading.Lock()
 
@@ -45,6 +66,9 @@ class IFixit2Zim:
         self.utils = Utils(configuration=self.configuration)
 
         self.scrapers = []
+        self.workers = []
+        self.listings = None
+        self.deadline = None
 
     @property
     def build_path(self):
@@ -154,20 +178,7 @@ class IFixit2Zim:
             with self.lock:
                 self.creator.add_item_for(path=path, fpath=fpath)
 
-    def setup(self):
-        # order matters are there are references between them
-
-        # images handled on a different queue.
-        # mostly network I/O to retrieve and/or upload image.
-        # if not in S3 bucket, convert/optimize webp image
-        # svg images, stored but not optimized
-
-        self.img_executor = Executor(
-            queue_size=100,
-            nb_workers=50,
-            prefix="IMG-T-",
-        )
-
+    def get_zim_creator(self) -> Creator:
         src_illus_fpath = pathlib.Path(ROOT_DIR.joinpath("assets", "illustration.png"))
         dst = io.BytesIO()
         resize_image(
@@ -178,7 +189,7 @@ class IFixit2Zim:
             method="thumbnail",
         )
 
-        self.creator = Creator(
+        return Creator(
             filename=self.configuration.output_path / self.configuration.fpath,
             main_path=DEFAULT_HOMEPAGE,
             workaround_nocancel=False,
@@ -194,12 +205,92 @@ class IFixit2Zim:
             Date=datetime.datetime.now(tz=datetime.UTC).date(),
         )
 
+    def setup(self):
+        # order matters are there are references between them
+
+        # images handled on a different queue.
+        # mostly network I/O to retrieve and/or upload image.
+        # if not in S3 bucket, convert/optimize webp image
+        # svg images, stored but not optimized
+
+        self.img_executor = Executor(
+            queue_size=100,
+            nb_workers=50,
+            prefix="IMG-T-",
+        )
+
+        # started once rendering and worker processes are forked
+        self.encode_pool = None
+        if self.configuration.image_processes:
+            self.encode_pool = EncodePool(self.configuration.image_processes)
+
+        self.content_store = None
+        if self.configuration.phase == PHASE_SCRAPE:
+            # entries are assembled into a ZIM by a later run
+            self.content_store = ContentStore(self.configuration.content_store_path)
+            self.content_store.clear()
+            self.content_store.create()
+            self.creator = self.content_store
+        else:
+            self.creator = self.get_zim_creator()
+
+        self.journal = (
+            Journal(self.configuration.journal_path)
+            if self.configuration.journal_path
+            else None
+        )
+
+        self.manifest = (
+            Manifest(
+                self.configuration.manifest_path,
+                fingerprint=self.get_manifest_fingerprint(),
+            )
+            if self.configuration.manifest_path
+            else None
+        )
+        if self.manifest and self.configuration.incremental:
+            self.manifest.load()
+
+        self.work_queue = None
+        if self.configuration.worker_processes:
+            self.work_queue = WorkQueue(
+                self.build_path / "work_queue.sqlite",
+                nb_shards=self.configuration.worker_processes,
+            )
+            self.work_queue.create()
+            # workers write directly to the scrape phase content store if any
+            if not self.content_store:
+                self.content_store = ContentStore(self.build_path / "content")
+                self.content_store.create()
+
+        self.image_cache = None
+        if self.configuration.image_cache_path:
+            self.image_cache = ImageCache(
+                self.configuration.image_cache_path,
+                max_size=self.configuration.image_cache_size * 2**20,
+                encoder_profile=self.configuration.encoder_profile,
+            )
+            self.image_cache.open()
+
+        self.s3_manifest = None
+        if self.configuration.s3_url:
+            self.s3_manifest = S3Manifest(
+                self.build_path / "s3_manifest.sqlite", prefix="images/"
+            )
+            self.s3_manifest.create()
+
         self.imager = Imager(
             lock=self.lock,
             creator=self.creator,
             img_executor=self.img_executor,
             utils=self.utils,
             configuration=self.configuration,
+            journal=self.journal,
+            work_queue=self.work_queue,
+            encode_pool=self.encode_pool,
+            image_cache=self.image_cache,
+            s3_manifest=self.s3_manifest,
+            deadline=self.deadline,
         )
 
         # jinja2 environment setup
@@ -211,13 +302,34 @@ class IFixit2Zim:
         def _raise_helper(msg):
             raise Exception(msg)
 
-        self.processor = Processor(
+        self.render_pool = (
+            RenderPool(
+                nb_processes=self.configuration.render_processes,
+                final_hrefs_path=self.configuration.build_path / "final_hrefs.sqlite",
+            )
+            if self.configuration.render_processes
+            else None
+        )
+
+        self.pipeline = Pipeline(
             lock=self.lock,
-            configuration=self.configuration,
             creator=self.creator,
+            configuration=self.configuration,
+            render_pool=self.render_pool,
+            journal=self.journal,
+            manifest=self.manifest,
+            work_queue=self.work_queue,
+        )
+
+        self.processor = Processor(
+            configuration=self.configuration,
+            pipeline=self.pipeline,
             imager=self.imager,
         )
 
+        self.item_costs = ItemCosts(self.configuration.item_costs_path)
+        self.item_costs.load()
+
         context = Context(
             lock=self.lock,
             configuration=self.configuration,
@@ -226,6 +338,10 @@ class IFixit2Zim:
             metadata=self.metadata,
             env=self.env,
             processor=self.processor,
+            pipeline=self.pipeline,
+            item_costs=self.item_costs,
+            journal=self.journal,
+            work_queue=self.work_queue,
         )
 
         self.scraper_homepage = ScraperHomepage(context=context)
@@ -246,6 +362,7 @@ class IFixit2Zim:
         self.processor.get_guide_link_from_props = (
             self.scraper_guide.get_guide_link_from_props
         )
+        self.processor.register_guides = self.scraper_guide.register_guides
         self.processor.get_category_link_from_props = (
             self.scraper_category.get_category_link_from_props
         )
@@ -304,7 +421,28 @@ class IFixit2Zim:
         for scraper in self.scrapers:
             scraper.setup()
 
+        # rendering and worker processes are forked before any thread is started,
+        # encoding processes (whose pool starts threads) are forked after them ;
+        # worker processes start their own
+        if self.render_pool:
+            self.render_pool.start(self.scrapers)
+        if self.work_queue:
+            self.start_workers()
+        else:
+            if self.encode_pool:
+                self.encode_pool.start()
+            self.imager.start()
+
     def run(self):
+        if self.configuration.phase == PHASE_ASSEMBLE:
+            return self.assemble()
+
+        # items are not scraped anymore past deadline, leaving time to finish ZIM
+        if self.configuration.time_budget:
+            self.deadline = time.monotonic() + self.configuration.time_budget * (
+                1 - TIME_BUDGET_FINISH_RATIO
+            )
+
         # first report => creates a file with appropriate structure
         self.report_progress()
 
@@ -322,7 +460,6 @@ class IFixit2Zim:
             if s3_storage
             else ""
         )
-        del s3_storage
 
         logger.info(
             f"Starting scraper with:\n"
@@ -344,32 +481,57 @@ class IFixit2Zim:
 
         logger.debug("Starting Zim creation")
         self.setup()
-        self.creator.start()
+        # after processes are forked, listing runs in a thread
+        if self.s3_manifest and s3_storage:
+            self.s3_manifest.start(s3_storage)
+        del s3_storage
+        if self.configuration.phase != PHASE_SCRAPE:
+            self.creator.start()
 
         try:
             self.add_assets()
 
-            for scraper in self.scrapers:
-                scraper.build_expected_items()
-                self.report_progress()
+            if not self.work_queue:
+                self.pipeline.start(self.scrapers)
+
+            if self.journal:
+                state = self.journal.read() if self.configuration.resume else None
+                self.journal.open(resume=self.configuration.resume)
+                if state:
+                    self.resume_from_journal(state)
+
+            # scraping starts while expected items are still being listed
+            self.listings = Listings(self.scrapers)
+            self.listings.start()
 
             # set a timer to report progress only every 10 seconds, not need to do it
             # after every item scrapped
             every(10).seconds.do(self.report_progress)
 
-            while True:
-                for scraper in self.scrapers:
-                    scraper.scrape_items()
-                needs_rerun = False
-                if not self.configuration.scrape_only_first_items:
-                    for scraper in self.scrapers:
-                        if not scraper.items_queue.empty():
-                            needs_rerun = True
-                if not needs_rerun:
-                    break
-
-            logger.info("Awaiting images")
-            self.img_executor.shutdown()
+            if self.work_queue:
+                self.assemble_from_workers()
+            else:
+                Scheduler(
+                    scrapers=self.scrapers,
+                    pipeline=self.pipeline,
+                    configuration=self.configuration,
+                    listings=self.listings,
+                    deadline=self.deadline,
+                ).run()
+                # listings might still be running when out of time, they must be
+                # over for all listed items to be redirected
+                self.listings.cancel()
+                self.listings.shutdown()
+                self.add_not_scrapped_redirects()
+
+                logger.info("Awaiting pipeline")
+                self.pipeline.shutdown()
+                self.pipeline.raise_if_failed()
+
+                logger.info("Awaiting images")
+                self.imager.shutdown()
+                if self.encode_pool:
+                    self.encode_pool.shutdown()
 
             self.report_progress()
 
@@ -388,10 +550,49 @@ class IFixit2Zim:
                     f"{len(scraper.error_items_keys)} {scraper.get_items_name()}"
                     " in error, "
                 )
-            stats += f"{len(self.imager.handled)} images"
+            nb_images = (
+                self.work_queue.get_nb_images()
+                if self.work_queue
+                else len(self.imager.handled)
+            )
+            if not self.work_queue:
+                stats += f"{self.pipeline.nb_timed_out} timed out items, "
+            stats += f"{nb_images} images"
+            if not self.work_queue:
+                stats += (
+                    f", {self.imager.nb_source_duplicates} duplicates of "
+                    "already downloaded images"
+                )
+            if self.image_cache and not self.work_queue:
+                stats += f", {self.image_cache.nb_hits} from images cache"
+            if (self.image_cache or self.imager.s3_clients) and not self.work_queue:
+                stats += f", {self.imager.nb_unchanged} unchanged since cached"
+            if self.imager.s3_uploader and not self.work_queue:
+                stats += f", {self.imager.s3_uploader.nb_failed} S3 uploads failed"
+            if self.imager.nb_out_of_time and not self.work_queue:
+                stats += (
+                    f", {self.imager.nb_out_of_time} not processed within time budget"
+                )
 
             logger.info(stats)
 
+            # worker processes report their own stages
+            if not self.work_queue:
+                logger.info("Pipeline stages:")
+                for stage_stats in self.pipeline.get_stats():
+                    logger.info(f"\t{stage_stats}")
+                if self.imager.s3_clients:
+                    logger.info("S3 cache requests:")
+                    for s3_stats in self.imager.s3_clients.get_stats():
+                        logger.info(f"\t{s3_stats}")
+
+            self.item_costs.save()
+
+            if self.manifest:
+                logger.info(
+                    f"{self.pipeline.nb_reused} items reused from previous build"
+                )
+
             logger.info("Null categories:")
             for key in self.processor.null_categories:
                 logger.info(f"\t{key}")
@@ -408,10 +609,23 @@ class IFixit2Zim:
             else:
                 logger.error("Interrupting process due to error", exc_info=exc)
             self.imager.abort()
-            self.img_executor.shutdown(wait=False)
+            self.pipeline.shutdown(wait=False)
+            self.imager.shutdown(wait=False)
+            if self.encode_pool:
+                self.encode_pool.shutdown(wait=False)
+            for worker in self.workers:
+                worker.terminate()
+            if self.listings:
+                self.listings.shutdown(wait=False)
             return 1
         else:
-            if self.creator.can_finish:
+            if self.configuration.phase == PHASE_SCRAPE:
+                # marks content store as complete, ready to be assembled
+                self.content_store.save_metadata(self.metadata)
+                logger.info(f"Scraped content stored in {self.content_store.path}")
+                if self.manifest:
+                    self.manifest.save()
+            elif self.creator.can_finish:
                 logger.info("Finishing ZIM file")
                 with self.lock:
                     self.creator.finish()
@@ -419,26 +633,247 @@ class IFixit2Zim:
                     f"Finished Zim {self.creator.filename.name} "
                     f"in {self.creator.filename.parent}"
                 )
+                # after ZIM is finished, since reused entries are read from blobs
+                if self.manifest:
+                    self.manifest.save()
         finally:
+            if self.journal:
+                self.journal.close()
             logger.info("Cleaning up")
             with self.lock:
                 self.cleanup()
 
         logger.info("Scraper has finished normally")
 
+    def assemble(self):
+        """create the ZIM from content stored by a previous scrape phase"""
+        self.content_store = ContentStore(self.configuration.content_store_path)
+        self.metadata = self.content_store.load_metadata()
+        if self.metadata is None:
+            raise FinalScrapingFailureError(
+                f"No complete scraped content in {self.content_store.path}"
+            )
+        self.sanitize_inputs()
+
+        self.creator = self.get_zim_creator()
+        self.creator.start()
+        try:
+            logger.info(f"Assembling ZIM from {self.content_store.path}")
+            self.content_store.feed(self.creator)
+            self.content_store.raise_if_failed()
+            logger.info(f"{self.content_store.nb_fed} entries added")
+        except Exception as exc:
+            # request Creator not to create a ZIM file on finish
+            self.creator.can_finish = False
+            logger.error("Interrupting process due to error", exc_info=exc)
+            return 1
+        else:
+            logger.info("Finishing ZIM file")
+            self.creator.finish()
+            logger.info(
+                f"Finished Zim {self.creator.filename.name} "
+                f"in {self.creator.filename.parent}"
+            )
+        finally:
+            logger.info("Cleaning up")
+            self.cleanup()
+
+        logger.info("Scraper has finished normally")
+
+    def add_not_scrapped_redirects(self):
+        """redirect items left in queues when out of time to not_scrapped page"""
+        for scraper in self.scrapers:
+            if nb_items := scraper.add_remaining_items_redirects():
+                logger.warning(
+                    f"{nb_items} {scraper.get_items_name()} items not scraped "
+                    "within time budget"
+                )
+
+    def start_workers(self):
+        """fork worker processes, scraping items from the shared work queue"""
+        logger.info(f"Starting {self.configuration.worker_processes} worker processes")
+        context = multiprocessing.get_context("fork")
+        for index in range(self.configuration.worker_processes):
+            worker = context.Process(
+                target=self.run_worker, args=(index,), name=f"worker-{index}"
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def run_worker(self, shard: int):
+        """scrape items of the work queue, in a worker process"""
+        # entries go to the content store, the main process adds them to the ZIM
+        self.pipeline.creator = self.content_store
+        self.imager.creator = self.content_store
+        if self.encode_pool:
+            self.encode_pool.start()
+        self.imager.start()
+        self.pipeline.start(self.scrapers)
+        try:
+            WorkQueueScheduler(
+                scrapers=self.scrapers,
+                pipeline=self.pipeline,
+                work_queue=self.work_queue,
+                shard=shard,
+                configuration=self.configuration,
+                deadline=self.deadline,
+            ).run()
+            self.pipeline.shutdown()
+            self.pipeline.raise_if_failed()
+            self.imager.shutdown()
+            if self.encode_pool:
+                self.encode_pool.shutdown()
+        except BaseException:
+            self.imager.abort()
+            self.pipeline.shutdown(wait=False)
+            self.imager.shutdown(wait=False)
+            if self.encode_pool:
+                self.encode_pool.shutdown(wait=False)
+            raise
+        logger.info(f"Worker {shard} pipeline stages:")
+        for stage_stats in self.pipeline.get_stats():
+            logger.info(f"\t{stage_stats}")
+        if self.imager.s3_clients:
+            logger.info(f"Worker {shard} S3 cache requests:")
+            for s3_stats in self.imager.s3_clients.get_stats():
+                logger.info(f"\t{s3_stats}")
+
+    def assemble_from_workers(self):
+        """add content of worker processes to the ZIM, until they are all done"""
+        listings_done = False
+        while alive := [worker for worker in self.workers if worker.is_alive()]:
+            run_pending()
+            self.listings.raise_if_failed()
+            # items claimed by a crashed worker would never be completed, leaving
+            # the others waiting for the work queue to be drained forever
+            if crashed := [worker for worker in self.workers if worker.exitcode]:
+                for worker in alive:
+                    worker.terminate()
+                for worker in alive:
+                    worker.join()
+                names = [worker.name for worker in crashed]
+                raise FinalScrapingFailureError(f"Worker processes failed: {names}")
+            # workers only stop once listings are done and the work queue drained
+            if not listings_done and self.listings.done:
+                self.work_queue.set_listings_done()
+                listings_done = True
+            self.feed_workers_content()
+            multiprocessing.connection.wait(
+                [worker.sentinel for worker in alive], timeout=1
+            )
+        if failed := [worker.name for worker in self.workers if worker.exitcode]:
+            raise FinalScrapingFailureError(f"Worker processes failed: {failed}")
+        self.feed_workers_content()
+        self.content_store.raise_if_failed()
+        logger.info(f"{self.content_store.nb_fed} entries added from workers")
+        # still running if workers stopped out of time
+        self.listings.cancel()
+        self.listings.shutdown()
+
+        # final status of items is only known from the work queue
+        for scraper in self.scrapers:
+            for key, data, is_expected, depth, status in self.work_queue.get_items(
+                scraper.get_items_name()
+            ):
+                scraper.restore_item(
+                    key,
+                    data,
+                    is_expected=is_expected,
+                    depth=depth,
+                    # left in work queue when out of time, or skipped by workers,
+                    # queued again to be redirected to not scrapped page
+                    status=None if status in (PENDING, CLAIMED, SKIPPED) else status,
+                )
+            scraper.check_items_thresholds()
+
+        if any(not scraper.items_queue.empty() for scraper in self.scrapers):
+            self.pipeline.start(self.scrapers)
+            self.add_not_scrapped_redirects()
+            self.pipeline.shutdown()
+            self.pipeline.raise_if_failed()
+
+    def feed_workers_content(self):
+        """add to the ZIM entries written by workers since last call"""
+        # in scrape phase, workers write to the content store being the output
+        if self.creator is self.content_store:
+            return
+        with self.lock:
+            self.content_store.feed(self.creator)
+
+    def get_manifest_fingerprint(self) -> dict:
+        """what rendered content depends on besides items content"""
+
+        def _sorted(values):
+            return sorted(values) if values else values
+
+        return {
+            "scraper": SCRAPER,
+            "lang_code": self.configuration.lang_code,
+            # links and homepage
+            "main_url": self.configuration.main_url.geturl(),
+            "title": self.configuration.title,
+            "no_cleanup": self.configuration.no_cleanup,
+            "categories": _sorted(self.configuration.categories),
+            "no_category": self.configuration.no_category,
+            "guides": _sorted(self.configuration.guides),
+            "no_guide": self.configuration.no_guide,
+            "infos": _sorted(self.configuration.infos),
+            "no_info": self.configuration.no_info,
+            "users": _sorted(self.configuration.users),
+            "no_user": self.configuration.no_user,
+        }
+
+    def resume_from_journal(self, state: JournalState):
+        """re-add content written by interrupted run and restore its items"""
+        logger.info(
+            f"Resuming from journal with {len(state.entries)} entries and "
+            f"{len(state.done)} items done"
+        )
+        for entry in state.entries:
+            with self.lock:
+                if entry["op"] == "redirect":
+                    self.creator.add_redirect(
+                        path=entry["path"], target_path=entry["target_path"]
+                    )
+                else:
+                    self.creator.add_item_for(
+                        path=entry["path"],
+                        title=entry["title"],
+                        fpath=self.journal.get_blob_path(entry["blob"]),
+                        mimetype=entry["mimetype"],
+                        is_front=entry["is_front"],
+                    )
+        # items not done might have been partially written already
+        self.pipeline.restored_paths = state.written_paths
+
+        scrapers = {scraper.get_items_name(): scraper for scraper in self.scrapers}
+        for (kind, item_key), record in state.discovered.items():
+            scrapers[kind].restore_item(
+                item_key,
+                record["data"],
+                is_expected=record["expected"],
+                depth=record["depth"],
+                status=state.done.get((kind, item_key)),
+            )
+        self.imager.restore(state)
+
     def report_progress(self):
         if not self.configuration.stats_path:
             return
         done = 0
         total = 0
-        for scraper in self.scrapers:
-            scraper_total = len(scraper.expected_items_keys) + len(
-                scraper.unexpected_items_keys
-            )
-            scraper_remains = scraper.items_queue.qsize()
-            scraper_done = scraper_total - scraper_remains
-            total += scraper_total
-            done += scraper_done
+        if self.work_queue:
+            # items are queued and processed in worker processes
+            done, total = self.work_queue.get_progress()
+        else:
+            for scraper in self.scrapers:
+                scraper_total = len(scraper.expected_items_keys) + len(
+                    scraper.unexpected_items_keys
+                )
+                scraper_remains = scraper.items_queue.qsize()
+                scraper_done = scraper_total - scraper_remains
+                total += scraper_total
+                done += scraper_done
         progress = {
             "done": done,
             "total": total,
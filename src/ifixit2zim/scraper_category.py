@@ -17,11 +17,14 @@ class ScraperCategory(ScraperGeneric):
     def get_items_name(self):
         return "category"
 
-    def _add_category_to_scrape(self, category_key, category_title, is_expected):
+    def _add_category_to_scrape(
+        self, category_key, category_title, is_expected, listed_cost=None
+    ):
         self.add_item_to_scrape(
             category_key,
             {
                 "category_title": category_title,
+                "listed_cost": listed_cost,
             },
             is_expected,
         )
@@ -29,11 +32,19 @@ class ScraperCategory(ScraperGeneric):
     def _get_category_key_from_title(self, category_title):
         return self.processor.convert_title_to_filename(category_title.lower())
 
-    def _build_category_path(self, category_title):
+    def _build_category_path(self, category_title, *, offline=False):
         href = (
             self.configuration.main_url.geturl()
             + f"/Device/{category_title.replace('/', ' ')}"
         )
+        if offline:
+            return self.processor.get_known_href(
+                href,
+                "/Device/"
+                + self.processor.convert_title_to_filename(
+                    category_title.replace("/", " ")
+                ),
+            )[1:]
         final_href = self.processor.normalize_href(href)
         return final_href[1:]
 
@@ -64,7 +75,13 @@ class ScraperCategory(ScraperGeneric):
     def _process_categories(self, categories):
         for category in categories:
             category_key = self._get_category_key_from_title(category)
-            self._add_category_to_scrape(category_key, category, True)
+            # listing only knows children, guides count is only in payload
+            self._add_category_to_scrape(
+                category_key,
+                category,
+                True,
+                listed_cost=1 + len(categories[category] or {}),
+            )
             if categories[category]:
                 self._process_categories(categories[category])
 
@@ -84,6 +101,16 @@ class ScraperCategory(ScraperGeneric):
         logger.info(f"{len(self.expected_items_keys)} categories found")
 
     def get_one_item_content(self, item_key, item_data):  # noqa ARG002
+        category_content = self._get_category_content(item_key)
+        if category_content:
+            # guides are listed with their actual locale, unlike in guides listing
+            self.processor.register_guides(
+                (category_content.get("guides") or [])
+                + (category_content.get("featured_guides") or [])
+            )
+        return category_content
+
+    def _get_category_content(self, item_key):
         categoryid = item_key
 
         category_content = self.utils.get_api_content(
@@ -115,8 +142,22 @@ class ScraperCategory(ScraperGeneric):
 
         return None
 
+    def estimate_listed_item_cost(self, item_key, item_data):  # noqa ARG002
+        return item_data.get("listed_cost") or 0
+
+    def estimate_item_cost(self, item_content):
+        category_content = item_content
+        return (
+            1
+            + len(category_content.get("guides") or [])
+            + len(category_content.get("children") or [])
+            + len(category_content.get("featured_guides") or [])
+        )
+
     def add_item_redirect(self, item_key, item_data, redirect_kind):  # noqa ARG002
-        path = self._build_category_path(item_data["category_title"])
+        path = self._build_category_path(
+            item_data["category_title"], offline=redirect_kind == "not_scrapped"
+        )
         self.processor.add_redirect(
             path=path,
             target_path=f"home/{redirect_kind}?{urllib.parse.urlencode({'url':path})}",
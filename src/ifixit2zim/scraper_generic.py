@@ -1,23 +1,56 @@
+import heapq
+import itertools
+import threading
+import time
 from abc import ABC, abstractmethod
-from queue import Queue
-
-from schedule import run_pending
+from queue import Empty
 
+from ifixit2zim.constants import UNKNOWN_LOCALE, UNKNOWN_TITLE
 from ifixit2zim.context import Context
 from ifixit2zim.exceptions import FinalScrapingFailureError
+from ifixit2zim.items_queue import DISCOVERED, EXPECTED, ItemsQueue
+from ifixit2zim.manifest import Manifest
+from ifixit2zim.pipeline import get_current_item_depth, record_item_operation
 from ifixit2zim.shared import logger
+from ifixit2zim.utils import is_transient_error
 
 FIRST_ITEMS_COUNT = 5
+# delay before first retry of an item which failed transiently, doubled each time
+RETRY_BASE_DELAY = 30
 
 
 class ScraperGeneric(ABC):
+    # whether items must be scraped even when out of time budget
+    required_for_zim = False
+    # kinds of items whose scraping might complete data of items not ready yet
+    held_until_done = ()
+
     def __init__(self, context: Context):
         self.context = context
         self.expected_items_keys = {}
         self.unexpected_items_keys = {}
-        self.items_queue = Queue()
+        self.items_queue = ItemsQueue(
+            weights=context.configuration.priority_weights,
+            longest_first=context.configuration.fetch_workers > 1
+            or context.configuration.render_workers > 1,
+        )
         self.missing_items_keys = set()
         self.error_items_keys = set()
+        # items which failed transiently, as (not before, sequence, item) heap
+        self.retry_items = []
+        self.retry_attempts = {}
+        self._retry_counter = itertools.count()
+        # items not scraped because left out of sample
+        self.skipped_items = []
+        # items not ready yet by key, held until they get ready or kinds they wait
+        # for are done
+        self.held_items = {}
+        # held items which got ready, to be dispatched again
+        self.ready_held_items = []
+        # items are discovered from several pipeline workers at once
+        self.items_lock = threading.Lock()
+        # set when out of time, listing stops before its next page
+        self.listing_cancelled = threading.Event()
 
     @property
     def configuration(self):
@@ -47,6 +80,22 @@ class ScraperGeneric(ABC):
     def processor(self):
         return self.context.processor
 
+    @property
+    def pipeline(self):
+        return self.context.pipeline
+
+    @property
+    def item_costs(self):
+        return self.context.item_costs
+
+    @property
+    def journal(self):
+        return self.context.journal
+
+    @property
+    def work_queue(self):
+        return self.context.work_queue
+
     @abstractmethod
     def setup(self):
         pass
@@ -71,18 +120,39 @@ class ScraperGeneric(ABC):
     def process_one_item(self, item_key, item_data, item_content):
         pass
 
+    def item_seen(self, item_key, item_data):
+        """called every time an item is requested, even if already known"""
+        pass
+
     def add_item_to_scrape(
         self, item_key, item_data, is_expected, *, warn_unexpected=True
     ):
+        record_item_operation(
+            "discover",
+            self.get_items_name(),
+            item_key,
+            item_data,
+            is_expected,
+            warn_unexpected,
+        )
+        self.item_seen(item_key, item_data)
         item_key = str(item_key)  # just in case it's an int
-        if (
-            item_key in self.expected_items_keys
-            or item_key in self.unexpected_items_keys
-        ):
-            return
+        with self.items_lock:
+            if item_key in self.expected_items_keys:
+                return
+            if item_key in self.unexpected_items_keys:
+                # linked to by an item scraped before being listed
+                if is_expected:
+                    discovered_data = self.unexpected_items_keys.pop(item_key)
+                    self._merge_listed_data(discovered_data, item_data)
+                    self.expected_items_keys[item_key] = discovered_data
+                return
+            if is_expected:
+                self.expected_items_keys[item_key] = item_data
+            else:
+                self.unexpected_items_keys[item_key] = item_data
         if is_expected:
             logger.debug(f"Adding {self.get_items_name()} {item_key} to scraping queue")
-            self.expected_items_keys[item_key] = item_data
         else:
             message = (
                 f"Adding unexpected {self.get_items_name()} {item_key} "
@@ -92,14 +162,192 @@ class ScraperGeneric(ABC):
                 logger.warning(message)
             else:
                 logger.debug(message)
-            self.unexpected_items_keys[item_key] = item_data
+        # expected items are at the root, discovered ones one level below the item
+        # whose rendering linked to them
+        parent_depth = get_current_item_depth()
+        depth = 0 if is_expected or parent_depth is None else parent_depth + 1
+        if self.journal:
+            self.journal.record_discovered(
+                self.get_items_name(),
+                item_key,
+                item_data,
+                is_expected=is_expected,
+                depth=depth,
+            )
+        if self.work_queue:
+            # shared with other processes, which might have queued it already
+            self.work_queue.add(
+                self.get_items_name(),
+                item_key,
+                item_data,
+                is_expected=is_expected,
+                depth=depth,
+            )
+            return
+        self._queue_item(item_key, item_data, is_expected=is_expected, depth=depth)
+
+    @staticmethod
+    def _merge_listed_data(discovered_data, listed_data):
+        """complete data of a discovered item with what its listing knows
+
+        Updated in place since the discovered item might be queued already.
+        Listing values (e.g. revision) win, except placeholders of what the
+        listing does not know (unknown title or locale)"""
+        if not isinstance(discovered_data, dict) or not isinstance(listed_data, dict):
+            return
+        for key, value in listed_data.items():
+            if value is None or value in (UNKNOWN_TITLE, UNKNOWN_LOCALE):
+                discovered_data.setdefault(key, value)
+            else:
+                discovered_data[key] = value
+
+    def _queue_item(self, item_key, item_data, *, is_expected, depth):
         self.items_queue.put(
             {
                 "key": item_key,
                 "data": item_data,
-            }
+                "depth": depth,
+            },
+            klass=EXPECTED if is_expected else DISCOVERED,
+            depth=depth,
+            cost=self.item_costs.get(
+                self.get_items_name(),
+                item_key,
+                default=self.estimate_listed_item_cost(item_key, item_data),
+            ),
         )
 
+    def restore_item(self, item_key, item_data, *, is_expected, depth, status):
+        """register an item known from journal, queuing it only if not done yet"""
+        self.item_seen(item_key, item_data)
+        with self.items_lock:
+            if is_expected:
+                self.expected_items_keys[item_key] = item_data
+            else:
+                self.unexpected_items_keys[item_key] = item_data
+        if status == "missing":
+            self.missing_items_keys.add(item_key)
+        elif status == "error":
+            self.error_items_keys.add(item_key)
+        elif status is None:
+            self._queue_item(item_key, item_data, is_expected=is_expected, depth=depth)
+
+    def retry_later(self, item_key, item_data, depth, exc) -> bool:
+        """whether failed item is scheduled for a later retry rather than in error
+
+        Only transient errors (server errors, timeouts, connection errors) are
+        retried, with exponential spacing, up to the configured attempts"""
+        if not is_transient_error(exc):
+            return False
+        with self.items_lock:
+            attempt = self.retry_attempts.get(item_key, 0) + 1
+            if attempt > self.configuration.item_retries:
+                return False
+            self.retry_attempts[item_key] = attempt
+            delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            heapq.heappush(
+                self.retry_items,
+                (
+                    time.monotonic() + delay,
+                    next(self._retry_counter),
+                    {"key": item_key, "data": item_data, "depth": depth},
+                ),
+            )
+        logger.warning(
+            f"Transient error on {self.get_items_name()} {item_key}, retrying in "
+            f"{delay}s (attempt {attempt}/{self.configuration.item_retries}): {exc}"
+        )
+        return True
+
+    def pop_due_retries(self) -> list[dict]:
+        """items whose retry delay has elapsed"""
+        due = []
+        with self.items_lock:
+            while self.retry_items and self.retry_items[0][0] <= time.monotonic():
+                *_, item = heapq.heappop(self.retry_items)
+                due.append(item)
+        return due
+
+    def requeue_due_retries(self):
+        """put items whose retry delay has elapsed back in the queue"""
+        for item in self.pop_due_retries():
+            with self.items_lock:
+                is_expected = item["key"] in self.expected_items_keys
+            self._queue_item(
+                item["key"], item["data"], is_expected=is_expected, depth=item["depth"]
+            )
+
+    def is_item_ready(self, item_key, item_data) -> bool:  # noqa ARG002
+        """whether item can be dispatched before held_until_done kinds are done"""
+        return True
+
+    def hold_item(self, item):
+        """set a dispatched item aside until it is ready"""
+        with self.items_lock:
+            # might have got ready since it was dispatched
+            if self.is_item_ready(item["key"], item["data"]):
+                self.ready_held_items.append(item)
+            else:
+                self.held_items[item["key"]] = item
+
+    def set_held_item_ready(self, item_key):
+        """let an item be dispatched again if it is held, now that it is ready"""
+        with self.items_lock:
+            if item := self.held_items.pop(str(item_key), None):
+                self.ready_held_items.append(item)
+
+    def pop_held_items(self, *, ready_only=True) -> list[dict]:
+        """held items which got ready, or all of them"""
+        with self.items_lock:
+            held, self.ready_held_items = self.ready_held_items, []
+            if not ready_only:
+                held += self.held_items.values()
+                self.held_items = {}
+        return held
+
+    def release_held_items(self, *, ready_only=True):
+        """put held items which got ready, or all of them, back in the queue"""
+        held = self.pop_held_items(ready_only=ready_only)
+        with self.items_lock:
+            held = [(item, item["key"] in self.expected_items_keys) for item in held]
+        for item, is_expected in held:
+            self._queue_item(
+                item["key"], item["data"], is_expected=is_expected, depth=item["depth"]
+            )
+
+    def skip_item(self, item):
+        """leave a dispatched item out, it will be redirected to not_scrapped page"""
+        with self.items_lock:
+            self.skipped_items.append(item)
+
+    def get_next_retry_time(self) -> float | None:
+        with self.items_lock:
+            return self.retry_items[0][0] if self.retry_items else None
+
+    def add_remaining_items_redirects(self) -> int:
+        """redirect items still queued to not_scrapped page, returning their count
+
+        Paths of these redirects are built without network access, out of time"""
+        with self.items_lock:
+            remaining = (
+                [item for *_, item in self.retry_items]
+                + self.skipped_items
+                + self.ready_held_items
+                + list(self.held_items.values())
+            )
+            self.retry_items.clear()
+            self.skipped_items = []
+            self.ready_held_items = []
+            self.held_items = {}
+        while True:
+            try:
+                remaining.append(self.items_queue.get(block=False))
+            except Empty:
+                break
+        for item in remaining:
+            self.add_item_redirect(item["key"], item["data"], "not_scrapped")
+        return len(remaining)
+
     def add_item_missing_redirect(self, item_key, item_data):
         self.add_item_redirect(item_key, item_data, "missing")
 
@@ -110,68 +358,74 @@ class ScraperGeneric(ABC):
             logger.warning("Failed to add redirect for item in error")
             pass  # ignore exceptions, we are already inside an exception handling
 
-    def scrape_one_item(self, item_key, item_data):
+    def fetch_one_item(self, item_key, item_data):
+        """content of an item, None (and missing redirect added) if missing"""
         item_content = self.get_one_item_content(item_key, item_data)
 
         if item_content is None:
             logger.warning(f"Missing {self.get_items_name()} {item_key}")
             self.missing_items_keys.add(item_key)
             self.add_item_missing_redirect(item_key, item_data)
-            return
+        else:
+            self.item_costs.record(
+                self.get_items_name(), item_key, self.estimate_item_cost(item_content)
+            )
+
+        return item_content
+
+    def estimate_item_cost(self, item_content):  # noqa ARG002
+        """relative cost of processing an item, based on its content"""
+        return 1
+
+    def estimate_listed_item_cost(self, item_key, item_data):  # noqa ARG002
+        """relative cost of an item before it is fetched, from its listing data
+
+        Only used when no cost was recorded by a previous run, 0 if unknown"""
+        return 0
+
+    def get_item_revision(self, item_key, item_data):  # noqa ARG002
+        """revision of an item found in listings, None if unknown
+
+        Items whose revision did not change since previous build are not fetched
+        again in incremental mode"""
+        return None
+
+    def get_item_content_hash(self, item_key, item_data, item_content):  # noqa ARG002
+        """hash of what rendering of an item depends on, None if not reusable
 
+        Items whose content hash did not change since previous build are not
+        rendered again in incremental mode"""
+        return Manifest.get_content_hash(item_content)
+
+    def render_one_item(self, item_key, item_data, item_content):
         logger.debug(f"Processing {self.get_items_name()} {item_key}")
 
         self.process_one_item(item_key, item_data, item_content)
 
-    def scrape_items(self):
-        logger.info(
-            f"Scraping {self.get_items_name()} items ({self.items_queue.qsize()}"
-            " items remaining)"
+    def add_item_error(self, item_key, item_data, exc):
+        self.error_items_keys.add(item_key)
+        logger.warning(
+            f"Error while processing {self.get_items_name()} {item_key}",
+            exc_info=exc,
         )
+        self.add_item_error_redirect(item_key, item_data)
 
-        num_items = 1
-        while not self.items_queue.empty():
-            run_pending()
-            if (
-                self.configuration.scrape_only_first_items
-                and num_items > FIRST_ITEMS_COUNT
-            ):
-                break
-            item = self.items_queue.get(block=False)
-            item_key = item["key"]
-            item_data = item["data"]
-            logger.info(
-                f"  Scraping {self.get_items_name()} {item_key}"
-                f" ({self.items_queue.qsize()} items remaining)"
+    def check_items_thresholds(self):
+        """raise if too many items are missing or in error"""
+        nb_items = len(self.expected_items_keys) + len(self.unexpected_items_keys)
+        if (
+            len(self.missing_items_keys) * 100 / nb_items
+            > self.configuration.max_missing_items_percent
+        ):
+            raise FinalScrapingFailureError(
+                f"Too many {self.get_items_name()}s found missing: "
+                f"{len(self.missing_items_keys)}"
+            )
+        if (
+            len(self.error_items_keys) * 100 / nb_items
+            > self.configuration.max_error_items_percent
+        ):
+            raise FinalScrapingFailureError(
+                f"Too many {self.get_items_name()}s failed to be processed: "
+                f"{len(self.error_items_keys)}"
             )
-            try:
-                self.scrape_one_item(item_key, item_data)
-            except Exception as exc:
-                self.error_items_keys.add(item_key)
-                logger.warning(
-                    f"Error while processing {self.get_items_name()} {item_key}",
-                    exc_info=exc,
-                )
-                self.add_item_error_redirect(item_key, item_data)
-            finally:
-                if (
-                    len(self.missing_items_keys)
-                    * 100
-                    / (len(self.expected_items_keys) + len(self.unexpected_items_keys))
-                    > self.configuration.max_missing_items_percent
-                ):
-                    raise FinalScrapingFailureError(
-                        f"Too many {self.get_items_name()}s found missing: "
-                        f"{len(self.missing_items_keys)}"
-                    )
-                if (
-                    len(self.error_items_keys)
-                    * 100
-                    / (len(self.expected_items_keys) + len(self.unexpected_items_keys))
-                    > self.configuration.max_error_items_percent
-                ):
-                    raise FinalScrapingFailureError(
-                        f"Too many {self.get_items_name()}s failed to be processed: "
-                        f"{len(self.error_items_keys)}"
-                    )
-                num_items += 1
@@ -17,8 +17,14 @@ from ifixit2zim.shared import logger
 
 
 class ScraperGuide(ScraperGeneric):
+    # guides of unknown locale learn it from categories payloads
+    held_until_done = ("category",)
+
     def __init__(self, context: Context):
         super().__init__(context)
+        # guide id => (locale, title) as found in payloads carrying actual guides
+        # locale, the guides listing always returning "en"
+        self.guides_locales = {}
 
     def setup(self):
         self.guide_template = self.env.get_template("guide.html")
@@ -26,22 +32,52 @@ class ScraperGuide(ScraperGeneric):
     def get_items_name(self):
         return "guide"
 
-    def _add_guide_to_scrape(self, guideid, guidetitle, locale, is_expected):
+    def _add_guide_to_scrape(
+        self,
+        guideid,
+        guidetitle,
+        locale,
+        is_expected,
+        revision=None,
+        listed_cost=None,
+        url=None,
+    ):
         self.add_item_to_scrape(
             guideid,
             {
                 "guideid": guideid,
                 "guidetitle": guidetitle,
                 "locale": locale,
+                "revision": revision,
+                "listed_cost": listed_cost,
+                "url": url,
             },
             is_expected,
         )
 
-    def _build_guide_path(self, guideid, guidetitle):  # noqa ARG002
+    def get_item_revision(self, item_key, item_data):  # noqa ARG002
+        return item_data.get("revision")
+
+    def _build_guide_path(self, guideid, guidetitle, *, offline=False, url=None):
         href = self.configuration.main_url.geturl() + f"/Guide/-/{guideid}"
+        if offline:
+            return self.processor.get_known_href(
+                href, self._get_canonical_guide_href(guideid, guidetitle, url)
+            )[1:]
         final_href = self.processor.normalize_href(href)
         return final_href[1:]
 
+    def _get_canonical_guide_href(self, guideid, guidetitle, url):
+        """href of guide as normalized by iFixit, from its listing url or title"""
+        if url:
+            return urllib.parse.unquote(urllib.parse.urlparse(url).path)
+        if guidetitle == UNKNOWN_TITLE:
+            _, guidetitle = self.guides_locales.get(str(guideid), (None, guidetitle))
+        if guidetitle == UNKNOWN_TITLE:
+            return f"/Guide/-/{guideid}"
+        slug = self.processor.convert_title_to_slug(guidetitle.replace("/", " "))
+        return f"/Guide/{slug}/{guideid}"
+
     def get_guide_link_from_obj(self, guide):
         if "guideid" not in guide or not guide["guideid"]:
             raise UnexpectedDataKindExceptionError(
@@ -58,22 +94,46 @@ class ScraperGuide(ScraperGeneric):
         guideid = guide["guideid"]
         locale = guide["locale"]
         title = guide["title"]
-        # override unknown locale if needed
-        if (
-            guideid in self.expected_items_keys
-            and self.expected_items_keys[guideid]["locale"] == UNKNOWN_LOCALE
-        ):
-            self.expected_items_keys[guideid]["locale"] = locale
-        # override unknown title if needed
-        if (
-            guideid in self.expected_items_keys
-            and self.expected_items_keys[guideid]["guidetitle"] == UNKNOWN_TITLE
-        ):
-            self.expected_items_keys[guideid]["guidetitle"] = title
+        self._register_guide_locale(guideid, locale, title)
         return self.get_guide_link_from_props(
             guideid=guideid, guidetitle=title, guidelocale=locale
         )
 
+    def _register_guide_locale(self, guideid, locale, title):
+        guideid = str(guideid)
+        # first known locale and title are kept
+        self.guides_locales.setdefault(guideid, (locale, title))
+        # no need to wait for categories anymore
+        self.set_held_item_ready(guideid)
+        with self.items_lock:
+            item_data = self.expected_items_keys.get(guideid)
+            if not item_data:
+                return
+            # override unknown locale and title if needed
+            if item_data["locale"] == UNKNOWN_LOCALE:
+                item_data["locale"] = locale
+            if item_data["guidetitle"] == UNKNOWN_TITLE:
+                item_data["guidetitle"] = title
+
+    def register_guides(self, guides):
+        """record locale and title of guides listed in another item payload
+
+        Called as soon as payloads are fetched, so that guides known so far with
+        an unknown locale (held until categories are done) are fetched once in
+        their actual language. Titles are only filled when unknown."""
+        for guide in guides:
+            if guide.get("guideid") and guide.get("locale") and guide.get("title"):
+                self._register_guide_locale(
+                    guide["guideid"], guide["locale"], guide["title"]
+                )
+
+    def is_item_ready(self, item_key, item_data):
+        """whether guide locale is known, guides being fetched in their locale"""
+        return (
+            item_data["locale"] != UNKNOWN_LOCALE
+            or str(item_key) in self.guides_locales
+        )
+
     def get_guide_link_from_props(
         self, guideid, guidetitle, guidelocale=UNKNOWN_LOCALE
     ):
@@ -99,7 +159,7 @@ class ScraperGuide(ScraperGeneric):
         logger.info("Downloading list of guides")
         limit = 200
         offset = 0
-        while True:
+        while not self.listing_cancelled.is_set():
             guides = self.utils.get_api_content("/guides", limit=limit, offset=offset)
             if not guides or len(guides) == 0:
                 break
@@ -107,12 +167,26 @@ class ScraperGuide(ScraperGeneric):
                 # we ignore archived guides since they are not accessible anywayß
                 if "GUIDE_ARCHIVED" in guide["flags"]:
                     continue
-                if guide["revisionid"] == 0:
+                revisionid = guide.get("revisionid")
+                if revisionid == 0:
                     logger.warning("Found one guide with revisionid=0")
                 guideid = guide["guideid"]
                 # Unfortunately for now iFixit API always returns "en" as language
                 # on this endpoint, so we consider it as unknown for now
-                self._add_guide_to_scrape(guideid, UNKNOWN_TITLE, UNKNOWN_LOCALE, True)
+                self._add_guide_to_scrape(
+                    guideid,
+                    UNKNOWN_TITLE,
+                    UNKNOWN_LOCALE,
+                    True,
+                    # without revision, guide is only reused if its content is same
+                    revision=(
+                        f"{revisionid}/{guide.get('modified_date')}"
+                        if revisionid
+                        else None
+                    ),
+                    listed_cost=self._get_listed_guide_cost(guide),
+                    url=guide.get("url"),
+                )
             offset += limit
             if self.configuration.scrape_only_first_items:
                 logger.warning(
@@ -122,9 +196,23 @@ class ScraperGuide(ScraperGeneric):
                 break
         logger.info(f"{len(self.expected_items_keys)} guides found")
 
+    @staticmethod
+    def _get_listed_guide_cost(guide):
+        """guide cost from listing, which has no steps but time required to follow
+        them: one unit per minute, in line with estimate_item_cost of usual guides"""
+        return 1 + int(guide.get("time_required_max") or 0) // 60
+
+    def estimate_listed_item_cost(self, item_key, item_data):  # noqa ARG002
+        return item_data.get("listed_cost") or 0
+
     def get_one_item_content(self, item_key, item_data):
         guideid = item_key
         guide = item_data
+        if guide["locale"] == UNKNOWN_LOCALE and guideid in self.guides_locales:
+            locale, title = self.guides_locales[guideid]
+            guide["locale"] = locale
+            if guide["guidetitle"] == UNKNOWN_TITLE:
+                guide["guidetitle"] = title
         locale = guide["locale"]
         if locale == UNKNOWN_LOCALE:
             locale = self.configuration.lang_code  # fallback value
@@ -140,14 +228,31 @@ class ScraperGuide(ScraperGeneric):
 
         return guide_content
 
+    def estimate_item_cost(self, item_content):
+        # images retrieval and rendering grow with steps, lines and comments
+        guide_content = item_content
+        cost = 1 + self.processor.get_item_comments_count(guide_content)
+        for step in guide_content.get("steps", []):
+            cost += (
+                1
+                + len(step.get("lines", []))
+                + self.processor.get_item_comments_count(step)
+            )
+            media = step.get("media") or {}
+            if media.get("type") == "image":
+                cost += len(media.get("data") or [])
+        return cost
+
     def add_item_redirect(self, item_key, item_data, redirect_kind):
         guideid = item_key
         guide = item_data
-        guidetitle = guide["guidetitle"]
-        if guidetitle == UNKNOWN_TITLE:
-            logger.warning(f"Cannot add redirect for guide {guideid} in error")
-            return
-        path = self._build_guide_path(guideid, guidetitle)
+        # guide path does not depend on its title, which might still be unknown
+        path = self._build_guide_path(
+            guideid,
+            guide["guidetitle"],
+            offline=redirect_kind == "not_scrapped",
+            url=guide.get("url"),
+        )
         self.processor.add_redirect(
             path=path,
             target_path=f"home/{redirect_kind}?{urllib.parse.urlencode({'url':path})}",
@@ -9,6 +9,9 @@ from ifixit2zim.shared import logger
 
 
 class ScraperHomepage(ScraperGeneric):
+    # home and not_here pages are targets of redirects
+    required_for_zim = True
+
     def __init__(self, context: Context):
         super().__init__(context)
 
@@ -83,65 +86,27 @@ class ScraperHomepage(ScraperGeneric):
             kind="error",
         )
 
-        with self.lock:
-            if not self.creator:
-                raise Exception("Please set creator first")
-
-            self.creator.add_item_for(
-                path="home/home",
-                title=self.configuration.title,
-                content=homepage,
-                mimetype="text/html",
-                is_front=True,
-            )
-
-            self.creator.add_redirect(path=DEFAULT_HOMEPAGE, target_path="home/home")
-
-            self.creator.add_item_for(
-                path="home/not_scrapped",
-                title=self.configuration.title,
-                content=not_scrapped,
-                mimetype="text/html",
-                is_front=False,
-            )
-
-            self.creator.add_item_for(
-                path="home/external_content",
-                title=self.configuration.title,
-                content=external_content,
-                mimetype="text/html",
-                is_front=False,
-            )
-
-            self.creator.add_item_for(
-                path="home/unavailable_offline",
-                title=self.configuration.title,
-                content=unavailable_offline,
-                mimetype="text/html",
-                is_front=False,
-            )
-
-            self.creator.add_item_for(
-                path="home/not_yet_available",
-                title=self.configuration.title,
-                content=not_yet_available,
-                mimetype="text/html",
-                is_front=False,
-            )
-
-            self.creator.add_item_for(
-                path="home/missing",
-                title=self.configuration.title,
-                content=missing,
-                mimetype="text/html",
-                is_front=False,
-            )
+        self.processor.add_html_item(
+            path="home/home",
+            title=self.configuration.title,
+            content=homepage,
+            is_front=True,
+        )
 
-            self.creator.add_item_for(
-                path="home/error",
+        self.processor.add_redirect(path=DEFAULT_HOMEPAGE, target_path="home/home")
+
+        for path, content in (
+            ("home/not_scrapped", not_scrapped),
+            ("home/external_content", external_content),
+            ("home/unavailable_offline", unavailable_offline),
+            ("home/not_yet_available", not_yet_available),
+            ("home/missing", missing),
+            ("home/error", error_content),
+        ):
+            self.processor.add_html_item(
+                path=path,
                 title=self.configuration.title,
-                content=error_content,
-                mimetype="text/html",
+                content=content,
                 is_front=False,
             )
 
@@ -17,23 +17,35 @@ class ScraperInfo(ScraperGeneric):
     def get_items_name(self):
         return "info"
 
-    def _add_info_to_scrape(self, info_key, info_title, is_expected):
+    def _add_info_to_scrape(self, info_key, info_title, is_expected, revision=None):
         self.add_item_to_scrape(
             info_key,
             {
                 "info_title": info_title,
+                "revision": revision,
             },
             is_expected,
         )
 
+    def get_item_revision(self, item_key, item_data):  # noqa ARG002
+        return item_data.get("revision")
+
     def _get_info_key_from_title(self, info_title):
         return self.processor.convert_title_to_filename(info_title.lower())
 
-    def _build_info_path(self, info_title):
+    def _build_info_path(self, info_title, *, offline=False):
         href = (
             self.configuration.main_url.geturl()
             + f"/Info/{info_title.replace('/', ' ')}"
         )
+        if offline:
+            return self.processor.get_known_href(
+                href,
+                "/Info/"
+                + self.processor.convert_title_to_filename(
+                    info_title.replace("/", " ")
+                ),
+            )[1:]
         final_href = self.processor.normalize_href(href)
         return final_href[1:]
 
@@ -76,7 +88,7 @@ class ScraperInfo(ScraperGeneric):
         logger.info("Downloading list of info")
         limit = 200
         offset = 0
-        while True:
+        while not self.listing_cancelled.is_set():
             info_wikis = self.utils.get_api_content(
                 "/wikis/INFO", limit=limit, offset=offset
             )
@@ -85,7 +97,13 @@ class ScraperInfo(ScraperGeneric):
             for info_wiki in info_wikis:
                 info_title = info_wiki["title"]
                 info_key = self._get_info_key_from_title(info_title)
-                self._add_info_to_scrape(info_key, info_title, True)
+                revision = None
+                if info_wiki.get("revisionid") or info_wiki.get("modified_date"):
+                    revision = (
+                        f"{info_wiki.get('revisionid')}/"
+                        f"{info_wiki.get('modified_date')}"
+                    )
+                self._add_info_to_scrape(info_key, info_title, True, revision=revision)
             offset += limit
             if self.configuration.scrape_only_first_items:
                 logger.warning(
@@ -101,7 +119,9 @@ class ScraperInfo(ScraperGeneric):
         return info_wiki_content
 
     def add_item_redirect(self, item_key, item_data, redirect_kind):  # noqa ARG002
-        path = self._build_info_path(item_data["info_title"])
+        path = self._build_info_path(
+            item_data["info_title"], offline=redirect_kind == "not_scrapped"
+        )
         self.processor.add_redirect(
             path=path,
             target_path=f"home/{redirect_kind}?{urllib.parse.urlencode({'url':path})}",
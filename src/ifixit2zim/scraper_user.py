@@ -28,16 +28,31 @@ class ScraperUser(ScraperGeneric):
             is_expected,
             warn_unexpected=False,
         )
+
+    def item_seen(self, item_key, item_data):  # noqa ARG002
+        # all titles are needed, even for known users, to add alternate redirects
+        userid = item_data["userid"]
+        usertitle = item_data["usertitle"]
         if userid in self.user_id_to_titles:
             self.user_id_to_titles[userid].append(usertitle)
         else:
             self.user_id_to_titles[userid] = [usertitle]
 
-    def _build_user_path(self, userid, usertitle):
+    def get_item_content_hash(self, item_key, item_data, item_content):  # noqa ARG002
+        # alternate titles redirects depend on all titles seen during the run
+        return None
+
+    def _build_user_path(self, userid, usertitle, *, offline=False):
         href = (
             self.configuration.main_url.geturl()
             + f"/User/{userid}/{usertitle.replace('/', ' ')}"
         )
+        if offline:
+            return self.processor.get_known_href(
+                href,
+                f"/User/{userid}/"
+                + self.processor.convert_title_to_slug(usertitle.replace("/", " ")),
+            )[1:]
         final_href = self.processor.normalize_href(href)
         return final_href[1:]
 
@@ -50,13 +65,16 @@ class ScraperUser(ScraperGeneric):
         usertitle = user["username"]
         if not usertitle:
             usertitle = "User"
+        self._set_user_title(userid, usertitle)
+        return self.get_user_link_from_props(userid=userid, usertitle=usertitle)
+
+    def _set_user_title(self, userid, usertitle):
         # override unknown title if needed
         if (
             userid in self.expected_items_keys
             and self.expected_items_keys[userid]["usertitle"] == UNKNOWN_TITLE
         ):
             self.expected_items_keys[userid]["usertitle"] = usertitle
-        return self.get_user_link_from_props(userid=userid, usertitle=usertitle)
 
     def get_user_link_from_props(self, userid, usertitle):
         user_path = urllib.parse.quote(
@@ -106,7 +124,9 @@ class ScraperUser(ScraperGeneric):
         if usertitle == UNKNOWN_TITLE:
             logger.warning(f"Cannot add redirect for user {userid} in error")
             return
-        path = self._build_user_path(userid, usertitle)
+        path = self._build_user_path(
+            userid, usertitle, offline=redirect_kind == "not_scrapped"
+        )
         self.processor.add_redirect(
             path=path,
             target_path=f"home/{redirect_kind}?{urllib.parse.urlencode({'url':path})}",
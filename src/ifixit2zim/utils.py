@@ -1,4 +1,4 @@
-import io
+import email.utils
 import re
 import urllib.parse
 import zlib
@@ -9,9 +9,8 @@ import bs4
 import requests
 from kiwixstorage import KiwixStorage
 from pif import get_public_ip
-from zimscraperlib.download import stream_file
 
-from ifixit2zim.constants import API_PREFIX, Configuration
+from ifixit2zim.constants import API_PREFIX, IMAGE_VARIANTS, Configuration
 from ifixit2zim.shared import logger
 
 
@@ -25,6 +24,9 @@ def backoff_hdlr(details):
 
 def fatal_code(e):
     """Give up on errors codes 400-499 except 429"""
+    # timeouts and connection errors come without response, they are retried
+    if e.response is None:
+        return False
     logger.warning(f"Fatal code {e.response.status_code}")
     return (
         HTTPStatus.BAD_REQUEST
@@ -34,6 +36,63 @@ def fatal_code(e):
     )
 
 
+image_variant_regex = re.compile(
+    r"^(?P<base>https?://[\w.-]+\.cdn\.ifixit\.com/igi/[\w-]+)"
+    r"\.(?P<variant>" + "|".join(map(re.escape, IMAGE_VARIANTS)) + r")$"
+)
+
+
+def get_image_variant(url: str) -> tuple[str, int] | tuple[None, None]:
+    """base URL and size rank of an iFixit CDN image variant, None otherwise
+
+    The same image is referenced with different size variants, only one of them
+    is to be downloaded and encoded."""
+    if match := image_variant_regex.match(url):
+        return match.group("base"), IMAGE_VARIANTS.index(match.group("variant"))
+    return None, None
+
+
+def get_image_variant_url(base: str, rank: int) -> str:
+    return f"{base}.{IMAGE_VARIANTS[rank]}"
+
+
+def get_version_ident(headers) -> str:
+    """~version~ of the URL data to use for comparisons. Built from headers"""
+    for header in ("ETag", "Last-Modified", "Content-Length"):
+        if headers.get(header):
+            return headers.get(header)
+    return "-1"
+
+
+def get_conditional_headers(ident: str) -> dict[str, str]:
+    """request headers to download data only if it changed since version ident
+
+    Idents built from Content-Length can't be revalidated: data is downloaded
+    again and its ident compared afterwards."""
+    if ident.startswith(('"', "W/")):
+        return {"If-None-Match": ident}
+    try:
+        email.utils.parsedate_to_datetime(ident)
+    except (TypeError, ValueError):
+        return {}
+    return {"If-Modified-Since": ident}
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """whether an error is likely to go away when trying again later"""
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return (
+            exc.response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+            or exc.response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        )
+    return isinstance(
+        exc,
+        requests.exceptions.ConnectionError
+        | requests.exceptions.Timeout
+        | requests.exceptions.ChunkedEncodingError,
+    )
+
+
 class Utils:
     def __init__(self, configuration: Configuration) -> None:
         self.configuration = configuration
@@ -129,30 +188,6 @@ class Utils:
         """URL-decoded category identifier"""
         return urllib.parse.unquote(ident)
 
-    def get_version_ident_for(self, url: str) -> str | None:
-        """~version~ of the URL data to use for comparisons. Built from headers"""
-        try:
-            resp = requests.head(url, timeout=10)
-            headers = resp.headers
-        except Exception as exc:
-            logger.warning(f"Unable to HEAD {url}", exc_info=exc)
-            try:
-                _, headers = stream_file(
-                    url=url,
-                    byte_stream=io.BytesIO(),
-                    block_size=1,
-                    only_first_block=True,
-                )
-            except Exception as exc:
-                logger.warning(f"Unable to query image at {url}", exc_info=exc)
-                return
-
-        for header in ("ETag", "Last-Modified", "Content-Length"):
-            if headers.get(header):
-                return headers.get(header)
-
-        return "-1"
-
     def setup_s3_and_check_credentials(self, s3_url_with_credentials):
         logger.info("testing S3 Optimization Cache credentials")
         s3_storage = KiwixStorage(s3_url_with_credentials)
@@ -178,6 +213,12 @@ class Utils:
         full_path = self.get_url(API_PREFIX + path, **params)
         logger.debug(f"Retrieving {full_path}")
         response = requests.get(full_path, timeout=self.configuration.request_timeout)
+        # server errors are retried, then raised instead of being taken for missing
+        if (
+            response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+            or response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        ):
+            response.raise_for_status()
         json_data = (
             response.json()
             if response and response.status_code == HTTPStatus.OK
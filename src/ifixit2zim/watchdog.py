@@ -0,0 +1,103 @@
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Callable
+
+from ifixit2zim.shared import logger
+
+# delay between two checks of items deadlines
+WATCHDOG_INTERVAL = 1.0
+
+
+class WatchedItem:
+    """An item being processed by a pipeline stage worker"""
+
+    def __init__(self, scraper, item_key, item_data, stage):
+        self.scraper = scraper
+        self.item_key = item_key
+        self.item_data = item_data
+        self.stage = stage
+        self.thread = threading.current_thread()
+        self.started = time.monotonic()
+        self.paused_at = None
+        self.timed_out = False
+
+    def pause(self):
+        """stop the clock, e.g. while worker is blocked on a full queue"""
+        self.paused_at = time.monotonic()
+
+    def resume(self):
+        """restart the clock, time spent paused not counting toward deadline"""
+        paused_at = self.paused_at
+        if paused_at is None:
+            return
+        # started is moved before unpausing, never exposing a stale elapsed time
+        self.started += time.monotonic() - paused_at
+        self.paused_at = None
+
+    def is_expired(self, now: float, timeout: float) -> bool:
+        return self.paused_at is None and now - self.started > timeout
+
+
+class Watchdog:
+    """Enforces a deadline on processing of every item by a pipeline stage
+
+    Workers watch items when they start processing them and unwatch them once
+    done, pausing the clock while blocked on a full queue. Items past deadline
+    are flagged as timed out and handed to `on_timeout` along with the current
+    stack of their worker, so that the item can be marked in error and the
+    worker replaced. Python threads can't be interrupted: the
+    stuck worker is left running and its results discarded."""
+
+    def __init__(self, timeout: float, on_timeout: Callable[[WatchedItem, str], None]):
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.nb_timed_out = 0
+        self._items = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="WATCHDOG-T")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def watch(self, scraper, item_key, item_data, stage) -> WatchedItem:
+        """start watching an item processed by current thread"""
+        item = WatchedItem(scraper, item_key, item_data, stage)
+        with self._lock:
+            self._items.add(item)
+        return item
+
+    def unwatch(self, item: WatchedItem) -> bool:
+        """stop watching item, returning whether it completed within deadline"""
+        with self._lock:
+            self._items.discard(item)
+            return not item.timed_out
+
+    def _run(self):
+        while not self._stopped.wait(WATCHDOG_INTERVAL):
+            now = time.monotonic()
+            with self._lock:
+                expired = [
+                    item for item in self._items if item.is_expired(now, self.timeout)
+                ]
+                for item in expired:
+                    item.timed_out = True
+                    self._items.discard(item)
+                self.nb_timed_out += len(expired)
+            for item in expired:
+                frame = sys._current_frames().get(item.thread.ident)
+                stack = "".join(traceback.format_stack(frame)) if frame else ""
+                try:
+                    self.on_timeout(item, stack)
+                except Exception as exc:
+                    logger.error("Failed to handle timed out item", exc_info=exc)
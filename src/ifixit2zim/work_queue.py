@@ -0,0 +1,187 @@
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import zlib
+
+PENDING = "pending"
+CLAIMED = "claimed"
+SKIPPED = "skipped"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT,
+    expected INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    shard INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS items_pending
+    ON items (status, shard, expected DESC, depth);
+CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS flags (name TEXT PRIMARY KEY);
+"""
+
+
+def connect(fpath: pathlib.Path) -> sqlite3.Connection:
+    """sqlite connection suitable for concurrent use from several processes"""
+    conn = sqlite3.connect(fpath, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SqliteStore:
+    """Base of sqlite-backed stores shared by several processes
+
+    Connections can't be shared across threads nor forked processes: each thread
+    of each process lazily opens its own."""
+
+    schema = ""
+
+    def __init__(self, fpath: pathlib.Path):
+        self.fpath = fpath
+        self._local = threading.local()
+
+    def create(self):
+        self.fpath.parent.mkdir(parents=True, exist_ok=True)
+        self.conn.executescript(self.schema)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = connect(self.fpath)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+
+class WorkQueue(SqliteStore):
+    """Queue of items to scrape shared by all worker processes
+
+    Items are sharded by kind and key hash: each worker claims items of its own
+    shard first and only takes items of other shards once its own is drained.
+    Being keyed on (kind, key), an item discovered by several processes is only
+    queued once.
+
+    Expected items are claimed first, then by discovery depth"""
+
+    schema = SCHEMA
+
+    def __init__(self, fpath: pathlib.Path, nb_shards: int):
+        super().__init__(fpath)
+        self.nb_shards = nb_shards
+
+    def get_shard(self, kind: str, item_key: str) -> int:
+        return zlib.crc32(f"{kind}/{item_key}".encode()) % self.nb_shards
+
+    def add(self, kind, item_key, item_data, *, is_expected, depth) -> bool:
+        """queue an item, returning whether it was unknown so far"""
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                kind,
+                item_key,
+                json.dumps(item_data),
+                int(is_expected),
+                depth,
+                self.get_shard(kind, item_key),
+                PENDING,
+            ),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, shard: int) -> dict | None:
+        """next item to scrape for a worker, None if nothing is pending"""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # own shard first, then any other one
+            row = (
+                conn.execute(
+                    "SELECT kind, key, data, depth FROM items "
+                    "WHERE status = ? AND shard = ? "
+                    "ORDER BY expected DESC, depth, rowid LIMIT 1",
+                    (PENDING, shard),
+                ).fetchone()
+                or conn.execute(
+                    "SELECT kind, key, data, depth FROM items "
+                    "WHERE status = ? "
+                    "ORDER BY expected DESC, depth, rowid LIMIT 1",
+                    (PENDING,),
+                ).fetchone()
+            )
+            if row:
+                conn.execute(
+                    "UPDATE items SET status = ? WHERE kind = ? AND key = ?",
+                    (CLAIMED, row[0], row[1]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        kind, key, data, depth = row
+        return {"kind": kind, "key": key, "data": json.loads(data), "depth": depth}
+
+    def complete(self, kind: str, item_key: str, status: str):
+        self.conn.execute(
+            "UPDATE items SET status = ? WHERE kind = ? AND key = ?",
+            (status, kind, item_key),
+        )
+
+    def claim_image(self, path: str) -> bool:
+        """whether this process is the first one to request processing of image"""
+        cursor = self.conn.execute("INSERT OR IGNORE INTO images VALUES (?)", (path,))
+        return cursor.rowcount == 1
+
+    def set_listings_done(self):
+        self.conn.execute("INSERT OR IGNORE INTO flags VALUES ('listings_done')")
+
+    def is_drained(self) -> bool:
+        """whether listings are done and all items have been processed"""
+        conn = self.conn
+        if not conn.execute(
+            "SELECT 1 FROM flags WHERE name = 'listings_done'"
+        ).fetchone():
+            return False
+        return not conn.execute(
+            "SELECT 1 FROM items WHERE status IN (?, ?) LIMIT 1", (PENDING, CLAIMED)
+        ).fetchone()
+
+    def are_done(self, kinds: tuple[str, ...]) -> bool:
+        """whether listings are done and all items of these kinds were processed"""
+        conn = self.conn
+        if not conn.execute(
+            "SELECT 1 FROM flags WHERE name = 'listings_done'"
+        ).fetchone():
+            return False
+        return not any(
+            conn.execute(
+                "SELECT 1 FROM items WHERE kind = ? AND status IN (?, ?) LIMIT 1",
+                (kind, PENDING, CLAIMED),
+            ).fetchone()
+            for kind in kinds
+        )
+
+    def get_progress(self) -> tuple[int, int]:
+        """number of items done and total number of items"""
+        done, total = self.conn.execute(
+            "SELECT SUM(status NOT IN (?, ?)), COUNT(*) FROM items", (PENDING, CLAIMED)
+        ).fetchone()
+        return done or 0, total
+
+    def get_nb_images(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def get_items(self, kind: str):
+        """all items of a kind, as (key, data, is_expected, depth, status)"""
+        for key, data, expected, depth, status in self.conn.execute(
+            "SELECT key, data, expected, depth, status FROM items WHERE kind = ?",
+            (kind,),
+        ):
+            yield key, json.loads(data), bool(expected), depth, status
@@ -41,6 +41,18 @@ def coverage(ctx: Context, args: str = "", *, html: bool = False):
     report_cov(ctx, html=html)
 
 
+@task(
+    optional=["args"],
+    help={
+        "corpus": "directory of sample source images",
+        "args": "encoder_benchmark additional arguments",
+    },
+)
+def benchmark_encoders(ctx: Context, corpus: str, args: str = ""):
+    """report encode time and size of images encoder profiles on a corpus"""
+    ctx.run(f"python -m ifixit2zim.encoder_benchmark {corpus} {args}", pty=use_pty)
+
+
 @task(optional=["args"], help={"args": "black additional arguments"})
 def lint_black(ctx: Context, args: str = "."):
     args = args or "."  # needed for hatch script
@@ -0,0 +1,40 @@
+import io
+
+from PIL import Image
+
+from ifixit2zim.constants import DEFAULT_ENCODER_PROFILE, ENCODER_PROFILE_FAST
+from ifixit2zim.encode_pool import EncodePool, encode_webp
+from ifixit2zim.encoder_benchmark import benchmark
+from ifixit2zim.image_buffer import ImageBuffer
+
+
+def test_encode_pool():
+    png = io.BytesIO()
+    Image.new("RGB", (64, 48), color="red").save(png, format="PNG")
+    # spooled to disk, read back in shared memory
+    src = ImageBuffer.wrap(png, spool_size=10)
+
+    pool = EncodePool(nb_processes=2)
+    pool.start()
+    try:
+        webp = pool.encode(src, DEFAULT_ENCODER_PROFILE)
+    finally:
+        pool.shutdown()
+
+    assert webp.getvalue() == encode_webp(src).getvalue()
+    with Image.open(webp) as img:
+        assert img.format == "WEBP"
+        assert img.size == (64, 48)
+
+
+def test_encoder_profiles():
+    src = io.BytesIO()
+    Image.radial_gradient("L").convert("RGB").save(src, format="PNG")
+
+    results = benchmark([src.getvalue()], repeat=2)
+    assert all(result.nb_images == 1 for result in results.values())
+    assert results[ENCODER_PROFILE_FAST].size != results[DEFAULT_ENCODER_PROFILE].size
+    src.seek(0)
+    with Image.open(encode_webp(src, ENCODER_PROFILE_FAST)) as img:
+        assert img.format == "WEBP"
+        assert img.size == (256, 256)
@@ -0,0 +1,42 @@
+import hashlib
+
+from ifixit2zim.image_buffer import ImageBuffer
+
+
+def test_image_buffer_in_memory():
+    with ImageBuffer(spool_size=100) as buffer:
+        buffer.write(b"abc")
+        buffer.write(memoryview(b"def"))
+        assert buffer.fpath is None
+        assert buffer.digest == hashlib.sha256(b"abcdef").digest()
+        assert buffer.size == 6
+        assert buffer.get_item_kwargs() == {"content": b"abcdef"}
+
+
+def test_image_buffer_spooled(tmp_path):
+    buffer = ImageBuffer(spool_size=4, directory=tmp_path)
+    buffer.write(b"abc")
+    buffer.write(b"def")
+    fpath = buffer.fpath
+    assert fpath.parent == tmp_path
+    assert buffer.digest == hashlib.sha256(b"abcdef").digest()
+    buffer.seek(0)
+    assert buffer.read() == b"abcdef"
+
+    # kept until creator calls back
+    kwargs = buffer.get_item_kwargs()
+    assert kwargs["fpath"].read_bytes() == b"abcdef"
+    buffer.release()
+    assert fpath.exists()
+    kwargs["callback"]()
+    assert not fpath.exists()
+
+
+def test_image_buffer_wrap(tmp_path):
+    buffer = ImageBuffer.wrap(b"abcdef", spool_size=4, directory=tmp_path)
+    assert buffer.fpath.read_bytes() == b"abcdef"
+    assert buffer.digest == hashlib.sha256(b"abcdef").digest()
+    with buffer.open() as fileobj:
+        assert fileobj.read() == b"abcdef"
+    buffer.release()
+    assert not list(tmp_path.iterdir())
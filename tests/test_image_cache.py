@@ -0,0 +1,44 @@
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.image_cache import ImageCache
+
+
+def _open(tmp_path, max_size):
+    cache = ImageCache(tmp_path / "cache", max_size=max_size)
+    cache.open()
+    return cache
+
+
+def test_image_cache_keys(tmp_path):
+    cache = _open(tmp_path, max_size=1000)
+    cache.put("https://example.com/a.jpg", "etag1", ImageBuffer.wrap(b"webp"))
+    assert cache.get("https://example.com/a.jpg") == ("etag1", b"webp")
+    assert cache.get("https://example.com/b.jpg") is None
+    assert (cache.nb_hits, cache.nb_misses) == (1, 1)
+    # kept across runs
+    cache = _open(tmp_path, max_size=1000)
+    assert cache.total_size == 4
+    assert cache.get("https://example.com/a.jpg") == ("etag1", b"webp")
+
+
+def test_image_cache_new_version(tmp_path):
+    cache = _open(tmp_path, max_size=1000)
+    cache.put("https://example.com/a.jpg", "etag1", ImageBuffer.wrap(b"webp"))
+    cache.put("https://example.com/a.jpg", "etag2", ImageBuffer.wrap(b"new webp"))
+
+    assert cache.get("https://example.com/a.jpg") == ("etag2", b"new webp")
+    assert cache.total_size == 8
+    assert len(list(cache.blobs.path.glob("*/*"))) == 1
+
+
+def test_image_cache_eviction(tmp_path):
+    cache = _open(tmp_path, max_size=250)
+    for name in "abc":
+        cache.put(name, "1", ImageBuffer.wrap(name.encode() * 100))
+        # a is used again, b is now the least recently used
+        cache.get("a")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ("1", b"a" * 100)
+    assert cache.get("c") == ("1", b"c" * 100)
+    assert cache.total_size == 200
+    assert len(list(cache.blobs.path.glob("*/*"))) == 2
@@ -0,0 +1,87 @@
+import threading
+from types import SimpleNamespace
+
+# imported first, other modules of the scraper import each other through it
+import ifixit2zim.scraper  # noqa: F401
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.imager import Imager
+
+
+class FakeCreator:
+    def __init__(self):
+        self.redirects = {}
+
+    def add_redirect(self, path, target_path):
+        self.redirects[path] = target_path
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, func, **kwargs):
+        kwargs.pop("dont_release", None)
+        self.tasks.append((func, kwargs))
+
+
+def _get_imager(tmp_path, img_executor=None):
+    return Imager(
+        img_executor=img_executor,
+        lock=threading.Lock(),
+        creator=FakeCreator(),
+        utils=SimpleNamespace(to_url=lambda url: url),
+        configuration=SimpleNamespace(s3_url=None, build_path=tmp_path),
+    )
+
+
+def test_convert_image_source_duplicates(tmp_path, monkeypatch):
+    imager = _get_imager(tmp_path)
+    creator = imager.creator
+    converted = []
+
+    def optimize_image(url, src):
+        converted.append(url)
+        return src
+
+    monkeypatch.setattr(imager, "optimize_image", optimize_image)
+
+    first = imager.convert_image(
+        "https://example.com/a.jpg", "images/a.webp", ImageBuffer.wrap(b"image")
+    )
+    second = imager.convert_image(
+        "https://example.com/b.jpg", "images/b.webp", ImageBuffer.wrap(b"image")
+    )
+    assert first is not None
+    assert second is None
+    assert converted == ["https://example.com/a.jpg"]
+    assert creator.redirects == {"images/b.webp": "images/a.webp"}
+    assert imager.nb_source_duplicates == 1
+
+
+def test_image_variants(tmp_path, monkeypatch):
+    executor = FakeExecutor()
+    imager = _get_imager(tmp_path, executor)
+    processed = []
+
+    def process_image(url, path, mimetype, buffers):  # noqa: ARG001
+        processed.append(url.geturl())
+
+    monkeypatch.setattr(imager, "_process_image", process_image)
+    base = "https://guide-images.cdn.ifixit.com/igi/mUdKTWtrMGMEcQhS"
+    thumbnail_path = imager.defer(f"{base}.thumbnail")
+    standard_path = imager.defer(f"{base}.standard")
+    assert thumbnail_path != standard_path
+    # a single task for both variants, processing the largest one
+    assert len(executor.tasks) == 1
+    func, kwargs = executor.tasks.pop()
+    func(**kwargs)
+    assert processed == [f"{base}.standard"]
+    assert imager.creator.redirects == {thumbnail_path: standard_path}
+
+    # smaller variants referenced afterwards are redirected right away
+    small_path = imager.defer(f"{base}.200x150")
+    assert not executor.tasks
+    assert imager.creator.redirects[small_path] == standard_path
+    # larger ones are processed
+    imager.defer(f"{base}.large")
+    assert len(executor.tasks) == 1
@@ -0,0 +1,23 @@
+from ifixit2zim.item_costs import ItemCosts
+
+
+def test_costs_persisted(tmp_path):
+    fpath = tmp_path / "costs.json"
+    costs = ItemCosts(fpath)
+    costs.load()
+    assert costs.get("guide", "12") == 0
+    costs.record("guide", "12", 42)
+    costs.save()
+
+    costs = ItemCosts(fpath)
+    costs.load()
+    assert costs.get("guide", "12") == 42
+    assert costs.get("category", "12", default=1) == 1
+
+
+def test_unreadable_costs_ignored(tmp_path):
+    fpath = tmp_path / "costs.json"
+    fpath.write_text("not json")
+    costs = ItemCosts(fpath)
+    costs.load()
+    assert costs.get("guide", "12") == 0
@@ -0,0 +1,93 @@
+from queue import Empty
+
+import pytest
+
+from ifixit2zim.items_queue import DISCOVERED, EXPECTED, ItemsQueue
+
+
+def test_empty_queue():
+    items = ItemsQueue()
+    assert items.empty()
+    assert items.qsize() == 0
+    with pytest.raises(Empty):
+        items.get(block=False)
+
+
+def test_depth_then_insertion_order():
+    items = ItemsQueue()
+    items.put("deep", klass=DISCOVERED, depth=2)
+    items.put("first", klass=DISCOVERED, depth=1)
+    items.put("second", klass=DISCOVERED, depth=1)
+    assert [items.get() for _ in range(3)] == ["first", "second", "deep"]
+    assert items.empty()
+
+
+def test_expected_first_by_default():
+    items = ItemsQueue()
+    items.put("d0", klass=DISCOVERED, depth=1)
+    items.put("e0", klass=EXPECTED)
+    assert items.get() == "e0"
+    items.put("e1", klass=EXPECTED)
+    items.put("d1", klass=DISCOVERED)
+    assert [items.get() for _ in range(3)] == ["e1", "d1", "d0"]
+
+
+def test_class_weights():
+    items = ItemsQueue(weights={EXPECTED: 3, DISCOVERED: 1})
+    for index in range(6):
+        items.put(f"e{index}", klass=EXPECTED)
+        items.put(f"d{index}", klass=DISCOVERED, depth=1)
+    assert items.qsize() == 12
+    order = [items.get() for _ in range(8)]
+    assert order == ["e0", "d0", "e1", "e2", "e3", "d1", "e4", "e5"]
+
+
+def test_class_resynchronized_when_active_again():
+    items = ItemsQueue(weights={EXPECTED: 1, DISCOVERED: 1})
+    for index in range(4):
+        items.put(f"e{index}", klass=EXPECTED)
+    assert [items.get() for _ in range(4)] == ["e0", "e1", "e2", "e3"]
+    # expected class is idle, discovered class must not starve it when it is back
+    for index in range(4):
+        items.put(f"d{index}", klass=DISCOVERED, depth=1)
+    assert items.get() == "d0"
+    for index in range(4, 6):
+        items.put(f"e{index}", klass=EXPECTED)
+    assert [items.get() for _ in range(4)] == ["e4", "d1", "e5", "d2"]
+
+
+def test_class_ahead_not_reset_when_active_again():
+    items = ItemsQueue(weights={EXPECTED: 1, DISCOVERED: 1})
+    for index in range(4):
+        items.put(f"e{index}", klass=EXPECTED)
+    items.put("d0", klass=DISCOVERED, depth=1)
+    assert [items.get() for _ in range(5)] == ["e0", "d0", "e1", "e2", "e3"]
+    # expected class is ahead, coming back must not give it more than its share
+    for index in range(1, 5):
+        items.put(f"d{index}", klass=DISCOVERED, depth=1)
+    for index in range(4, 6):
+        items.put(f"e{index}", klass=EXPECTED)
+    assert [items.get() for _ in range(6)] == ["d1", "e4", "d2", "e5", "d3", "d4"]
+
+
+def test_longest_first():
+    items = ItemsQueue(longest_first=True)
+    items.put("light", cost=1)
+    items.put("heavy", cost=10)
+    items.put("unknown")
+    items.put("discovered", klass=DISCOVERED, depth=1, cost=100)
+    items.put("shallow-light", cost=1)
+    assert [items.get() for _ in range(5)] == [
+        "heavy",
+        "light",
+        "shallow-light",
+        "unknown",
+        "discovered",
+    ]
+
+
+def test_cost_ignored_unless_longest_first():
+    items = ItemsQueue()
+    items.put("light", cost=1)
+    items.put("heavy", cost=10)
+    assert [items.get() for _ in range(2)] == ["light", "heavy"]
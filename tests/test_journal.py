@@ -0,0 +1,87 @@
+import hashlib
+
+import pytest
+
+from ifixit2zim.journal import Journal
+
+
+def test_journal_roundtrip(tmp_path):
+    journal = Journal(tmp_path / "journal")
+    journal.open(resume=False)
+    journal.record_discovered("guide", "12", {"guideid": 12}, is_expected=True, depth=0)
+    journal.record_discovered("user", "3", {"userid": 3}, is_expected=False, depth=1)
+    journal.record_entry(
+        "add_item_for",
+        {
+            "path": "Guide/12",
+            "title": "A guide",
+            "content": "<html/>",
+            "is_front": True,
+        },
+    )
+    journal.record_entry("add_redirect", {"path": "Guide/a", "target_path": "Guide/12"})
+    journal.record_done("guide", "12", "ok")
+    journal.record_image("https://example.com/image.jpg")
+    journal.record_dedup(b"\x01\x02", "images/a.webp")
+    journal.close()
+
+    state = Journal(tmp_path / "journal").read()
+    assert [entry["path"] for entry in state.entries] == ["Guide/12", "Guide/a"]
+    assert state.written_paths == {"Guide/12", "Guide/a"}
+    blob_path = journal.get_blob_path(state.entries[0]["blob"])
+    assert blob_path.read_text() == "<html/>"
+    assert set(state.discovered.keys()) == {("guide", "12"), ("user", "3")}
+    assert state.discovered[("user", "3")]["depth"] == 1
+    assert state.done == {("guide", "12"): "ok"}
+    assert state.images == ["https://example.com/image.jpg"]
+    assert state.dedup == {b"\x01\x02": "images/a.webp"}
+
+
+def test_journal_resume_and_truncated_record(tmp_path):
+    journal = Journal(tmp_path / "journal")
+    journal.open(resume=False)
+    journal.record_done("guide", "12", "ok")
+    journal.close()
+    with open(journal.fpath, "a") as fh:
+        fh.write('{"op": "done", "kind"')
+
+    journal = Journal(tmp_path / "journal")
+    assert journal.read().done == {("guide", "12"): "ok"}
+    journal.open(resume=True)
+    journal.record_done("guide", "13", "missing")
+    journal.close()
+    assert len(journal.read().done) == 2
+
+    journal.open(resume=False)
+    journal.close()
+    assert journal.read().done == {}
+
+
+def test_journal_refuses_to_remove_other_directory(tmp_path):
+    (tmp_path / "notes.txt").write_text("not a journal")
+    with pytest.raises(ValueError):
+        Journal(tmp_path).open(resume=False)
+    assert (tmp_path / "notes.txt").exists()
+
+
+def test_journal_links_file_of_known_digest(tmp_path):
+    journal = Journal(tmp_path / "journal")
+    journal.open(resume=False)
+    fpath = tmp_path / "image_spooled"
+    fpath.write_bytes(b"webp")
+    digest = hashlib.sha256(b"webp").hexdigest()
+    journal.record_entry(
+        "add_item_for", {"path": "images/a.webp", "fpath": fpath}, digest
+    )
+    # content file might be removed once written, blob is kept
+    blob_path = journal.get_blob_path(digest)
+    assert blob_path.stat().st_ino == fpath.stat().st_ino
+    fpath.unlink()
+    journal.record_entry(
+        "add_item_for", {"path": "images/b.webp", "fpath": fpath}, digest
+    )
+    journal.close()
+
+    state = Journal(tmp_path / "journal").read()
+    assert [entry["blob"] for entry in state.entries] == [digest, digest]
+    assert blob_path.read_bytes() == b"webp"
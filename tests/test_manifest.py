@@ -0,0 +1,65 @@
+from ifixit2zim.manifest import Manifest
+
+FINGERPRINT = {"scraper": "ifixit2zim 1.0", "lang_code": "en"}
+
+
+def _build(path, fingerprint=FINGERPRINT):
+    manifest = Manifest(path, fingerprint=fingerprint)
+    manifest.record(
+        "guide",
+        "12",
+        revision="5/1700000000",
+        content_hash="abc",
+        operations=[
+            ("discover", "user", 3, {"userid": 3}, False, False),
+            ("image", "https://example.com/image.jpg"),
+            (
+                "add_item_for",
+                {"path": "Guide/12", "title": "A guide", "content": "<html/>"},
+            ),
+            ("add_redirect", {"path": "Guide/a", "target_path": "Guide/12"}),
+        ],
+    )
+    manifest.save()
+    return manifest
+
+
+def test_manifest_reuse(tmp_path):
+    _build(tmp_path)
+
+    manifest = Manifest(tmp_path, fingerprint=FINGERPRINT)
+    manifest.load()
+    assert manifest.get_reusable("guide", "12", revision="5/1700000000")
+    assert manifest.get_reusable("guide", "12", revision="6/1", content_hash="abc")
+    assert manifest.get_reusable("guide", "12", revision="6/1") is None
+    assert manifest.get_reusable("guide", "13", revision="5/1700000000") is None
+
+    record = manifest.get_reusable("guide", "12", content_hash="abc")
+    operation, kwargs = record["operations"][2]
+    assert operation == "add_item_for"
+    assert "content" not in kwargs
+    assert manifest.blobs.get_path(kwargs["blob"]).read_text() == "<html/>"
+
+
+def test_manifest_fingerprint_mismatch(tmp_path):
+    _build(tmp_path)
+
+    manifest = Manifest(tmp_path, fingerprint={**FINGERPRINT, "lang_code": "fr"})
+    manifest.load()
+    assert manifest.get_reusable("guide", "12", revision="5/1700000000") is None
+
+
+def test_manifest_prunes_unused_blobs(tmp_path):
+    previous = _build(tmp_path)
+    record = previous.current["guide/12"]
+    blob_path = previous.blobs.get_path(record["operations"][2][1]["blob"])
+
+    manifest = Manifest(tmp_path, fingerprint=FINGERPRINT)
+    manifest.load()
+    manifest.save()
+    assert not blob_path.exists()
+
+    manifest = _build(tmp_path)
+    manifest.keep("guide", "12", manifest.current["guide/12"])
+    manifest.save()
+    assert blob_path.exists()
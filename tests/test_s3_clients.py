@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+from kiwixstorage import NotFoundError
+
+from ifixit2zim.s3_clients import S3Clients
+
+S3_URL = "https://s3.example.com/?keyId=key&secretAccessKey=secret&bucketName=bucket"
+
+
+def test_s3_clients_per_thread():
+    s3_clients = S3Clients(S3_URL)
+    storages = [s3_clients.get(), s3_clients.get()]
+
+    def in_thread():
+        storages.append(s3_clients.get())
+
+    thread = threading.Thread(target=in_thread)
+    thread.start()
+    thread.join()
+
+    assert storages[0] is storages[1]
+    assert storages[2] is not storages[0]
+
+
+def test_s3_clients_metrics():
+    s3_clients = S3Clients(S3_URL)
+    with s3_clients.timed("download"):
+        pass
+    with pytest.raises(NotFoundError), s3_clients.timed("download"):
+        raise NotFoundError()
+    with pytest.raises(OSError), s3_clients.timed("upload"):
+        raise OSError()
+
+    download, upload = s3_clients.metrics["download"], s3_clients.metrics["upload"]
+    assert (download.requests, download.failed) == (2, 0)
+    assert (upload.requests, upload.failed) == (1, 1)
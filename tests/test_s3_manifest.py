@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from ifixit2zim.s3_manifest import S3Manifest
+
+
+class FakePaginator:
+    def paginate(self, Bucket, Prefix):  # noqa: N803
+        assert (Bucket, Prefix) == ("bucket", "images/")
+        yield {"Contents": [{"Key": "images/a.webp", "Size": 10}]}
+        yield {"Contents": [{"Key": "images/b.webp", "Size": 20}]}
+
+
+def test_s3_manifest(tmp_path):
+    s3_storage = SimpleNamespace(
+        bucket_name="bucket",
+        client=SimpleNamespace(get_paginator=lambda _: FakePaginator()),
+    )
+    manifest = S3Manifest(tmp_path / "s3_manifest.sqlite", prefix="images/")
+    manifest.create()
+    meta = {"ident": "1", "encoder_version": "1"}
+
+    # anything might be in bucket until it is listed
+    assert manifest.may_match("images/c.webp", meta)
+    manifest.record("images/b.webp", 30, {"ident": "2", "encoder_version": "1"})
+    manifest.start(s3_storage)
+    manifest._thread.join()
+
+    assert manifest.is_listed()
+    assert manifest.may_match("images/a.webp", meta)
+    assert not manifest.may_match("images/b.webp", meta)
+    assert not manifest.may_match("images/c.webp", meta)
+    # only encoder version is known before downloading
+    assert manifest.may_match("images/b.webp", {"encoder_version": "1"})
+
+
+def test_s3_manifest_listed_again(tmp_path):
+    s3_storage = SimpleNamespace(
+        bucket_name="bucket",
+        client=SimpleNamespace(get_paginator=lambda _: FakePaginator()),
+    )
+    manifest = S3Manifest(tmp_path / "s3_manifest.sqlite", prefix="images/")
+    manifest.create()
+    manifest.start(s3_storage)
+    manifest._thread.join()
+    assert not manifest.may_match("images/c.webp", {})
+
+    # previous listing is outdated, c might have been uploaded since
+    manifest = S3Manifest(tmp_path / "s3_manifest.sqlite", prefix="images/")
+    manifest.create()
+    assert not manifest.is_listed()
+    assert manifest.may_match("images/c.webp", {})
@@ -0,0 +1,38 @@
+from ifixit2zim.image_buffer import ImageBuffer
+from ifixit2zim.s3_clients import S3Clients
+from ifixit2zim.s3_manifest import S3Manifest
+from ifixit2zim.s3_uploader import S3Uploader
+
+S3_URL = "https://s3.example.com/?keyId=key&secretAccessKey=secret&bucketName=bucket"
+
+
+class FakeStorage:
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, key, meta):
+        if key.endswith("fail.webp"):
+            raise OSError("S3 unavailable")
+        self.objects[key] = (fileobj.read(), meta)
+
+
+def test_s3_uploader(tmp_path, monkeypatch):
+    storage = FakeStorage()
+    s3_clients = S3Clients(S3_URL)
+    monkeypatch.setattr(s3_clients, "get", lambda: storage)
+    s3_manifest = S3Manifest(tmp_path / "s3_manifest.sqlite", prefix="images/")
+    s3_manifest.create()
+    uploader = S3Uploader(s3_clients, s3_manifest, nb_workers=2, spool_size=2)
+    uploader.start()
+    meta = {"ident": "1", "encoder_version": "1"}
+    for name in ("a", "b", "c", "fail"):
+        with ImageBuffer.wrap(name.encode()) as content:
+            uploader.upload(f"images/{name}.webp", content, meta)
+    uploader.shutdown()
+
+    assert storage.objects == {
+        f"images/{name}.webp": (name.encode(), meta) for name in ("a", "b", "c")
+    }
+    assert uploader.nb_failed == 1
+    assert s3_manifest.may_match("images/a.webp", meta)
+    assert not s3_manifest.may_match("images/a.webp", {"ident": "2"})
@@ -0,0 +1,27 @@
+from ifixit2zim.sampling import Sampler
+
+
+def test_sampler_fraction():
+    sampler = Sampler(fraction=0.1, seed=0, max_depth=1)
+    for kind in ("guide", "category"):
+        sampled = [
+            key for key in map(str, range(10000)) if sampler.is_sampled(kind, key, 0)
+        ]
+        assert 900 < len(sampled) < 1100
+
+
+def test_sampler_seed():
+    keys = list(map(str, range(1000)))
+
+    def sample(seed):
+        sampler = Sampler(fraction=0.1, seed=seed, max_depth=1)
+        return {key for key in keys if sampler.is_sampled("guide", key, 0)}
+
+    assert sample(1) == sample(1)
+    assert sample(1) != sample(2)
+
+
+def test_sampler_depth():
+    sampler = Sampler(fraction=0.01, seed=0, max_depth=1)
+    assert sampler.is_sampled("user", "1", 1)
+    assert not sampler.is_sampled("user", "1", 2)
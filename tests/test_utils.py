@@ -0,0 +1,79 @@
+import urllib.parse
+from types import SimpleNamespace
+
+import requests
+
+from ifixit2zim import utils as utils_module
+from ifixit2zim.utils import (
+    Utils,
+    get_conditional_headers,
+    get_image_variant,
+    get_version_ident,
+    is_transient_error,
+)
+
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def test_is_transient_error():
+    assert is_transient_error(_http_error(503))
+    assert is_transient_error(_http_error(429))
+    assert not is_transient_error(_http_error(404))
+    assert is_transient_error(requests.exceptions.ReadTimeout())
+    assert is_transient_error(requests.exceptions.ConnectionError())
+    assert not is_transient_error(KeyError("steps"))
+
+
+def test_get_image_variant():
+    base = "https://guide-images.cdn.ifixit.com/igi/mUdKTWtrMGMEcQhS"
+    thumbnail = get_image_variant(f"{base}.thumbnail")
+    standard = get_image_variant(f"{base}.standard")
+    large = get_image_variant(f"{base}.large")
+    assert thumbnail[0] == standard[0] == large[0] == base
+    assert thumbnail[1] < standard[1] < large[1]
+    url = "https://example.com/igi/mUdKTWtrMGMEcQhS.thumbnail"
+    assert get_image_variant(url) == (None, None)
+
+
+def test_conditional_headers():
+    last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert get_version_ident({"ETag": '"abc"', "Last-Modified": last_modified}) == (
+        '"abc"'
+    )
+    assert get_version_ident({"Content-Length": "12"}) == "12"
+    assert get_version_ident({}) == "-1"
+    assert get_conditional_headers('"abc"') == {"If-None-Match": '"abc"'}
+    assert get_conditional_headers('W/"abc"') == {"If-None-Match": 'W/"abc"'}
+    assert get_conditional_headers(last_modified) == {
+        "If-Modified-Since": last_modified
+    }
+    assert get_conditional_headers("12") == {}
+    assert get_conditional_headers("-1") == {}
+
+
+def test_get_api_content_retries_timeout(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda _: None)
+    calls = []
+
+    def get(url, timeout):  # noqa: ARG001
+        calls.append(url)
+        if len(calls) == 1:
+            raise requests.exceptions.ReadTimeout()
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"guideid": 1}'
+        return response
+
+    monkeypatch.setattr(utils_module.requests, "get", get)
+    utils = Utils(
+        SimpleNamespace(
+            main_url=urllib.parse.urlparse("https://www.ifixit.com"),
+            request_timeout=1,
+        )
+    )
+    assert utils.get_api_content("/guides/1") == {"guideid": 1}
+    assert len(calls) == 2
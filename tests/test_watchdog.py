@@ -0,0 +1,66 @@
+import threading
+import time
+
+from ifixit2zim import watchdog as watchdog_module
+from ifixit2zim.watchdog import Watchdog
+
+
+def test_watchdog(monkeypatch):
+    monkeypatch.setattr(watchdog_module, "WATCHDOG_INTERVAL", 0.05)
+    timed_out = []
+
+    def on_timeout(item, stack):
+        timed_out.append((item.item_key, stack))
+
+    watchdog = Watchdog(0.2, on_timeout=on_timeout)
+    watchdog.start()
+    release = threading.Event()
+    results = {}
+
+    def stuck_in_render():
+        item = watchdog.watch(None, "1", {}, stage=None)
+        release.wait(5)
+        results["stuck"] = watchdog.unwatch(item)
+
+    thread = threading.Thread(target=stuck_in_render)
+    thread.start()
+    fast = watchdog.watch(None, "2", {}, stage=None)
+    results["fast"] = watchdog.unwatch(fast)
+
+    deadline = time.monotonic() + 5
+    while not timed_out and time.monotonic() < deadline:
+        time.sleep(0.05)
+    release.set()
+    thread.join()
+    watchdog.stop()
+
+    assert results == {"fast": True, "stuck": False}
+    assert watchdog.nb_timed_out == 1
+    item_key, stack = timed_out[0]
+    assert item_key == "1"
+    assert "stuck_in_render" in stack
+
+
+def test_watchdog_paused(monkeypatch):
+    monkeypatch.setattr(watchdog_module, "WATCHDOG_INTERVAL", 0.05)
+    timed_out = []
+    watchdog = Watchdog(0.2, on_timeout=lambda item, _: timed_out.append(item))
+    watchdog.start()
+
+    # blocked on a full queue for longer than deadline
+    item = watchdog.watch(None, "1", {}, stage=None)
+    item.pause()
+    time.sleep(0.5)
+    item.resume()
+    assert watchdog.unwatch(item)
+
+    # time spent before pausing still counts
+    item = watchdog.watch(None, "2", {}, stage=None)
+    time.sleep(0.15)
+    item.pause()
+    time.sleep(0.3)
+    item.resume()
+    time.sleep(0.3)
+    watchdog.stop()
+
+    assert [item.item_key for item in timed_out] == ["2"]
@@ -0,0 +1,255 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# imported first, other modules of the scraper import each other through it
+import ifixit2zim.scraper  # noqa: F401
+from ifixit2zim.content_store import ContentStore
+from ifixit2zim.exceptions import FinalScrapingFailureError
+from ifixit2zim.item_costs import ItemCosts
+from ifixit2zim.pipeline import Pipeline
+from ifixit2zim.scheduler import WorkQueueScheduler
+from ifixit2zim.scraper_generic import ScraperGeneric
+from ifixit2zim.work_queue import WorkQueue
+
+
+def _create(tmp_path, nb_shards=2):
+    work_queue = WorkQueue(tmp_path / "work_queue.sqlite", nb_shards=nb_shards)
+    work_queue.create()
+    return work_queue
+
+
+def test_work_queue_duplicates(tmp_path):
+    work_queue = _create(tmp_path)
+    assert work_queue.add("guide", "1", {"a": 1}, is_expected=True, depth=0)
+    assert not work_queue.add("guide", "1", {"a": 2}, is_expected=False, depth=1)
+    assert work_queue.add("user", "1", {}, is_expected=False, depth=1)
+    assert work_queue.get_progress() == (0, 2)
+
+
+def test_work_queue_claim(tmp_path):
+    work_queue = _create(tmp_path)
+    keys = [str(index) for index in range(10)]
+    for key in keys:
+        work_queue.add("guide", key, {}, is_expected=False, depth=1)
+    work_queue.add("guide", "expected", {}, is_expected=True, depth=0)
+
+    item = work_queue.claim(shard=1)
+    assert item["key"] == "expected"
+
+    claimed = []
+    while item := work_queue.claim(shard=0):
+        claimed.append(item["key"])
+    assert sorted(claimed) == keys
+    # own shard first
+    nb_own = sum(work_queue.get_shard("guide", key) == 0 for key in keys)
+    assert {work_queue.get_shard("guide", key) for key in claimed[:nb_own]} == {0}
+
+
+def test_work_queue_drained(tmp_path):
+    work_queue = _create(tmp_path)
+    work_queue.add("guide", "1", {}, is_expected=True, depth=0)
+    work_queue.set_listings_done()
+    assert not work_queue.is_drained()
+    item = work_queue.claim(shard=0)
+    assert not work_queue.is_drained()
+    work_queue.complete(item["kind"], item["key"], "ok")
+    assert work_queue.is_drained()
+    assert list(work_queue.get_items("guide")) == [("1", {}, True, 0, "ok")]
+
+
+def test_work_queue_are_done(tmp_path):
+    work_queue = _create(tmp_path)
+    work_queue.add("category", "1", {}, is_expected=True, depth=0)
+    work_queue.add("guide", "1", {}, is_expected=True, depth=0)
+    assert not work_queue.are_done(("category",))
+    work_queue.set_listings_done()
+    item = work_queue.claim(shard=work_queue.get_shard("category", "1"))
+    assert not work_queue.are_done(("category",))
+    work_queue.complete(item["kind"], item["key"], "ok")
+    assert work_queue.are_done(("category",))
+    assert not work_queue.are_done(("category", "guide"))
+
+
+def test_work_queue_images(tmp_path):
+    work_queue = _create(tmp_path)
+    assert work_queue.claim_image("images/a.webp")
+    assert not work_queue.claim_image("images/a.webp")
+    assert work_queue.get_nb_images() == 1
+
+
+class FakeCreator:
+    def __init__(self):
+        self.entries = {}
+
+    def add_item_for(self, path, fpath, **kwargs):  # noqa: ARG002
+        self.entries[path] = fpath.read_bytes()
+
+    def add_redirect(self, path, target_path):
+        self.entries[path] = target_path
+
+
+def test_content_store_feed(tmp_path):
+    store = ContentStore(tmp_path / "content")
+    store.create()
+    store.add_item_for(path="a.html", content="<html/>", mimetype="text/html")
+    store.add_item_for(path="images/a.webp", content=b"img", mimetype="image/webp")
+    creator = FakeCreator()
+    store.feed(creator)
+    store.add_item_for(path="images/b.webp", content=b"img", mimetype="image/webp")
+    store.add_redirect(path="b.html", target_path="a.html")
+    store.feed(creator)
+
+    assert creator.entries == {
+        "a.html": b"<html/>",
+        "images/a.webp": b"img",
+        "images/b.webp": "images/a.webp",
+        "b.html": "a.html",
+    }
+    assert store.nb_fed == 4
+
+
+def test_content_store_feed_failures(tmp_path):
+    store = ContentStore(tmp_path / "content")
+    store.create()
+    store.add_item_for(path="a.html", content="<html/>", mimetype="text/html")
+    store.add_redirect(path="b.html", target_path="a.html")
+    creator = FakeCreator()
+    creator.add_redirect = None  # not callable, redirect fails
+    store.feed(creator)
+    assert creator.entries == {"a.html": b"<html/>"}
+    assert store.nb_failed == 1
+    with pytest.raises(FinalScrapingFailureError):
+        store.raise_if_failed()
+
+
+def test_content_store_deletes_fpath(tmp_path):
+    store = ContentStore(tmp_path / "content")
+    store.create()
+    fpath = tmp_path / "page.html"
+    fpath.write_text("<html/>")
+    store.add_item_for(path="a.html", fpath=fpath, delete_fpath=True)
+    assert not fpath.exists()
+    creator = FakeCreator()
+    store.feed(creator)
+    assert creator.entries == {"a.html": b"<html/>"}
+
+
+def test_content_store_metadata(tmp_path):
+    store = ContentStore(tmp_path / "content")
+    store.create()
+    assert store.load_metadata() is None
+    store.save_metadata({"title": "iFixit"})
+    assert ContentStore(tmp_path / "content").load_metadata() == {"title": "iFixit"}
+    store.clear()
+    assert not (tmp_path / "content").exists()
+
+
+def test_content_store_clear_refuses_other_directory(tmp_path):
+    (tmp_path / "notes.txt").write_text("not a store")
+    with pytest.raises(ValueError):
+        ContentStore(tmp_path).clear()
+    assert (tmp_path / "notes.txt").exists()
+
+
+class FakeScraper(ScraperGeneric):
+    def setup(self):
+        pass
+
+    def get_items_name(self):
+        return "guide"
+
+    def build_expected_items(self):
+        pass
+
+    def get_one_item_content(self, item_key, item_data):  # noqa: ARG002
+        return None if item_key == "missing" else f"content of {item_key}"
+
+    def add_item_redirect(self, item_key, item_data, redirect_kind):
+        pass
+
+    def process_one_item(self, item_key, item_data, item_content):  # noqa: ARG002
+        self.pipeline.add_item_for(
+            path=f"guide/{item_key}", content=item_content, mimetype="text/html"
+        )
+
+
+def test_work_queue_scheduler(tmp_path):
+    configuration = SimpleNamespace(
+        pipeline_queue_size=2,
+        fetch_workers=1,
+        render_workers=1,
+        item_timeout=None,
+        item_retries=0,
+        priority_weights=None,
+        scrape_only_first_items=False,
+        sample_fraction=None,
+        max_missing_items_percent=0,
+        max_error_items_percent=0,
+    )
+    work_queue = _create(tmp_path)
+    store = ContentStore(tmp_path / "content")
+    store.create()
+    pipeline = Pipeline(
+        lock=threading.Lock(),
+        creator=store,
+        configuration=configuration,
+        work_queue=work_queue,
+    )
+    context = SimpleNamespace(
+        configuration=configuration,
+        pipeline=pipeline,
+        item_costs=ItemCosts(),
+        journal=None,
+        work_queue=work_queue,
+    )
+    scraper = FakeScraper(context)
+    # queued by main process, this worker knows none of them
+    work_queue.add("guide", "1", {}, is_expected=True, depth=0)
+    work_queue.add("guide", "missing", {}, is_expected=True, depth=0)
+    work_queue.set_listings_done()
+
+    pipeline.start([scraper])
+    WorkQueueScheduler([scraper], pipeline, work_queue, 0, configuration).run()
+    pipeline.shutdown()
+    pipeline.raise_if_failed()
+
+    assert work_queue.is_drained()
+    assert {key: status for key, *_, status in work_queue.get_items("guide")} == {
+        "1": "ok",
+        "missing": "missing",
+    }
+    creator = FakeCreator()
+    store.feed(creator)
+    assert creator.entries == {"guide/1": b"content of 1"}
+
+
+def test_held_items_released_once_ready():
+    context = SimpleNamespace(
+        configuration=SimpleNamespace(
+            priority_weights=None, fetch_workers=1, render_workers=1
+        )
+    )
+    ready = set()
+
+    class HeldScraper(FakeScraper):
+        held_until_done = ("category",)
+
+        def is_item_ready(self, item_key, item_data):  # noqa: ARG002
+            return item_key in ready
+
+    scraper = HeldScraper(context)
+    for key in ("1", "2", "3"):
+        scraper.hold_item({"key": key, "data": {}, "depth": 0})
+    ready.add("2")
+    scraper.set_held_item_ready("2")
+    assert [item["key"] for item in scraper.pop_held_items()] == ["2"]
+    assert scraper.pop_held_items() == []
+    ready.add("4")
+    scraper.hold_item({"key": "4", "data": {}, "depth": 0})
+    assert [item["key"] for item in scraper.pop_held_items()] == ["4"]
+    assert sorted(item["key"] for item in scraper.pop_held_items(ready_only=False)) == [
+        "1",
+        "3",
+    ]